@@ -9,6 +9,8 @@ import org.springframework.scheduling.annotation.Scheduled;
 import org.springframework.stereotype.Component;
 import reactor.core.publisher.Flux;
 
+import java.util.concurrent.atomic.AtomicLong;
+
 @Component
 public class CrmPoller {
     private static final Logger log = LoggerFactory.getLogger(CrmPoller.class);
@@ -24,10 +26,14 @@ public class CrmPoller {
     // Poll every 15s by default
     @Scheduled(fixedDelayString = "${app.crmPollDelayMs:15000}")
     public void pollAndPublish() {
-        log.info("Polling CRM /customers ...");
+        log.info("Polling CRM /customers after cursor={} ...", crmClient.getCursor());
+        AtomicLong published = new AtomicLong();
         Flux<Customer> stream = crmClient.fetchCustomers();
-        stream.doOnNext(c -> publisher.send(c.getId(), c))
-              .doOnComplete(() -> log.info("CRM poll complete"))
+        stream.doOnNext(c -> {
+                  publisher.send(c.getId(), c);
+                  published.incrementAndGet();
+              })
+              .doOnComplete(() -> log.info("CRM poll complete published={} cursor={}", published.get(), crmClient.getCursor()))
               .doOnError(err -> log.error("CRM poll failed", err))
               .subscribe();
     }
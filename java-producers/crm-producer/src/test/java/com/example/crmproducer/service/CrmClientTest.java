@@ -3,6 +3,7 @@ package com.example.crmproducer.service;
 import com.example.crmproducer.model.Customer;
 import okhttp3.mockwebserver.MockResponse;
 import okhttp3.mockwebserver.MockWebServer;
+import okhttp3.mockwebserver.RecordedRequest;
 import org.junit.jupiter.api.AfterAll;
 import org.junit.jupiter.api.BeforeAll;
 import org.junit.jupiter.api.Test;
@@ -11,6 +12,9 @@ import reactor.test.StepVerifier;
 
 import java.io.IOException;
 
+import static org.junit.jupiter.api.Assertions.assertEquals;
+import static org.junit.jupiter.api.Assertions.assertNull;
+
 public class CrmClientTest {
     static MockWebServer server;
 
@@ -43,4 +47,48 @@ public class CrmClientTest {
             .expectNextMatches(c -> c instanceof Customer && ((Customer)c).getId().equals("c2"))
             .verifyComplete();
     }
+
+    @Test
+    void fetchCustomers_followsCursorAndSkipsUnchanged() throws Exception {
+        try (MockWebServer api = new MockWebServer()) {
+            api.enqueue(json("[{\"id\":\"c1\",\"email\":\"1@example.com\",\"name\":\"User 1\",\"status\":\"active\"}]").addHeader("X-Next-Cursor", "1").addHeader("ETag", "W/\"1-a\""));
+            api.enqueue(json("[{\"id\":\"c2\",\"email\":\"2@example.com\",\"name\":\"User 2\",\"status\":\"active\"}]").addHeader("X-Next-Cursor", "2").addHeader("X-Has-More", "true").addHeader("ETag", "W/\"3-b\""));
+            api.enqueue(json("[{\"id\":\"c3\",\"email\":\"3@example.com\",\"name\":\"User 3\",\"status\":\"active\"}]").addHeader("X-Next-Cursor", "3").addHeader("X-Has-More", "false").addHeader("ETag", "W/\"3-c\""));
+            api.enqueue(json("[]").addHeader("X-Next-Cursor", "3").addHeader("X-Has-More", "false").addHeader("ETag", "W/\"3-d\""));
+            api.enqueue(new MockResponse().setResponseCode(304).addHeader("ETag", "W/\"3-d\""));
+            api.start();
+            CrmClient client = new CrmClient(WebClient.builder().baseUrl(api.url("/").toString()).build(), 100);
+
+            // First poll has no cursor yet: full list
+            StepVerifier.create(client.fetchCustomers()).expectNextCount(1).verifyComplete();
+            assertEquals("/customers", api.takeRequest().getPath());
+            assertEquals(1, client.getCursor());
+
+            // Then only changes after the cursor, following pages while X-Has-More
+            StepVerifier.create(client.fetchCustomers())
+                .expectNextMatches(x -> x.getId().equals("c2"))
+                .expectNextMatches(x -> x.getId().equals("c3"))
+                .verifyComplete();
+            assertEquals("/customers?after=1&limit=100", api.takeRequest().getPath());
+            assertEquals("/customers?after=2&limit=100", api.takeRequest().getPath());
+            assertEquals(3, client.getCursor());
+
+            // First poll at the new cursor: the last page's ETag belongs to another query, so none is sent
+            StepVerifier.create(client.fetchCustomers()).verifyComplete();
+            RecordedRequest first = api.takeRequest();
+            assertEquals("/customers?after=3&limit=100", first.getPath());
+            assertNull(first.getHeader("If-None-Match"));
+
+            // Nothing changed since: 304 for the same query, no records, cursor unchanged
+            StepVerifier.create(client.fetchCustomers()).verifyComplete();
+            RecordedRequest unchanged = api.takeRequest();
+            assertEquals("/customers?after=3&limit=100", unchanged.getPath());
+            assertEquals("W/\"3-d\"", unchanged.getHeader("If-None-Match"));
+            assertEquals(3, client.getCursor());
+        }
+    }
+
+    private static MockResponse json(String body) {
+        return new MockResponse().setResponseCode(200).setBody(body).addHeader("Content-Type", "application/json");
+    }
 }
@@ -9,6 +9,8 @@ import org.springframework.scheduling.annotation.Scheduled;
 import org.springframework.stereotype.Component;
 import reactor.core.publisher.Flux;
 
+import java.util.concurrent.atomic.AtomicLong;
+
 @Component
 public class InventoryPoller {
     private static final Logger log = LoggerFactory.getLogger(InventoryPoller.class);
@@ -24,10 +26,14 @@ public class InventoryPoller {
     // Poll every 15s by default
     @Scheduled(fixedDelayString = "${app.inventoryPollDelayMs:15000}")
     public void pollAndPublish() {
-        log.info("Polling Inventory /products ...");
+        log.info("Polling Inventory /products after cursor={} ...", inventoryClient.getCursor());
+        AtomicLong published = new AtomicLong();
         Flux<Product> stream = inventoryClient.fetchProducts();
-        stream.doOnNext(p -> publisher.send(p.getProduct_id(), p))
-              .doOnComplete(() -> log.info("Inventory poll complete"))
+        stream.doOnNext(p -> {
+                  publisher.send(p.getProduct_id(), p);
+                  published.incrementAndGet();
+              })
+              .doOnComplete(() -> log.info("Inventory poll complete published={} cursor={}", published.get(), inventoryClient.getCursor()))
               .doOnError(err -> log.error("Inventory poll failed", err))
               .subscribe();
     }
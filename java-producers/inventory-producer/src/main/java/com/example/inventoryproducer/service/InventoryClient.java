@@ -1,42 +1,98 @@
 package com.example.inventoryproducer.service;
 
 import com.example.inventoryproducer.model.Product;
+import org.springframework.beans.factory.annotation.Autowired;
+import org.springframework.beans.factory.annotation.Value;
+import org.springframework.core.ParameterizedTypeReference;
+import org.springframework.http.HttpHeaders;
 import org.springframework.stereotype.Service;
 import org.springframework.web.reactive.function.client.WebClient;
 import reactor.core.publisher.Flux;
+import reactor.core.publisher.Mono;
 import reactor.util.retry.Retry;
 
 import java.time.Duration;
+import java.util.List;
+import java.util.concurrent.atomic.AtomicLong;
 import java.util.concurrent.atomic.AtomicReference;
 import org.springframework.http.HttpStatus;
 
+/**
+ * Fetches only products changed since the last poll.
+ *
+ * The API's X-Next-Cursor header is kept as a high-water mark and sent back as
+ * {@code after=}; pages are followed while X-Has-More is true. The cursor only
+ * advances once every record of a page has been handed downstream, so a failed
+ * poll re-fetches that page next time. A repeated query with nothing new is
+ * answered 304 via If-None-Match and yields no records. Validators are only sent
+ * back with the query they were issued for: the server's ETag covers the query
+ * string, so one from another page would never match.
+ */
 @Service
 public class InventoryClient {
+    private static final ParameterizedTypeReference<List<Product>> PRODUCT_LIST = new ParameterizedTypeReference<>() {};
+
     private final WebClient webClient;
-    private final AtomicReference<String> etag = new AtomicReference<>(null);
-    private final AtomicReference<String> lastModified = new AtomicReference<>(null);
+    private final int pageSize;
+    private final AtomicLong cursor = new AtomicLong(-1);  // -1: no cursor yet, fetch the full list
+    private final AtomicReference<Validators> validators = new AtomicReference<>(null);
 
     public InventoryClient(WebClient inventoryWebClient) {
+        this(inventoryWebClient, 500);
+    }
+
+    @Autowired
+    public InventoryClient(WebClient inventoryWebClient, @Value("${app.inventoryPageSize:500}") int pageSize) {
         this.webClient = inventoryWebClient;
+        this.pageSize = pageSize;
+    }
+
+    public long getCursor() {
+        return cursor.get();
     }
 
     public Flux<Product> fetchProducts() {
+        return fetchPage(cursor.get()).flatMapMany(this::emit);
+    }
+
+    private Flux<Product> emit(Page page) {
+        Flux<Product> items = Flux.fromIterable(page.items());
+        if (page.nextCursor() >= 0) {
+            items = items.concatWith(Mono.fromRunnable(() -> cursor.set(page.nextCursor())));
+        }
+        if (!page.hasMore()) {
+            return items;
+        }
+        return items.concatWith(Flux.defer(() -> fetchPage(page.nextCursor()).flatMapMany(this::emit)));
+    }
+
+    private Mono<Page> fetchPage(long after) {
         return webClient.get()
-                .uri("/products")
+                .uri(b -> after < 0
+                        ? b.path("/products").build()
+                        : b.path("/products").queryParam("after", after).queryParam("limit", pageSize).build())
                 .headers(h -> {
-                    String et = etag.get();
-                    String lm = lastModified.get();
-                    if (et != null) h.setIfNoneMatch(et);
-                    if (lm != null) h.set("If-Modified-Since", lm);
+                    Validators v = validators.get();
+                    if (v == null || v.after() != after) return;
+                    if (v.etag() != null) h.setIfNoneMatch(v.etag());
+                    if (v.lastModified() != null) h.set("If-Modified-Since", v.lastModified());
                 })
-                .exchangeToFlux(resp -> {
+                .exchangeToMono(resp -> {
                     if (resp.statusCode() == HttpStatus.NOT_MODIFIED) {
-                        return Flux.empty();
+                        return Mono.<Page>empty();
                     }
-                    resp.headers().asHttpHeaders().getOrEmpty("ETag").stream().findFirst().ifPresent(etag::set);
-                    resp.headers().asHttpHeaders().getOrEmpty("Last-Modified").stream().findFirst().ifPresent(lastModified::set);
-                    return resp.bodyToFlux(Product.class);
+                    HttpHeaders headers = resp.headers().asHttpHeaders();
+                    validators.set(new Validators(after, headers.getFirst("ETag"), headers.getFirst("Last-Modified")));
+                    long next = headers.getOrEmpty("X-Next-Cursor").stream().findFirst().map(Long::parseLong).orElse(-1L);
+                    boolean hasMore = after >= 0 && "true".equals(headers.getFirst("X-Has-More"));
+                    return resp.bodyToMono(PRODUCT_LIST)
+                            .defaultIfEmpty(List.of())
+                            .map(items -> new Page(items, next, hasMore));
                 })
                 .retryWhen(Retry.backoff(3, Duration.ofMillis(500)).maxBackoff(Duration.ofSeconds(5)));
     }
+
+    private record Validators(long after, String etag, String lastModified) {}
+
+    private record Page(List<Product> items, long nextCursor, boolean hasMore) {}
 }
@@ -3,6 +3,7 @@ package com.example.inventoryproducer.service;
 import com.example.inventoryproducer.model.Product;
 import okhttp3.mockwebserver.MockResponse;
 import okhttp3.mockwebserver.MockWebServer;
+import okhttp3.mockwebserver.RecordedRequest;
 import org.junit.jupiter.api.AfterAll;
 import org.junit.jupiter.api.BeforeAll;
 import org.junit.jupiter.api.Test;
@@ -11,6 +12,9 @@ import reactor.test.StepVerifier;
 
 import java.io.IOException;
 
+import static org.junit.jupiter.api.Assertions.assertEquals;
+import static org.junit.jupiter.api.Assertions.assertNull;
+
 public class InventoryClientTest {
     static MockWebServer server;
 
@@ -43,4 +47,48 @@ public class InventoryClientTest {
             .expectNextMatches(p -> p instanceof Product && ((Product)p).getProduct_id().equals("p2"))
             .verifyComplete();
     }
+
+    @Test
+    void fetchProducts_followsCursorAndSkipsUnchanged() throws Exception {
+        try (MockWebServer api = new MockWebServer()) {
+            api.enqueue(json("[{\"product_id\":\"p1\",\"sku\":\"SKU-001\",\"qty\":1}]").addHeader("X-Next-Cursor", "1").addHeader("ETag", "W/\"1-a\""));
+            api.enqueue(json("[{\"product_id\":\"p2\",\"sku\":\"SKU-002\",\"qty\":2}]").addHeader("X-Next-Cursor", "2").addHeader("X-Has-More", "true").addHeader("ETag", "W/\"3-b\""));
+            api.enqueue(json("[{\"product_id\":\"p3\",\"sku\":\"SKU-003\",\"qty\":3}]").addHeader("X-Next-Cursor", "3").addHeader("X-Has-More", "false").addHeader("ETag", "W/\"3-c\""));
+            api.enqueue(json("[]").addHeader("X-Next-Cursor", "3").addHeader("X-Has-More", "false").addHeader("ETag", "W/\"3-d\""));
+            api.enqueue(new MockResponse().setResponseCode(304).addHeader("ETag", "W/\"3-d\""));
+            api.start();
+            InventoryClient client = new InventoryClient(WebClient.builder().baseUrl(api.url("/").toString()).build(), 100);
+
+            // First poll has no cursor yet: full list
+            StepVerifier.create(client.fetchProducts()).expectNextCount(1).verifyComplete();
+            assertEquals("/products", api.takeRequest().getPath());
+            assertEquals(1, client.getCursor());
+
+            // Then only changes after the cursor, following pages while X-Has-More
+            StepVerifier.create(client.fetchProducts())
+                .expectNextMatches(x -> x.getProduct_id().equals("p2"))
+                .expectNextMatches(x -> x.getProduct_id().equals("p3"))
+                .verifyComplete();
+            assertEquals("/products?after=1&limit=100", api.takeRequest().getPath());
+            assertEquals("/products?after=2&limit=100", api.takeRequest().getPath());
+            assertEquals(3, client.getCursor());
+
+            // First poll at the new cursor: the last page's ETag belongs to another query, so none is sent
+            StepVerifier.create(client.fetchProducts()).verifyComplete();
+            RecordedRequest first = api.takeRequest();
+            assertEquals("/products?after=3&limit=100", first.getPath());
+            assertNull(first.getHeader("If-None-Match"));
+
+            // Nothing changed since: 304 for the same query, no records, cursor unchanged
+            StepVerifier.create(client.fetchProducts()).verifyComplete();
+            RecordedRequest unchanged = api.takeRequest();
+            assertEquals("/products?after=3&limit=100", unchanged.getPath());
+            assertEquals("W/\"3-d\"", unchanged.getHeader("If-None-Match"));
+            assertEquals(3, client.getCursor());
+        }
+    }
+
+    private static MockResponse json(String body) {
+        return new MockResponse().setResponseCode(200).setBody(body).addHeader("Content-Type", "application/json");
+    }
 }
@@ -1,13 +1,25 @@
-from fastapi import FastAPI, Body, Response
+from fastapi import FastAPI, Body, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
-from typing import List, Optional, Any
+from typing import List, Optional
 from datetime import datetime
 from lxml import etree
 from pathlib import Path
+import gzip
+import hashlib
 import json
+import os
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, Counter
 
+from .ingest import InvalidBody, count_csv_rows
+from .store import RecordStore, parse_timestamp
+
 ANALYTICS_COUNTER = Counter("analytics_records_total", "Total analytics records received")
+ANALYTICS_BY_TYPE = Counter("analytics_records_by_type_total", "Analytics CSV rows received per `type` column value", ["type"])
+
+# Per-type counts for CSV uploads; label values are capped, later unseen types count as "other"
+COUNT_BY_TYPE = os.getenv("ANALYTICS_COUNT_BY_TYPE", "true").lower() in ("1", "true", "yes")
+MAX_TYPE_LABELS = int(os.getenv("ANALYTICS_MAX_TYPE_LABELS", "20"))
+_seen_types: set = set()
 
 app = FastAPI(title="Mock APIs", version="1.0.0")
 
@@ -15,17 +27,42 @@ app = FastAPI(title="Mock APIs", version="1.0.0")
 DATA_DIR = Path(__file__).resolve().parent / "data"
 CUSTOMERS_FILE = DATA_DIR / "customers.json"
 PRODUCTS_FILE = DATA_DIR / "products.json"
+# The JSON files are read-only seeds; writes are appended to these logs and replayed on start
+CUSTOMERS_LOG = DATA_DIR / "customers.jsonl"
+PRODUCTS_LOG = DATA_DIR / "products.jsonl"
+MAX_PAGE_SIZE = 10000
+
+customers_store = RecordStore("id", CUSTOMERS_FILE, CUSTOMERS_LOG)
+products_store = RecordStore("product_id", PRODUCTS_FILE, PRODUCTS_LOG)
 
-def _load_json(path: Path):
-    if not path.exists():
-        return []
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+def _etag(store: RecordStore, request: Request) -> str:
+    """Validator for one response: the store's write cursor plus the query that produced it."""
+    query = hashlib.blake2b(str(request.url.query).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{store.cursor}-{query}"'
 
-def _save_json(path: Path, data):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _read_page(store: RecordStore, request: Request, response: Response, after: Optional[int], updated_since: Optional[str], limit: Optional[int]):
+    """Whole collection without paging params; otherwise one page of changes plus cursor headers.
+
+    Answers 304 when If-None-Match carries the ETag of the same query and nothing was written since.
+    """
+    etag = _etag(store, request)
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "X-Next-Cursor": str(after if after is not None else store.cursor)})
+    response.headers["ETag"] = etag
+    if after is None and updated_since is None and limit is None:
+        response.headers["X-Next-Cursor"] = str(store.cursor)
+        return store.all()
+    if after is not None and after > store.cursor:
+        after = 0  # cursor from before the change log was reset: start over
+    since = None
+    if updated_since is not None:
+        since = parse_timestamp(updated_since)
+        if since is None:
+            raise HTTPException(status_code=422, detail="updated_since must be an ISO-8601 timestamp")
+    records, cursor, has_more = store.changes(after=after or 0, updated_since=since, limit=limit)
+    response.headers["X-Next-Cursor"] = str(cursor)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    return records
 
 class Customer(BaseModel):
     id: str
@@ -41,21 +78,42 @@ class Product(BaseModel):
     updated_at: Optional[str] = None
 
 @app.get("/customers", response_model=List[Customer], summary="GET /customers")
-async def get_customers():
-    return _load_json(CUSTOMERS_FILE)
+async def get_customers(
+    request: Request,
+    response: Response,
+    after: Optional[int] = Query(None, ge=0, description="Cursor from a previous X-Next-Cursor header"),
+    updated_since: Optional[str] = Query(None, description="Only records changed after this ISO-8601 timestamp"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
+    return _read_page(customers_store, request, response, after, updated_since, limit)
 
 @app.post("/customers", response_model=Customer, summary="POST /customers")
 async def add_customer(customer: Customer):
-    customers = _load_json(CUSTOMERS_FILE)
-    c = customer.model_dump()
-    c["updated_at"] = c.get("updated_at") or datetime.utcnow().isoformat() + "Z"
-    customers.append(c)
-    _save_json(CUSTOMERS_FILE, customers)
-    return c
+    return customers_store.put(customer.model_dump())
+
+@app.post("/customers/bulk", summary="POST /customers/bulk")
+async def add_customers_bulk(customers: List[Customer]):
+    customers_store.put_many([c.model_dump() for c in customers])
+    return {"status": "ok", "inserted": len(customers), "cursor": customers_store.cursor}
 
 @app.get("/products", response_model=List[Product], summary="GET /products")
-async def get_products():
-    return _load_json(PRODUCTS_FILE)
+async def get_products(
+    request: Request,
+    response: Response,
+    after: Optional[int] = Query(None, ge=0, description="Cursor from a previous X-Next-Cursor header"),
+    updated_since: Optional[str] = Query(None, description="Only records changed after this ISO-8601 timestamp"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
+    return _read_page(products_store, request, response, after, updated_since, limit)
+
+@app.post("/products", response_model=Product, summary="POST /products")
+async def add_product(product: Product):
+    return products_store.put(product.model_dump())
+
+@app.post("/products/bulk", summary="POST /products/bulk")
+async def add_products_bulk(products: List[Product]):
+    products_store.put_many([p.model_dump() for p in products])
+    return {"status": "ok", "inserted": len(products), "cursor": products_store.cursor}
 
 # SOAP-like endpoint stub for AddCustomer
 @app.post("/soap/AddCustomer", summary="SOAP AddCustomer stub", response_class=Response)
@@ -69,10 +127,8 @@ async def soap_add_customer(payload: str = Body(..., media_type="text/xml")):
         name_el = root.find('.//name', namespaces=nsmap) or root.find('.//Name', namespaces=nsmap)
         email = email_el.text if email_el is not None else "unknown@example.com"
         name = name_el.text if name_el is not None else "Unknown"
-        customers = _load_json(CUSTOMERS_FILE)
-        new_id = f"c{len(customers)+1}"
-        customers.append({"id": new_id, "email": email, "name": name, "status": "active", "updated_at": datetime.utcnow().isoformat() + "Z"})
-        _save_json(CUSTOMERS_FILE, customers)
+        new_id = f"c{len(customers_store)+1}"
+        customers_store.put({"id": new_id, "email": email, "name": name, "status": "active", "updated_at": datetime.utcnow().isoformat() + "Z"})
         response_xml = f"""
 <soap:Envelope xmlns:soap='http://schemas.xmlsoap.org/soap/envelope/'>
   <soap:Body>
@@ -104,25 +160,53 @@ async def metrics():
     data = generate_latest()
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
-@app.post("/analytics/data")
-async def analytics_data(payload: Any = Body(...)):
-    # Accept either a dict or list of dicts
-    count = 1
-    if isinstance(payload, list):
-        count = len(payload)
+@app.post(
+    "/analytics/data",
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+    }}},
+)
+async def analytics_data(request: Request):
+    # Accept a dict, a list of dicts, or NDJSON (one dict per line); optionally gzip-encoded
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except OSError:
+            return Response(content="invalid gzip body", status_code=400)
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            lines = [ln for ln in body.splitlines() if ln.strip()]
+            for ln in lines:
+                json.loads(ln)
+            count = len(lines)
+        else:
+            payload = json.loads(body)
+            count = len(payload) if isinstance(payload, list) else 1
+    except ValueError:
+        return Response(content="invalid JSON body", status_code=422)
     ANALYTICS_COUNTER.inc(count)
     return {"status": "ok", "received": count}
 
 # CSV upload endpoint for analytics
-@app.post("/analytics/upload", summary="Upload analytics data as CSV", response_model=dict)
-async def analytics_upload(csv_body: str = Body(..., media_type="text/csv")):
-    # Count non-empty data rows (assume header present if first line contains non-numeric ids)
-    lines = [ln for ln in csv_body.splitlines() if ln.strip()]
-    count = 0
-    if lines:
-        # naive header detection: if any of the first line cells contain letters, treat as header
-        header = lines[0]
-        data_lines = lines[1:] if any(ch.isalpha() for ch in header) else lines
-        count = len(data_lines)
-    ANALYTICS_COUNTER.inc(count)
-    return {"status": "ok", "received": count}
+@app.post(
+    "/analytics/upload",
+    summary="Upload analytics data as CSV (optionally Content-Encoding: gzip)",
+    response_model=dict,
+    openapi_extra={"requestBody": {"required": True, "content": {"text/csv": {"schema": {"type": "string"}}}}},
+)
+async def analytics_upload(request: Request):
+    # Parsed as it streams in: the body is never held whole, and quoted newlines stay inside their field
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    try:
+        parsed = await count_csv_rows(request.stream(), gzipped=gzipped, count_types=COUNT_BY_TYPE)
+    except InvalidBody as e:
+        return Response(content=str(e), status_code=e.status_code)
+    ANALYTICS_COUNTER.inc(parsed.rows)
+    for record_type, n in parsed.types.items():
+        if record_type not in _seen_types and len(_seen_types) >= MAX_TYPE_LABELS:
+            record_type = "other"
+        _seen_types.add(record_type)
+        ANALYTICS_BY_TYPE.labels(type=record_type or "unknown").inc(n)
+    return {"status": "ok", "received": parsed.rows}
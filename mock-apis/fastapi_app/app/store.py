@@ -0,0 +1,118 @@
+import bisect
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """Epoch seconds for an ISO-8601 timestamp (`Z` or offset; naive means UTC), else None."""
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RecordStore:
+    """In-memory records indexed by key, persisted to an append-only JSONL log.
+
+    The seed file (the original pretty-printed JSON array) is read once at startup and
+    never rewritten; every insert/update is appended to `log_path` as one line, and
+    the log is replayed on the next start. A later record with the same key replaces
+    the earlier one.
+
+    Every write gets a monotonically increasing sequence number. Reads in sequence order
+    are served from an append-only change index (`_seqs`/`_stamps`/`_keys`), so
+    `after=<cursor>` and `updated_since=<timestamp>` pages cost O(log N + page) rather
+    than a scan of the whole collection.
+    """
+
+    def __init__(self, key_field: str, seed_path: Optional[Path] = None, log_path: Optional[Path] = None):
+        self.key_field = key_field
+        self.log_path = log_path
+        self._records: dict = {}
+        self._current_seq: dict = {}  # key -> seq of its latest version
+        self._seqs: List[int] = []
+        self._stamps: List[float] = []  # change time per entry, clamped to be non-decreasing
+        self._keys: List[str] = []
+        self._seq = 0
+        if seed_path is not None and seed_path.exists():
+            with seed_path.open("r", encoding="utf-8") as f:
+                self._apply(json.load(f))
+        if log_path is not None and log_path.exists():
+            with log_path.open("r", encoding="utf-8") as f:
+                self._apply(json.loads(line) for line in f if line.strip())
+        self._log = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _apply(self, records: Iterable[dict]) -> None:
+        for rec in records:
+            key = rec[self.key_field]
+            self._seq += 1
+            last = self._stamps[-1] if self._stamps else 0.0
+            stamp = max(parse_timestamp(rec.get("updated_at") or "") or last, last)
+            self._records[key] = rec
+            self._current_seq[key] = self._seq
+            self._seqs.append(self._seq)
+            self._stamps.append(stamp)
+            self._keys.append(key)
+
+    def put_many(self, records: List[dict]) -> List[dict]:
+        """Insert or replace records (stamping `updated_at` when missing) with one log write."""
+        now = datetime.utcnow().isoformat() + "Z"
+        for rec in records:
+            rec["updated_at"] = rec.get("updated_at") or now
+        self._apply(records)
+        if self.log_path is not None:
+            if self._log is None:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                self._log = self.log_path.open("a", encoding="utf-8")
+            self._log.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            self._log.flush()
+        return records
+
+    def put(self, record: dict) -> dict:
+        return self.put_many([record])[0]
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._records.get(key)
+
+    def all(self) -> List[dict]:
+        return list(self._records.values())
+
+    @property
+    def cursor(self) -> int:
+        """Sequence number of the latest write."""
+        return self._seq
+
+    def changes(self, after: int = 0, updated_since: Optional[float] = None, limit: Optional[int] = None) -> Tuple[List[dict], int, bool]:
+        """Latest versions of records changed after cursor `after` and/or after `updated_since`.
+
+        Returns (records, next_cursor, has_more). Pass `next_cursor` back as `after` to
+        continue; it stays put when nothing new was found.
+        """
+        start = bisect.bisect_right(self._seqs, after)
+        if updated_since is not None:
+            start = max(start, bisect.bisect_right(self._stamps, updated_since))
+        out: List[dict] = []
+        cursor = after
+        i = start
+        while i < len(self._seqs):
+            if limit is not None and len(out) >= limit:
+                break
+            seq, key = self._seqs[i], self._keys[i]
+            if self._current_seq[key] == seq:  # skip versions superseded later in the log
+                out.append(self._records[key])
+            cursor = seq
+            i += 1
+        return out, cursor, i < len(self._seqs)
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
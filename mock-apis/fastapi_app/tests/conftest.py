@@ -0,0 +1,25 @@
+# Make the `app` package importable when running tests from anywhere
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+# tests/ -> fastapi_app/
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app import main  # noqa: E402
+from app.store import RecordStore  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """TestClient over fresh stores seeded from the bundled data, logging writes under tmp_path."""
+    monkeypatch.setattr(main, "customers_store", RecordStore("id", main.CUSTOMERS_FILE, tmp_path / "customers.jsonl"))
+    monkeypatch.setattr(main, "products_store", RecordStore("product_id", main.PRODUCTS_FILE, tmp_path / "products.jsonl"))
+    with TestClient(main.app) as c:
+        yield c
+    main.customers_store.close()
+    main.products_store.close()
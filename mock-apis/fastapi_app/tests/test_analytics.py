@@ -0,0 +1,54 @@
+import gzip
+import json
+
+
+def test_json_object_list_and_ndjson_bodies_are_counted(client):
+    assert client.post("/analytics/data", json={"id": 1}).json() == {"status": "ok", "received": 1}
+    assert client.post("/analytics/data", json=[{"id": 1}, {"id": 2}]).json()["received"] == 2
+
+    ndjson = b'{"id": 1}\n\n{"id": 2}\n{"id": 3}\n'
+    resp = client.post("/analytics/data", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    assert resp.json()["received"] == 3
+
+
+def test_invalid_json_and_ndjson_bodies_are_rejected(client):
+    assert client.post("/analytics/data", content=b"{nope", headers={"Content-Type": "application/json"}).status_code == 422
+    resp = client.post("/analytics/data", content=b'{"id": 1}\nnope\n', headers={"Content-Type": "application/x-ndjson"})
+    assert resp.status_code == 422
+
+
+def test_gzip_request_bodies_are_decompressed(client):
+    body = gzip.compress(json.dumps([{"id": 1}, {"id": 2}]).encode())
+    resp = client.post("/analytics/data", content=body, headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert resp.json()["received"] == 2
+
+    # concatenated members, as written by a streaming compressor
+    csv_body = gzip.compress(b"type,id\ncustomer,1\n") + gzip.compress(b"customer,2\n")
+    resp = client.post("/analytics/upload", content=csv_body, headers={"Content-Type": "text/csv", "Content-Encoding": "gzip"})
+    assert resp.json()["received"] == 2
+
+    bad = client.post("/analytics/upload", content=b"not gzip", headers={"Content-Type": "text/csv", "Content-Encoding": "gzip"})
+    assert bad.status_code == 400
+    truncated = gzip.compress(b"type,id\ncustomer,1\n")[:-6]
+    assert client.post("/analytics/upload", content=truncated, headers={"Content-Encoding": "gzip"}).status_code == 400
+
+
+def test_csv_quoted_newlines_stay_in_their_row(client):
+    body = 'type,id,note\ncustomer,1,"two\nlines"\ninventory,2,"say ""hi""\n\nthere"\ncustomer,3,plain\n'
+    resp = client.post("/analytics/upload", content=body.encode(), headers={"Content-Type": "text/csv"})
+    assert resp.json() == {"status": "ok", "received": 3}
+
+    unterminated = client.post("/analytics/upload", content=b'type,id\ncustomer,"1\n', headers={"Content-Type": "text/csv"})
+    assert unterminated.status_code == 422
+
+
+def test_csv_rows_are_counted_per_type(client):
+    from prometheus_client import REGISTRY
+
+    def by_type(record_type):
+        return REGISTRY.get_sample_value("analytics_records_by_type_total", {"type": record_type}) or 0.0
+
+    before = by_type("inventory")
+    body = b"type,id\ninventory,1\ninventory,2\ncustomer,3\n"
+    assert client.post("/analytics/upload", content=body, headers={"Content-Type": "text/csv"}).json()["received"] == 3
+    assert by_type("inventory") - before == 2
@@ -0,0 +1,57 @@
+def customer(i, updated_at=None):
+    return {"id": f"c{i}", "email": f"c{i}@example.com", "name": f"Customer {i}", "updated_at": updated_at}
+
+
+def test_cursor_pages_pick_up_inserts_made_between_reads(client):
+    first = client.get("/customers", params={"after": 0, "limit": 1})
+    assert [c["id"] for c in first.json()] == ["c1"]
+    assert first.headers["X-Has-More"] == "true"
+
+    client.post("/customers/bulk", json=[customer(3), customer(4)])
+    client.post("/customers", json={**customer(1), "status": "inactive"})  # moves c1 to the end
+
+    cursor, ids = first.headers["X-Next-Cursor"], []
+    while True:
+        page = client.get("/customers", params={"after": cursor, "limit": 2})
+        ids += [c["id"] for c in page.json()]
+        cursor = page.headers["X-Next-Cursor"]
+        if page.headers["X-Has-More"] == "false":
+            break
+    assert ids == ["c2", "c3", "c4", "c1"]
+
+    caught_up = client.get("/customers", params={"after": cursor, "limit": 2})
+    assert caught_up.json() == [] and caught_up.headers["X-Next-Cursor"] == cursor
+
+
+def test_updated_since_returns_only_later_changes(client):
+    resp = client.get("/products", params={"updated_since": "2025-01-02T00:00:00Z"})
+    assert [p["product_id"] for p in resp.json()] == ["p2"]
+    assert client.get("/products", params={"updated_since": "yesterday"}).status_code == 422
+
+
+def test_matching_if_none_match_gets_304_until_a_write(client):
+    params = {"after": 0, "limit": 10}
+    first = client.get("/products", params=params)
+    etag = first.headers["ETag"]
+
+    unchanged = client.get("/products", params=params, headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    # the validator is per query
+    assert client.get("/products", params={"after": 1, "limit": 10}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/products", json={"product_id": "p3", "sku": "SKU-003", "qty": 7})
+    changed = client.get("/products", params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert [p["product_id"] for p in changed.json()] == ["p1", "p2", "p3"]
+
+
+def test_writes_are_logged_and_replayed_on_start(client, tmp_path):
+    from app.main import CUSTOMERS_FILE
+    from app.store import RecordStore
+
+    client.post("/customers", json=customer(3))
+    replayed = RecordStore("id", CUSTOMERS_FILE, tmp_path / "customers.jsonl")
+    assert replayed.get("c3")["email"] == "c3@example.com"
+    assert len(replayed) == 3
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .encoders import EncodedBatch
+from .resilience import DeadLettered, when_acked
+
+log = logging.getLogger("analytics_consumer")
+
+EVENT_DELIVERY_LATENCY = Histogram(
+    "analytics_event_delivery_latency_seconds",
+    "Time from Kafka record timestamp to successful batch delivery",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+BATCH_TARGET_SIZE = Gauge("analytics_batch_target_size", "Current adaptive batch size target (rows)")
+BATCH_FLUSHES = Counter("analytics_batch_flush_total", "Batch flushes by trigger", ["reason"])
+
+SendFn = Callable[[EncodedBatch], Awaitable[None]]
+FlushedFn = Callable[[list], None]
+
+
+class BatchFlusher:
+    """Owns the pending batch and flushes it on size, bytes or deadline.
+
+    The deadline is set when the first event enters an empty batch, and a background
+    task flushes when it passes, so a quiet topic never holds a partial batch longer
+    than `interval` seconds. Flushes are serialized by a lock; `add()` never awaits
+    between appending and checking limits, so appends from the consume loop cannot
+    interleave with the swap to a fresh encoder.
+
+    Each event may carry an opaque `position` (its Kafka topic/partition/offset);
+    `on_flushed` receives the positions of a batch once it has been delivered, or once
+    Kafka acknowledged its DLQ envelope (send raised DeadLettered), which is when the
+    offsets may be committed. Positions of a batch that was neither stay pending.
+
+    With `adaptive=True` the row target doubles (up to `max_size`) after a flush
+    triggered by size and halves (down to `min_size`) after a deadline flush, so
+    batches grow under load and shrink, trading throughput for latency, when idle.
+    """
+
+    def __init__(
+        self,
+        encoder,
+        send: SendFn,
+        max_size: int,
+        max_bytes: int,
+        interval: float,
+        min_size: Optional[int] = None,
+        adaptive: bool = False,
+        on_flushed: Optional[FlushedFn] = None,
+    ):
+        self._encoder = encoder  # CsvBatchEncoder / JsonBatchEncoder
+        self._send = send
+        self.max_size = max(1, max_size)
+        self.min_size = max(1, min(min_size or self.max_size, self.max_size))
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.adaptive = adaptive
+        self.target_size = self.min_size if adaptive else self.max_size
+        self._on_flushed = on_flushed
+        self._timestamps: list[float] = []
+        self._positions: list = []
+        self._deadline: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._has_data = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        BATCH_TARGET_SIZE.set(self.target_size)
+
+    def __len__(self) -> int:
+        return len(self._encoder)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self._deadline
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def add(self, ev: dict, event_ts: Optional[float] = None, position: Any = None, positions: Sequence = ()) -> None:
+        """Append a merged event (with its epoch timestamp) and flush if a limit is hit.
+
+        A window summary row passes the `positions` of every event it covers instead.
+        """
+        self._encoder.add(ev)
+        self._timestamps.append(event_ts if event_ts is not None else time.time())
+        if position is not None:
+            self._positions.append(position)
+        self._positions.extend(positions)
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.interval
+            self._has_data.set()
+        if self._full():
+            await self.flush("size")
+
+    def _full(self) -> bool:
+        return len(self._encoder) >= self.target_size or self._encoder.nbytes >= self.max_bytes
+
+    async def flush(self, reason: str = "force") -> None:
+        async with self._lock:
+            if reason == "deadline" and (self._deadline is None or self._deadline > time.monotonic()):
+                return  # a size flush got here first and a newer batch has its own deadline
+            if reason == "size" and not self._full():
+                return  # another flush took these rows while we waited for the lock
+            if len(self._encoder) == 0:
+                self._deadline = None
+                self._has_data.clear()
+                return
+            batch = self._encoder.take()
+            timestamps, positions = self._timestamps, self._positions
+            self._timestamps, self._positions = [], []
+            self._deadline = None
+            self._has_data.clear()
+            BATCH_FLUSHES.labels(reason=reason).inc()
+            self._adapt(reason, batch.rows)
+            try:
+                await self._send(batch)
+            except DeadLettered as e:
+                # send() owns DLQ handling; the batch is not retried here
+                log.error(f"batch_flush_failed reason={reason} rows={batch.rows} dead_lettered=true error={e}")
+                when_acked(e.ack, lambda: self._release(positions))
+            except Exception as e:
+                # neither delivered nor dead-lettered: keep the offsets uncommitted
+                log.error(f"batch_flush_failed reason={reason} rows={batch.rows} dead_lettered=false offsets_held={len(positions)} error={e}")
+            else:
+                now = time.time()
+                for ts in timestamps:
+                    EVENT_DELIVERY_LATENCY.observe(max(0.0, now - ts))
+                self._release(positions)
+
+    def _release(self, positions: list) -> None:
+        if self._on_flushed is not None and positions:
+            self._on_flushed(positions)
+
+    def _adapt(self, reason: str, rows: int) -> None:
+        if not self.adaptive:
+            return
+        if reason == "size":
+            self.target_size = min(self.max_size, self.target_size * 2)
+        elif reason == "deadline" and rows < self.target_size:
+            self.target_size = max(self.min_size, self.target_size // 2)
+        BATCH_TARGET_SIZE.set(self.target_size)
+
+    async def _run(self) -> None:
+        while True:
+            if self._deadline is None:
+                await self._has_data.wait()
+                continue
+            delay = self._deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # the batch may have been flushed (and restarted) meanwhile
+            await self.flush("deadline")
+
+    async def stop(self) -> None:
+        """Stop the timer and flush whatever is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush("shutdown")
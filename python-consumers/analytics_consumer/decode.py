@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+from typing import Callable, Mapping, NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast decoder
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:  # optional fast digest
+    xxhash = None
+
+from .records import MalformedPayload, PayloadSchema
+
+log = logging.getLogger("analytics_consumer")
+
+DigestFn = Callable[[bytes], str]
+DIGEST_ALGOS = ("sha256", "blake2b", "xxhash")
+
+
+class Decoded(NamedTuple):
+    key_str: str
+    key_bytes: bytes
+    digest: str
+    payload: Optional[dict]
+    error: Optional[MalformedPayload] = None  # set when the topic's schema rejected the value
+
+
+def make_digest(algo: str) -> DigestFn:
+    """Dedup digest function for DEDUP_DIGEST.
+
+    sha256 matches digests already stored in Redis; blake2b (128-bit) and xxhash
+    (xxh3-128, if installed) are cheaper. Switching algorithms makes each key's next
+    message look new once, since stored digests no longer match.
+    """
+    if algo == "sha256":
+        return lambda value: hashlib.sha256(value).hexdigest()
+    if algo == "xxhash":
+        if xxhash is not None:
+            return lambda value: xxhash.xxh3_128_hexdigest(value)
+        log.warning("dedup_digest_unavailable algo=xxhash reason=not_installed falling_back=blake2b")
+        algo = "blake2b"
+    if algo == "blake2b":
+        return lambda value: hashlib.blake2b(value, digest_size=16).hexdigest()
+    raise ValueError(f"unknown DEDUP_DIGEST={algo}; expected {', '.join(DIGEST_ALGOS)}")
+
+
+def loads_json(value: bytes):
+    """Parse JSON bytes, via orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value.decode("utf-8"))
+
+
+def decode_message(msg, digest: DigestFn, schemas: Optional[Mapping[str, PayloadSchema]] = None) -> Decoded:
+    key_bytes = msg.key if msg.key is not None else b""
+    key_str = key_bytes.decode("utf-8", errors="ignore") if isinstance(key_bytes, (bytes, bytearray)) else str(key_bytes)
+    value = msg.value or b""
+    schema = schemas.get(msg.topic) if schemas else None
+    if schema is not None:
+        try:
+            return Decoded(key_str, key_bytes, digest(value), schema.decode(value))
+        except MalformedPayload as e:
+            return Decoded(key_str, key_bytes, digest(value), None, e)
+    try:
+        payload = loads_json(value)
+    except Exception:
+        payload = None
+    if not isinstance(payload, dict):
+        payload = None
+    return Decoded(key_str, key_bytes, digest(value), payload)
+
+
+def decode_batch(msgs: list, digest: DigestFn, schemas: Optional[Mapping[str, PayloadSchema]] = None) -> list[Decoded]:
+    """Decode keys, parse values and compute dedup digests for a fetched batch.
+
+    Values of topics in `schemas` are validated and projected onto their typed
+    fields; others are parsed whole. Pure CPU work with no event loop access, so
+    large batches can run in a worker thread (hashlib releases the GIL on large buffers).
+    """
+    return [decode_message(msg, digest, schemas) for msg in msgs]
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Optional
+
+from prometheus_client import Gauge
+
+log = logging.getLogger("analytics_consumer")
+
+DELIVERY_IN_FLIGHT = Gauge("analytics_delivery_in_flight", "Analytics deliveries currently in flight")
+DELIVERY_QUEUE_DEPTH = Gauge("analytics_delivery_queue_depth", "Events waiting in the delivery queues")
+
+DeliverFn = Callable[[Any], Awaitable[None]]
+
+
+class DeliveryPool:
+    """Bounded concurrent delivery stage decoupled from the Kafka poll loop.
+
+    Items are routed to one of `workers` lanes by a stable hash of their key, so
+    events for the same key are delivered in order while different keys proceed
+    concurrently. Each lane queue holds at most `queue_size` items; `submit`
+    waits when the lane is full, which pushes back on the consume loop.
+    """
+
+    def __init__(self, deliver: DeliverFn, workers: int = 8, queue_size: int = 100):
+        self._deliver = deliver
+        self._workers = max(1, workers)
+        self._queue_size = max(1, queue_size)
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._queues = [asyncio.Queue(maxsize=self._queue_size) for _ in range(self._workers)]
+        self._tasks = [asyncio.create_task(self._run(q)) for q in self._queues]
+
+    def lane_for(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % self._workers
+
+    async def submit(self, key: str, item: Any) -> None:
+        """Queue `item` on the lane owning `key`; waits while that lane is full."""
+        await self._queues[self.lane_for(key)].put(item)
+        DELIVERY_QUEUE_DEPTH.inc()
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            DELIVERY_QUEUE_DEPTH.dec()
+            DELIVERY_IN_FLIGHT.inc()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                # deliver() owns DLQ handling; never let one failure kill the lane
+                log.error(f"delivery_worker_error error={e}")
+            finally:
+                DELIVERY_IN_FLIGHT.dec()
+                queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued item has been delivered."""
+        for q in self._queues:
+            await q.join()
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Drain outstanding items (up to `timeout` seconds) and stop the workers."""
+        try:
+            await asyncio.wait_for(self.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"delivery_drain_timeout pending={sum(q.qsize() for q in self._queues)}")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
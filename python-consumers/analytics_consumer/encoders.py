@@ -0,0 +1,235 @@
+import csv
+import json
+import zlib
+from typing import AsyncIterator, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
+
+CSV_HEADER = ["type", "customer_id", "product_id", "status", "sku", "qty", "total_products", "low_stock_count", "total_customers"]
+
+# Summary rows of the windowed aggregation stage (WINDOW_SECS)
+WINDOW_CSV_HEADER = [
+    "type", "window_start", "window_end", "customer_id", "sku", "events",
+    "status_from", "status_to", "status_changes", "net_qty_change", "low_stock_entered", "low_stock_left", "late",
+]
+
+# Body chunk size when streaming a batch to the sink
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def dumps_json(obj) -> bytes:
+    """Compact JSON bytes, via orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def csv_row(ev: dict) -> Optional[list]:
+    """Map a merged event to its CSV row, or None for unknown event types."""
+    if ev.get("type") == "customer_update":
+        cust = ev.get("customer", {})
+        inv = ev.get("inventory_summary", {})
+        return [
+            ev.get("type"),
+            cust.get("id"),
+            "",
+            cust.get("status"),
+            "",
+            "",
+            inv.get("total_products"),
+            inv.get("low_stock_count"),
+            "",
+        ]
+    if ev.get("type") == "inventory_update":
+        prod = ev.get("product", {})
+        custs = ev.get("customer_summary", {})
+        return [
+            ev.get("type"),
+            "",
+            prod.get("product_id"),
+            "",
+            prod.get("sku"),
+            prod.get("qty"),
+            "",
+            "",
+            custs.get("total_customers"),
+        ]
+    return None
+
+
+def window_csv_row(ev: dict) -> list:
+    """Map a window summary row to WINDOW_CSV_HEADER columns."""
+    return [ev.get(col, "") for col in WINDOW_CSV_HEADER]
+
+
+class EncodedBatch:
+    """An encoded batch body held as row chunks, with its row count and size.
+
+    JSON batches also keep `items`, the encoded events, so a failed batch can be
+    dead-lettered with every event intact.
+    """
+
+    def __init__(
+        self,
+        parts: list[bytes],
+        rows: int,
+        nbytes: int,
+        content_type: str = "text/csv",
+        items: Optional[list[bytes]] = None,
+    ):
+        self.parts = parts
+        self.rows = rows
+        self.nbytes = nbytes
+        self.content_type = content_type
+        self.items = items
+
+    @classmethod
+    def from_text(cls, text: str, content_type: str = "text/csv") -> "EncodedBatch":
+        """Wrap an already built CSV document (header plus one line per row)."""
+        body = text.encode("utf-8")
+        return cls([body], max(0, text.count("\n") - 1), len(body), content_type)
+
+    def body(self) -> bytes:
+        return b"".join(self.parts)
+
+    def text(self) -> str:
+        return self.body().decode("utf-8")
+
+    async def stream(self, gzip: bool = False) -> AsyncIterator[bytes]:
+        """Yield the body in ~STREAM_CHUNK_BYTES chunks, gzip-compressed on the fly if asked."""
+        z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        chunk = bytearray()
+        for part in self.parts:
+            chunk += part
+            if len(chunk) >= STREAM_CHUNK_BYTES:
+                out = z.compress(bytes(chunk)) if z else bytes(chunk)
+                chunk.clear()
+                if out:
+                    yield out
+        tail = bytes(chunk)
+        if z:
+            tail = z.compress(tail) + z.flush()
+        if tail:
+            yield tail
+
+
+class _RowSink:
+    """File-like target for csv.writer that keeps each encoded line and the running size."""
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+        self.nbytes = 0
+
+    def write(self, line: str) -> None:
+        b = line.encode("utf-8")
+        self.parts.append(b)
+        self.nbytes += len(b)
+
+
+class CsvBatchEncoder:
+    """Incremental CSV encoder: rows are encoded as events arrive.
+
+    `rows` and `nbytes` are tracked as rows are added, so flush decisions and
+    logging never rescan the payload, and `take()` hands over the encoded chunks
+    without rebuilding the document.
+    """
+
+    def __init__(self, header: Optional[list] = None, row: Callable[[dict], Optional[list]] = csv_row):
+        self._header = header or CSV_HEADER
+        self._row = row
+        self._reset()
+
+    def _reset(self) -> None:
+        self._sink = _RowSink()
+        self._writer = csv.writer(self._sink)
+        self._writer.writerow(self._header)
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def nbytes(self) -> int:
+        return self._sink.nbytes
+
+    def add(self, ev: dict) -> None:
+        row = self._row(ev)
+        if row is None:
+            return
+        self._writer.writerow(row)
+        self.rows += 1
+
+    def take(self) -> EncodedBatch:
+        """Return the encoded batch and start a new one."""
+        batch = EncodedBatch(self._sink.parts, self.rows, self._sink.nbytes)
+        self._reset()
+        return batch
+
+
+def build_csv_from_events(events: list[dict]) -> str:
+    """Build CSV payload from merged events."""
+    encoder = CsvBatchEncoder()
+    for ev in events:
+        encoder.add(ev)
+    return encoder.take().text()
+
+
+class JsonBatchEncoder:
+    """Incremental JSON batch encoder: each event is serialized once, on arrival.
+
+    Produces a JSON array (`application/json`) or, with `ndjson=True`, one event per
+    line (`application/x-ndjson`). Exposes the same rows/nbytes/take() interface as
+    CsvBatchEncoder so both share the flush policy.
+    """
+
+    def __init__(self, ndjson: bool = False):
+        self.ndjson = ndjson
+        self._reset()
+
+    def _reset(self) -> None:
+        self._items: list[bytes] = []
+        self._nbytes = 2  # approximate until take(): brackets plus one separator per item
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def add(self, ev: dict) -> None:
+        b = dumps_json(ev)
+        self._items.append(b)
+        self._nbytes += len(b) + 1  # separator
+        self.rows += 1
+
+    def take(self) -> EncodedBatch:
+        """Return the encoded batch and start a new one."""
+        items = self._items
+        if self.ndjson:
+            parts = [b + b"\n" for b in items]
+            content_type = "application/x-ndjson"
+        else:
+            parts = [b"[", b",".join(items), b"]"]
+            content_type = "application/json"
+        batch = EncodedBatch(parts, self.rows, sum(len(p) for p in parts), content_type, items=items)
+        self._reset()
+        return batch
+
+
+BATCH_MODES = ("csv", "json_batch", "ndjson")
+
+
+def make_batch_encoder(mode: str, windowed: bool = False):
+    """Encoder for a batching ANALYTICS_MODE; `windowed` batches carry window summary rows."""
+    if mode == "csv":
+        return CsvBatchEncoder(WINDOW_CSV_HEADER, window_csv_row) if windowed else CsvBatchEncoder()
+    if mode == "json_batch":
+        return JsonBatchEncoder()
+    if mode == "ndjson":
+        return JsonBatchEncoder(ndjson=True)
+    raise ValueError(f"not a batching mode: {mode}")
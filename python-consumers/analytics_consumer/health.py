@@ -0,0 +1,98 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from prometheus_client import Gauge
+
+log = logging.getLogger("analytics_consumer")
+
+COMPONENTS = ("kafka", "redis", "sink")
+
+# livemin: with several workers a component only counts as ready when it is ready in every live worker
+READY = Gauge("consumer_ready", "1 when the consumer is connected to the component", ["component"], multiprocess_mode="livemin")
+
+# component -> (ready, detail)
+ReadinessReport = dict[str, tuple[bool, str]]
+
+
+class Readiness:
+    """Connection state of the consumer's dependencies, mirrored into `consumer_ready`.
+
+    consume() marks Kafka ready once the consumer and producer have started, Redis
+    on a successful ping and on every dedup round trip, and the sink on a probe
+    request, after every successful post and when the circuit breaker opens.
+    """
+
+    def __init__(self):
+        self._state: ReadinessReport = {component: (False, "starting") for component in COMPONENTS}
+        for component in COMPONENTS:
+            READY.labels(component=component).set(0)
+
+    def set(self, component: str, ready: bool, detail: str = "") -> None:
+        if self._state.get(component, (False,))[0] != ready:
+            log.info(f"readiness component={component} ready={ready} detail={detail}")
+        self._state[component] = (ready, detail)
+        READY.labels(component=component).set(1 if ready else 0)
+
+    def report(self) -> ReadinessReport:
+        return dict(self._state)
+
+    @property
+    def ready(self) -> bool:
+        return all(ok for ok, _ in self._state.values())
+
+
+def report_from_registry(registry) -> ReadinessReport:
+    """Readiness aggregated across workers, read back from a multiprocess registry."""
+    report: ReadinessReport = {component: (False, "no live worker reported") for component in COMPONENTS}
+    for metric in registry.collect():
+        if metric.name != "consumer_ready":
+            continue
+        for sample in metric.samples:
+            component = sample.labels.get("component")
+            if component in report:
+                report[component] = (sample.value >= 1, "all workers" if sample.value >= 1 else "not ready in every worker")
+    return report
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    server: "HealthServer"
+
+    def do_GET(self) -> None:
+        if self.path == "/live":
+            self._reply(200, {"status": "ok"})
+        elif self.path == "/ready":
+            report = self.server.report()
+            ready = all(ok for ok, _ in report.values())
+            body = {"ready": ready, "components": {c: {"ready": ok, "detail": detail} for c, (ok, detail) in report.items()}}
+            self._reply(200 if ready else 503, body)
+        else:
+            self.send_error(404)
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class HealthServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: tuple[str, int], report: Callable[[], ReadinessReport]):
+        super().__init__(addr, _HealthHandler)
+        self.report = report
+
+
+def start_health_server(port: int, report: Callable[[], ReadinessReport], addr: str = "0.0.0.0") -> HealthServer:
+    """Serve GET /live (always 200) and GET /ready (200 once every component is ready, else 503)."""
+    server = HealthServer((addr, port), report)
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    return server
@@ -0,0 +1,291 @@
+import logging
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict, deque
+from typing import Iterable, Optional, Sequence
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger("analytics_consumer")
+
+# Atomic claim at check time. The key holds the confirmed digest, or a claim
+# "<digest>@<position>" for a record whose offset is not committed yet. A matching
+# digest or another position's claim on it is a duplicate; the same position's own
+# claim is a redelivery of that record and is processed again. Returns 1 for duplicate.
+CLAIM_LUA = """
+local cur = redis.call('GET', KEYS[1])
+if cur == ARGV[1] then
+  return 1
+end
+local claim = ARGV[1] .. '@' .. ARGV[2]
+if cur and cur ~= claim and string.sub(cur, 1, #ARGV[1] + 1) == ARGV[1] .. '@' then
+  return 1
+end
+redis.call('SET', KEYS[1], claim, 'EX', ARGV[3])
+return 0
+"""
+
+# Confirm a claim once its offset is committed, unless a later record of the key has claimed it since
+CONFIRM_LUA = """
+local cur = redis.call('GET', KEYS[1])
+if cur and cur ~= ARGV[1] .. '@' .. ARGV[2] then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+LOCAL_DEDUP_HITS = Counter("consumer_dedup_local_hits_total", "Duplicates answered by the local digest cache")
+LOCAL_DEDUP_MISSES = Counter("consumer_dedup_local_misses_total", "Local digest cache misses forwarded to the backing store")
+LOCAL_DEDUP_EVICTIONS = Counter("consumer_dedup_local_evictions_total", "Local digest cache evictions", ["reason"])
+LOCAL_DEDUP_ENTRIES = Gauge("consumer_dedup_local_entries", "Entries held in the local digest cache")
+LOCAL_DEDUP_BYTES = Gauge("consumer_dedup_local_bytes", "Approximate memory held by the local digest cache")
+LOCAL_DEDUP_FALLBACK = Counter("consumer_dedup_local_fallback_total", "Batches deduplicated locally because the backing store failed")
+
+# (topic, key, digest, position): position ("<partition>:<offset>") names the record claiming the digest
+DedupItem = tuple[str, str, str, str]
+
+
+class IdempotencyStore(ABC):
+    """Pluggable dedup store working on whole fetch batches.
+
+    `seen_batch` returns one flag per item, True when the item's digest matches the
+    last digest recorded for its (topic, key), or is claimed by a record at another
+    position. New digests are claimed for their position; `record_batch` confirms
+    them once the offsets of their events are committed. A record redelivered after
+    a crash or rebalance carries its own position and so is not mistaken for a
+    duplicate. Items are evaluated in order, so repeated keys within one batch
+    behave exactly as if they had been checked one message at a time.
+    """
+
+    async def start(self) -> None:
+        return None
+
+    @abstractmethod
+    async def seen_batch(self, items: Sequence[DedupItem]) -> list[bool]:
+        ...
+
+    @abstractmethod
+    async def record_batch(self, items: Sequence[DedupItem]) -> None:
+        ...
+
+    async def close(self) -> None:
+        return None
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Redis-backed store: one pipelined EVALSHA round trip per checked or recorded batch.
+
+    Claims and confirmed digests share the key and its TTL, so a claim left by a
+    consumer that died before committing expires like any other entry.
+    """
+
+    def __init__(self, client, ttl_seconds: int, key_prefix: str = "processed"):
+        self._r = client
+        self._ttl = ttl_seconds
+        self._prefix = key_prefix
+        self._claim_sha: Optional[str] = None
+        self._confirm_sha: Optional[str] = None
+
+    def redis_key(self, topic: str, key: str) -> str:
+        return f"{self._prefix}:{topic}:{key}"
+
+    async def start(self) -> None:
+        await self._load()
+
+    async def _load(self) -> None:
+        self._claim_sha = await self._r.script_load(CLAIM_LUA)
+        self._confirm_sha = await self._r.script_load(CONFIRM_LUA)
+
+    async def seen_batch(self, items: Sequence[DedupItem]) -> list[bool]:
+        if not items:
+            return []
+        return [bool(int(v)) for v in await self._run("_claim_sha", items)]
+
+    async def record_batch(self, items: Sequence[DedupItem]) -> None:
+        if items:
+            await self._run("_confirm_sha", items)
+
+    async def _run(self, script: str, items: Sequence[DedupItem]) -> list:
+        from redis.exceptions import NoScriptError
+
+        if getattr(self, script) is None:
+            await self._load()
+        try:
+            return await self._pipeline(getattr(self, script), items)
+        except NoScriptError:
+            # Script cache was flushed (e.g. Redis restart); reload once and retry
+            log.warning("idempotency_script_reload reason=noscript")
+            await self._load()
+            return await self._pipeline(getattr(self, script), items)
+
+    async def _pipeline(self, sha: str, items: Sequence[DedupItem]) -> list:
+        pipe = self._r.pipeline(transaction=False)
+        for topic, key, digest, position in items:
+            pipe.evalsha(sha, 1, self.redis_key(topic, key), digest, position, self._ttl)
+        return await pipe.execute()
+
+    async def close(self) -> None:
+        await self._r.aclose()
+
+
+class LocalDigestCache:
+    """Size-, memory- and TTL-bounded LRU of (topic, key) -> last accepted digest.
+
+    Memory is estimated per entry (key/digest lengths plus a fixed overhead for the
+    tuple, dict slot and strings), which is close enough to enforce a cap.
+    """
+
+    ENTRY_OVERHEAD_BYTES = 240
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600.0):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._data: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self._bytes
+
+    def _entry_size(self, cache_key: tuple[str, str], digest: str) -> int:
+        return len(cache_key[0]) + len(cache_key[1]) + len(digest) + self.ENTRY_OVERHEAD_BYTES
+
+    def get(self, topic: str, key: str) -> Optional[str]:
+        cache_key = (topic, key)
+        entry = self._data.get(cache_key)
+        if entry is None:
+            return None
+        digest, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(cache_key, digest)
+            LOCAL_DEDUP_EVICTIONS.labels(reason="ttl").inc()
+            return None
+        self._data.move_to_end(cache_key)
+        return digest
+
+    def put(self, topic: str, key: str, digest: str) -> None:
+        cache_key = (topic, key)
+        old = self._data.pop(cache_key, None)
+        if old is not None:
+            self._bytes -= self._entry_size(cache_key, old[0])
+        self._data[cache_key] = (digest, time.monotonic() + self._ttl)
+        self._bytes += self._entry_size(cache_key, digest)
+        while self._data and (len(self._data) > self._max_entries or self._bytes > self._max_bytes):
+            old_key, (old_digest, _) = self._data.popitem(last=False)
+            self._bytes -= self._entry_size(old_key, old_digest)
+            LOCAL_DEDUP_EVICTIONS.labels(reason="capacity").inc()
+        self._publish()
+
+    def clear(self) -> None:
+        """Forget every digest, e.g. when partitions are revoked and their keys may change elsewhere."""
+        self._data.clear()
+        self._bytes = 0
+        self._publish()
+
+    def _remove(self, cache_key: tuple[str, str], digest: str) -> None:
+        del self._data[cache_key]
+        self._bytes -= self._entry_size(cache_key, digest)
+        self._publish()
+
+    def _publish(self) -> None:
+        LOCAL_DEDUP_ENTRIES.set(len(self._data))
+        LOCAL_DEDUP_BYTES.set(self._bytes)
+
+
+class CachedIdempotencyStore(IdempotencyStore):
+    """Consults a LocalDigestCache before the backing store.
+
+    A local digest match is a duplicate without a network call; everything else is
+    forwarded to the backend in one batch. The cache only learns digests from
+    `record_batch`, i.e. once their offsets are committed, so a record whose offset
+    is still held (delivery and DLQ failed) is processed again when it is
+    redelivered; repeats before the commit are the backend's claims to catch. If the
+    backend fails, decisions are made from the cache and the batch itself (best-effort
+    dedup) instead of disabling idempotency.
+    """
+
+    def __init__(self, backend: IdempotencyStore, cache: LocalDigestCache):
+        self._backend = backend
+        self._cache = cache
+        self.backend_available = True  # outcome of the last backend round trip
+
+    async def start(self) -> None:
+        await self._backend.start()
+
+    async def seen_batch(self, items: Sequence[DedupItem]) -> list[bool]:
+        seen = [False] * len(items)
+        forward_idx: list[int] = []
+        # later items of the same batch compare against the digest before them
+        latest: dict[tuple[str, str], str] = {}
+        for i, (topic, key, digest, _) in enumerate(items):
+            cache_key = (topic, key)
+            prev = latest[cache_key] if cache_key in latest else self._cache.get(topic, key)
+            if prev == digest:
+                LOCAL_DEDUP_HITS.inc()
+                seen[i] = True
+                continue
+            LOCAL_DEDUP_MISSES.inc()
+            forward_idx.append(i)
+            latest[cache_key] = digest
+        if not forward_idx:
+            return seen
+        try:
+            remote = await self._backend.seen_batch([items[i] for i in forward_idx])
+        except Exception as e:
+            self.backend_available = False
+            LOCAL_DEDUP_FALLBACK.inc()
+            log.warning(f"idempotency_backend_unavailable fallback=local_cache items={len(forward_idx)} error={e}")
+            return seen
+        self.backend_available = True
+        for i, dup in zip(forward_idx, remote):
+            seen[i] = dup
+        return seen
+
+    async def record_batch(self, items: Sequence[DedupItem]) -> None:
+        for topic, key, digest, _ in items:
+            self._cache.put(topic, key, digest)
+        try:
+            await self._backend.record_batch(items)
+        except Exception as e:
+            self.backend_available = False
+            log.warning(f"idempotency_record_failed items={len(items)} error={e}")
+            return
+        self.backend_available = True
+
+    async def close(self) -> None:
+        await self._backend.close()
+
+
+class PendingDigests:
+    """Digests of fetched events, held per partition until their offsets are committed.
+
+    `committed()` hands back the digests below the committed offsets, ready for
+    `IdempotencyStore.record_batch`; `forget()` drops revoked partitions, whose
+    uncommitted events are redelivered to the new owner and must not look seen.
+    """
+
+    def __init__(self):
+        self._pending: dict[tuple[str, int], deque] = {}
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    def track(self, tp: tuple[str, int], offset: int, item: DedupItem) -> None:
+        self._pending.setdefault(tp, deque()).append((offset, item))
+
+    def committed(self, offsets: dict[tuple[str, int], int]) -> list[DedupItem]:
+        items: list[DedupItem] = []
+        for tp, next_offset in offsets.items():
+            pending = self._pending.get(tp)
+            while pending and pending[0][0] < next_offset:
+                items.append(pending.popleft()[1])
+        return items
+
+    def forget(self, tps: Iterable[tuple[str, int]]) -> None:
+        for tp in tps:
+            self._pending.pop(tp, None)
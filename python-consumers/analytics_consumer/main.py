@@ -1,33 +1,37 @@
 import asyncio
+import contextlib
+import functools
+import json
+import logging
 import os
 import signal
-from typing import Optional
-
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
-import redis.asyncio as redis
-import hashlib
-import json
 import time
-import logging
-import httpx
-from prometheus_client import Counter, Histogram, start_http_server
-from io import StringIO
-import csv
-
-KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:29092")
-CUSTOMER_TOPIC = os.getenv("CUSTOMER_TOPIC", "customer_data")
-INVENTORY_TOPIC = os.getenv("INVENTORY_TOPIC", "inventory_data")
-ANALYTICS_DLQ_TOPIC = os.getenv("ANALYTICS_DLQ_TOPIC", "analytics_dlq")
-ANALYTICS_URL = os.getenv("ANALYTICS_URL", "http://localhost:8000/analytics/data")
-ANALYTICS_MODE = os.getenv("ANALYTICS_MODE", "json").lower()  # json | csv
-BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "50"))
-FLUSH_INTERVAL_SECS = float(os.getenv("FLUSH_INTERVAL_SECS", "10"))
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-IDEMP_TTL_SECONDS = int(os.getenv("IDEMP_TTL_SECONDS", "86400"))  # 1 day default
-METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
-
-# Set up structured logging (simple key=val style)
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s level=%(levelname)s msg=%(message)s")
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .batching import BatchFlusher
+from .decode import decode_batch, make_digest
+from .delivery import DeliveryPool
+# build_csv_from_events stays importable from main for existing callers
+from .encoders import BATCH_MODES, EncodedBatch, build_csv_from_events, make_batch_encoder
+from .health import Readiness, start_health_server
+from .idempotency import CachedIdempotencyStore, LocalDigestCache, PendingDigests, RedisIdempotencyStore
+from .offsets import OffsetCommitter, OffsetTracker
+from .profiling import LoopLagMonitor, start_profile_server
+from .records import CUSTOMER_SCHEMA, PRODUCT_SCHEMA
+from .resilience import CircuitBreaker, DeadLettered, DlqPublisher, RetryPolicy, SinkHTTPError, call_with_retry, when_acked
+from .settings import Settings
+from .state import CustomerRecord, JoinState, ProductRecord, SqliteSpill
+from .windowing import WindowAggregator
+
+# aiokafka, redis and httpx are imported where they are first needed, so importing this
+# module (tests, the transformation helpers) does not pay for the client libraries
+if TYPE_CHECKING:
+    import httpx
+    from aiokafka import AIOKafkaProducer
+
 log = logging.getLogger("analytics_consumer")
 
 # Prometheus metrics
@@ -39,245 +43,646 @@ DLQ_COUNTER = Counter("analytics_dlq_total", "Messages published to analytics DL
 POST_LATENCY = Histogram("analytics_post_latency_seconds", "Latency of analytics POSTs in seconds")
 BATCH_ROWS = Counter("analytics_batch_rows_total", "Total rows included in analytics batches")
 BATCH_COUNT = Counter("analytics_batches_total", "Total analytics batches sent")
+BATCH_PROCESSING_SECONDS = Histogram("consumer_fetch_batch_seconds", "Time to decode, dedup, merge and stage one fetched batch")
+FETCH_BATCH_RECORDS = Histogram("consumer_fetch_batch_records", "Records per fetched batch", buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000))
+RECORDS_PER_SECOND = Gauge("consumer_records_per_second", "Processing rate of the last fetched batch")
+MALFORMED_COUNTER = Counter("consumer_malformed_total", "Messages rejected by payload validation and dead-lettered", ["topic", "reason"])
+REPLAY_COUNTER = Counter("consumer_replayed_messages_total", "Messages re-applied to join state after a snapshot restore", ["topic"])
+STAGE_SECONDS = Histogram(
+    "consumer_stage_seconds",
+    "Time spent in each consume() stage per fetched batch (dlq: per publish)",
+    ["stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+STAGE_DECODE = STAGE_SECONDS.labels(stage="decode")
+STAGE_DEDUP = STAGE_SECONDS.labels(stage="dedup")
+STAGE_MERGE = STAGE_SECONDS.labels(stage="merge")
+STAGE_HANDOFF = STAGE_SECONDS.labels(stage="handoff")  # batch encode and size flushes, or waiting for a delivery lane
+STAGE_SNAPSHOT = STAGE_SECONDS.labels(stage="snapshot")
+STAGE_DLQ = STAGE_SECONDS.labels(stage="dlq")
+PARTITION_LAG = Gauge("consumer_partition_lag", "Messages behind the partition high watermark after the last fetch", ["topic", "partition"])
 
-async def post_csv_batch(payload_csv: str, url: str, producer: AIOKafkaProducer, dlq_topic: str) -> None:
-    """Post CSV batch to analytics; on failure, publish to DLQ and raise."""
-    start = time.perf_counter()
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(url, content=payload_csv, headers={"Content-Type": "text/csv"})
-            POST_LATENCY.observe(time.perf_counter() - start)
-            if 200 <= resp.status_code < 300:
-                ANALYTICS_SUCCESS.inc()
-                BATCH_COUNT.inc()
-                rows = payload_csv.count("\n") - 1
-                log.info(f"analytics_post_ok mode=csv rows={rows} status={resp.status_code}")
-                return
+def build_http_client(transport: Optional["httpx.AsyncBaseTransport"] = None, settings: Optional[Settings] = None) -> "httpx.AsyncClient":
+    """Build the long-lived analytics delivery client.
+
+    The sink is a single host, so the pool limits below are effectively per-host.
+    HTTP/2 is only enabled when requested and the optional `h2` package is installed.
+    """
+    import httpx
+
+    cfg = settings or Settings()
+    http2 = cfg.http2_enabled
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            log.warning("http2_unavailable reason=h2_not_installed falling_back=http1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=cfg.http_max_connections,
+        max_keepalive_connections=cfg.http_max_keepalive,
+        keepalive_expiry=cfg.http_keepalive_expiry_secs,
+    )
+    return httpx.AsyncClient(timeout=cfg.http_timeout_secs, limits=limits, http2=http2, transport=transport)
+
+async def _dead_letter(
+    producer: "AIOKafkaProducer",
+    dlq_topic: str,
+    value: bytes,
+    key: Optional[bytes] = None,
+    dlq: Optional[DlqPublisher] = None,
+) -> asyncio.Future:
+    """Publish a DLQ envelope; returns its ack (already resolved when sent without `dlq`)."""
+    with STAGE_DLQ.time():
+        if dlq is not None:
+            ack = await dlq.publish(value, key=key)
+        else:
+            if key is not None:
+                await producer.send_and_wait(dlq_topic, value, key=key)
             else:
-                ANALYTICS_FAIL.inc()
-                raise RuntimeError(f"analytics_http_{resp.status_code}")
+                await producer.send_and_wait(dlq_topic, value)
+            ack = asyncio.get_running_loop().create_future()
+            ack.set_result(None)
+    DLQ_COUNTER.inc()
+    return ack
+
+async def _post_batch(client: "httpx.AsyncClient", url: str, batch: EncodedBatch, gzip: bool) -> "httpx.Response":
+    headers = {"Content-Type": batch.content_type}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        return await client.post(url, content=batch.stream(gzip=True), headers=headers)
+    return await client.post(url, content=batch.body(), headers=headers)
+
+async def post_batch(
+    batch: EncodedBatch,
+    url: str,
+    producer: "AIOKafkaProducer",
+    dlq_topic: str,
+    client: Optional["httpx.AsyncClient"] = None,
+    gzip: bool = False,
+    mode: str = "csv",
+    retry: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    dlq: Optional[DlqPublisher] = None,
+) -> None:
+    """Post an encoded batch to analytics; on failure, publish to DLQ and raise.
+
+    A failed batch that reached the DLQ raises DeadLettered (carrying the envelope's
+    ack); when the DLQ publish failed too, the delivery error is raised as is.
+    With `gzip` the body is compressed while streaming. Pass the consumer's shared
+    `client` to reuse pooled connections; without one a short-lived client is created
+    for this call only. JSON batches are dead-lettered with their individual events.
+    Retryable failures are retried per `retry`, gated by `breaker`; with `dlq` the
+    envelope is queued on the producer rather than awaited.
+    """
+    async def attempt() -> "httpx.Response":
+        start = time.perf_counter()
+        if client is not None:
+            resp = await _post_batch(client, url, batch, gzip)
+        else:
+            import httpx
+
+            async with httpx.AsyncClient(timeout=Settings.http_timeout_secs) as own_client:
+                resp = await _post_batch(own_client, url, batch, gzip)
+        POST_LATENCY.observe(time.perf_counter() - start)
+        if not 200 <= resp.status_code < 300:
+            raise SinkHTTPError(resp.status_code)
+        return resp
+
+    try:
+        resp = await call_with_retry(attempt, retry, breaker, mode=mode)
+        ANALYTICS_SUCCESS.inc()
+        BATCH_COUNT.inc()
+        log.info(f"analytics_post_ok mode={mode} rows={batch.rows} bytes={batch.nbytes} gzip={gzip} status={resp.status_code}")
     except Exception as e:
         ANALYTICS_FAIL.inc()
-        envelope = {"error": str(e), "source_mode": "csv", "payload_rows": max(0, (payload_csv.count('\n')-1))}
+        envelope = {"error": str(e), "source_mode": mode, "payload_rows": batch.rows}
+        if batch.items is not None:
+            envelope["events"] = [json.loads(item) for item in batch.items]
         try:
-            await producer.send_and_wait( dlq_topic, json.dumps(envelope).encode("utf-8") )
-            DLQ_COUNTER.inc()
-            log.error(f"analytics_post_fail mode=csv rows={envelope['payload_rows']} dlq_topic={dlq_topic} error={e}")
+            ack = await _dead_letter(producer, dlq_topic, json.dumps(envelope).encode("utf-8"), dlq=dlq)
         except Exception as e2:
-            log.error(f"dlq_publish_failed mode=csv error={e2}")
-        raise
-
-def build_csv_from_events(events: list[dict]) -> str:
-    """Build CSV payload from merged events."""
-    csv_buf = StringIO()
-    writer = csv.writer(csv_buf)
-    writer.writerow(["type", "customer_id", "product_id", "status", "sku", "qty", "total_products", "low_stock_count", "total_customers"]) 
-    for ev in events:
-        if ev.get("type") == "customer_update":
-            cust = ev.get("customer", {})
-            inv = ev.get("inventory_summary", {})
-            writer.writerow([
-                ev.get("type"),
-                cust.get("id"),
-                "",
-                cust.get("status"),
-                "",
-                "",
-                inv.get("total_products"),
-                inv.get("low_stock_count"),
-                "",
-            ])
-        elif ev.get("type") == "inventory_update":
-            prod = ev.get("product", {})
-            custs = ev.get("customer_summary", {})
-            writer.writerow([
-                ev.get("type"),
-                "",
-                prod.get("product_id"),
-                "",
-                prod.get("sku"),
-                prod.get("qty"),
-                "",
-                "",
-                custs.get("total_customers"),
-            ])
-    return csv_buf.getvalue()
-
-async def consume():
-    r = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
-    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS)
-    consumer = AIOKafkaConsumer(
-        CUSTOMER_TOPIC,
-        INVENTORY_TOPIC,
-        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-        group_id=os.getenv("CONSUMER_GROUP", "analytics-consumers"),
-        enable_auto_commit=True,
-        auto_offset_reset="earliest",
-    )
+            log.error(f"dlq_publish_failed mode={mode} error={e2}")
+            raise e
+        log.error(f"analytics_post_fail mode={mode} rows={envelope['payload_rows']} dlq_topic={dlq_topic} error={e}")
+        raise DeadLettered(e, ack) from e
+
+async def post_csv_batch(
+    payload_csv: Union[str, EncodedBatch],
+    url: str,
+    producer: "AIOKafkaProducer",
+    dlq_topic: str,
+    client: Optional["httpx.AsyncClient"] = None,
+    gzip: bool = False,
+    retry: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    dlq: Optional[DlqPublisher] = None,
+) -> None:
+    """Post CSV batch to analytics; on failure, publish to DLQ and raise.
+
+    `payload_csv` is either CSV text or an EncodedBatch from CsvBatchEncoder (which
+    already knows its row count).
+    """
+    batch = EncodedBatch.from_text(payload_csv) if isinstance(payload_csv, str) else payload_csv
+    await post_batch(batch, url, producer, dlq_topic, client=client, gzip=gzip, mode="csv", retry=retry, breaker=breaker, dlq=dlq)
+
+async def post_json_event(
+    client: "httpx.AsyncClient",
+    url: str,
+    producer: "AIOKafkaProducer",
+    dlq_topic: str,
+    topic: str,
+    key_str: str,
+    key_bytes: bytes,
+    merged: dict,
+    retry: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    dlq: Optional[DlqPublisher] = None,
+) -> Optional[asyncio.Future]:
+    """Post a single merged event as JSON; on failure, publish an envelope to the DLQ.
+
+    Returns None once delivered, or the DLQ envelope's ack after a failure; raises
+    when the envelope could not be published either.
+    """
+    async def attempt() -> "httpx.Response":
+        start = time.perf_counter()
+        resp = await client.post(url, json=merged)
+        POST_LATENCY.observe(time.perf_counter() - start)
+        if not 200 <= resp.status_code < 300:
+            raise SinkHTTPError(resp.status_code)
+        return resp
+
+    try:
+        resp = await call_with_retry(attempt, retry, breaker, mode="json")
+        ANALYTICS_SUCCESS.inc()
+        log.info(f"analytics_post_ok key={key_str} topic={topic} status={resp.status_code}")
+    except Exception as e:
+        ANALYTICS_FAIL.inc()
+        envelope = {
+            "error": str(e),
+            "source_topic": topic,
+            "key": key_str,
+            "payload": merged,
+        }
+        try:
+            ack = await _dead_letter(producer, dlq_topic, json.dumps(envelope).encode("utf-8"), key=key_bytes, dlq=dlq)
+        except Exception as e2:
+            log.error(f"dlq_publish_failed key={key_str} error={e2}")
+            raise
+        log.error(f"analytics_post_fail key={key_str} dlq_topic={dlq_topic} error={e}")
+        return ack
+    return None
+
+async def consume(consumer=None, producer=None, redis_client=None, http_client=None, settings: Optional[Settings] = None, readiness: Optional[Readiness] = None):
+    """Run the consume loop until cancelled.
+
+    Configuration comes from `settings` (read from the environment when omitted).
+    Kafka, Redis and HTTP clients are built from it unless passed in (the offline
+    benchmark injects in-memory stand-ins). Connection state is reported to `readiness`.
+    """
+    from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+    from aiokafka.coordinator.assignors.range import RangePartitionAssignor
+    from aiokafka.coordinator.assignors.roundrobin import RoundRobinPartitionAssignor
+    import redis.asyncio as redis
+
+    from .snapshot import RestoreRebalanceListener, load_snapshot, write_snapshot
+
+    cfg = settings or Settings.from_env()
+    cfg.validate()
+    readiness = readiness or Readiness()
+    digest = make_digest(cfg.dedup_digest)
+    schemas = {cfg.customer_topic: CUSTOMER_SCHEMA, cfg.inventory_topic: PRODUCT_SCHEMA} if cfg.payload_projection else None
+    decode_pool = ThreadPoolExecutor(max_workers=max(1, cfg.decode_threads), thread_name_prefix="decode")
+    r = redis_client if redis_client is not None else redis.from_url(cfg.redis_url, encoding="utf-8", decode_responses=True)
+    idem = RedisIdempotencyStore(r, ttl_seconds=cfg.idemp_ttl_seconds)
+    local_digests = None
+    if cfg.local_dedup_max_entries > 0:
+        # never trust a local digest longer than Redis would
+        local_digests = LocalDigestCache(
+            max_entries=cfg.local_dedup_max_entries,
+            max_bytes=int(cfg.local_dedup_max_mb * 1024 * 1024),
+            ttl_seconds=min(cfg.local_dedup_ttl_seconds, cfg.idemp_ttl_seconds),
+        )
+        idem = CachedIdempotencyStore(idem, local_digests)
+    if producer is None:
+        producer = AIOKafkaProducer(bootstrap_servers=cfg.kafka_bootstrap_servers, linger_ms=cfg.dlq_linger_ms)
+    dlq = DlqPublisher(producer, cfg.analytics_dlq_topic)
+    retry = RetryPolicy(cfg.sink_retry_attempts, cfg.sink_retry_base_secs, cfg.sink_retry_max_secs)
+    breaker = CircuitBreaker(cfg.breaker_failure_threshold, cfg.breaker_reset_secs)
+    if http_client is None:
+        http_client = build_http_client(settings=cfg)
+    if consumer is None:
+        consumer = AIOKafkaConsumer(
+            bootstrap_servers=cfg.kafka_bootstrap_servers,
+            group_id=cfg.consumer_group,
+            # Workers need co-located partitions (same number of both topics) for their state shards
+            partition_assignment_strategy=(RangePartitionAssignor,) if cfg.worker_index is not None else (RoundRobinPartitionAssignor,),
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
     # In-memory stores for a lightweight merge/co-group
-    customers = {}
-    products = {}
-    batch = []  # holds merged events until flush
-    last_flush = time.monotonic()
+    spill = SqliteSpill(cfg.state_spill_path, mmap_mb=cfg.state_spill_mmap_mb) if cfg.state_spill_path else None
+    state = JoinState(
+        cfg.low_stock_thresholds,
+        max_customers=cfg.state_max_customers,
+        max_products=cfg.state_max_products,
+        spill=spill,
+    )
+    restored = load_snapshot(cfg.snapshot_path, state) if cfg.snapshot_path else None
+    positions = dict(restored or {})  # (topic, partition) -> next offset reflected in state
+    last_snapshot = time.monotonic()
+    # manual commits: an offset becomes committable once its event is delivered or dead-lettered
+    tracker = OffsetTracker()
+    # claimed digests are confirmed once committed; redelivered uncommitted records match their own claim
+    digests = PendingDigests()
+
+    async def record_digests(offsets: dict) -> None:
+        await idem.record_batch(digests.committed(offsets))
+
+    committer = OffsetCommitter(consumer, tracker, interval=cfg.commit_interval_secs, before_commit=dlq.flush, after_commit=record_digests)
+
+    async def send_batch(payload: EncodedBatch) -> None:
+        await post_batch(payload, cfg.analytics_url, producer, cfg.analytics_dlq_topic, client=http_client, gzip=cfg.batch_gzip, mode=cfg.analytics_mode,
+                         retry=retry, breaker=breaker, dlq=dlq)
+        readiness.set("sink", True, "post ok")
+        BATCH_ROWS.inc(payload.rows)
+
+    def batch_flushed(done: list) -> None:
+        tracker.done_many(done)
+        committer.request()  # coalesced: one commit per flush at most
+
+    # encodes merged events as they arrive; flushed on size, bytes or deadline (batching modes only)
+    batch = None
+    if cfg.analytics_mode in BATCH_MODES:
+        batch = BatchFlusher(
+            make_batch_encoder(cfg.analytics_mode, windowed=cfg.window_secs > 0),
+            send_batch,
+            max_size=cfg.batch_max_size,
+            max_bytes=cfg.batch_max_bytes,
+            interval=cfg.flush_interval_secs,
+            min_size=cfg.batch_min_size,
+            adaptive=cfg.batch_adaptive,
+            on_flushed=batch_flushed,
+        )
+
+    async def deliver_json(item: tuple) -> None:
+        topic, key_str, key_bytes, merged, done = item
+        try:
+            ack = await post_json_event(http_client, cfg.analytics_url, producer, cfg.analytics_dlq_topic, topic, key_str, key_bytes, merged,
+                                        retry=retry, breaker=breaker, dlq=dlq)
+        except Exception:
+            # neither delivered nor dead-lettered: the offset stays uncommitted
+            log.error(f"delivery_undelivered topic={topic} key={key_str} offsets_held=true")
+            return
+        if ack is None:
+            readiness.set("sink", True, "post ok")
+            done()
+        else:
+            when_acked(ack, done)
+
+    delivery = DeliveryPool(deliver_json, workers=cfg.delivery_concurrency, queue_size=cfg.delivery_queue_max)
+
+    async def emit_window(rows: list, positions: list, window_end: float) -> None:
+        # Summary rows take the place of merged events on the existing delivery paths
+        if not rows:
+            tracker.done_many(positions)
+            return
+        if batch is not None:
+            for i, row in enumerate(rows):
+                # the last row carries the window's positions: its flush is the window's last
+                await batch.add(row, window_end, positions=positions if i == len(rows) - 1 else ())
+            return
+        remaining = [len(rows)]
+
+        def row_done() -> None:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                tracker.done_many(positions)
+
+        for row in rows:
+            if row["type"] == "customer_window":
+                topic, key_str = cfg.customer_topic, row["customer_id"]
+            else:
+                topic, key_str = cfg.inventory_topic, row["sku"]
+            await delivery.submit(f"{topic}:{key_str}", (topic, key_str, key_str.encode("utf-8"), row, row_done))
+
+    window = None
+    if cfg.window_secs > 0:
+        window = WindowAggregator(
+            emit_window,
+            size=cfg.window_secs,
+            slide=cfg.window_slide_secs or None,
+            allowed_lateness=cfg.window_allowed_lateness_secs,
+            late_policy=cfg.window_late_policy,
+            max_windows=cfg.window_max_open,
+            max_keys=cfg.window_max_keys,
+            low_stock_threshold=cfg.low_stock_thresholds[0],
+        )
+
+    async def on_revoke(revoked) -> None:
+        # Finish what is in flight for these partitions and commit it before the handover
+        if window is not None:
+            await window.flush("rebalance")
+            window.forget((tp.topic, tp.partition) for tp in revoked)
+        if batch is not None:
+            await batch.flush("rebalance")
+        if cfg.analytics_mode == "json":
+            await delivery.join()
+        await committer.commit()
+        tracker.forget((tp.topic, tp.partition) for tp in revoked)
+        digests.forget((tp.topic, tp.partition) for tp in revoked)
+        if local_digests is not None:
+            # the revoked keys may change under their next owner
+            local_digests.clear()
+        for tp in revoked:
+            with contextlib.suppress(KeyError):
+                PARTITION_LAG.remove(tp.topic, str(tp.partition))
+
+    restore = RestoreRebalanceListener(consumer, restored, on_revoke=on_revoke)
+    consumer.subscribe([cfg.customer_topic, cfg.inventory_topic], listener=restore)
 
     await producer.start()
     await consumer.start()
+    readiness.set("kafka", True, "consumer and producer started")
+    if cfg.analytics_mode == "json":
+        delivery.start()
+    if batch is not None:
+        batch.start()
+    if window is not None:
+        window.start()
+    committer.start()
+    loop_lag = LoopLagMonitor(cfg.event_loop_lag_interval_secs)
+    loop_lag.start()
 
     try:
-        # Warm up Redis connection
+        # Warm up the Redis connection and load the dedup scripts
         try:
             await r.ping()
+            await idem.start()
+            readiness.set("redis", True, "ping ok")
         except Exception as e:
-            log.warning(f"Redis not reachable at {REDIS_URL}: {e}. Proceeding without idempotency.")
-
-        # Start Prometheus metrics HTTP server
-        start_http_server(METRICS_PORT)
-        log.info(f"metrics_port={METRICS_PORT} analytics_url={ANALYTICS_URL} analytics_mode={ANALYTICS_MODE} batch_max={BATCH_MAX_SIZE} flush_interval={FLUSH_INTERVAL_SECS} kafka_bootstrap={KAFKA_BOOTSTRAP_SERVERS}")
-        log.info(f"Consuming topics: {CUSTOMER_TOPIC}, {INVENTORY_TOPIC}")
-
-        async def flush_batch_if_needed(force: bool = False):
-            nonlocal batch, last_flush
-            if ANALYTICS_MODE == "json":
-                # For json mode, send immediately per event (handled inline), nothing to flush
-                return
-            now = time.monotonic()
-            if not force and len(batch) < 1:
-                return
-            if not force and len(batch) < BATCH_MAX_SIZE and (now - last_flush) < FLUSH_INTERVAL_SECS:
-                return
-            # Build CSV
-            payload_csv = build_csv_from_events(batch)
-            rows = max(0, len(batch))
-            batch = []
-            last_flush = now
-            try:
-                await post_csv_batch(payload_csv, ANALYTICS_URL, producer, ANALYTICS_DLQ_TOPIC)
-                BATCH_ROWS.inc(rows)
-            except Exception:
-                pass
-
-        async for msg in consumer:
-            key_bytes = msg.key if msg.key is not None else b""
-            key_str = key_bytes.decode("utf-8", errors="ignore") if isinstance(key_bytes, (bytes, bytearray)) else str(key_bytes)
-            digest = hashlib.sha256(msg.value or b"").hexdigest()
-            redis_key = f"processed:{msg.topic}:{key_str}"
-
-            skip = False
-            try:
-                prev = await r.get(redis_key)
-                if prev == digest:
-                    skip = True
-                else:
-                    await r.set(redis_key, digest, ex=IDEMP_TTL_SECONDS)
-            except Exception:
-                # If Redis is unavailable, fall back to processing without dedup
-                pass
-
-            if skip:
-                # Uncomment for verbose dedup logging
-                DEDUP_COUNTER.labels(topic=msg.topic).inc()
-                # log.debug(f"DEDUP skip topic={msg.topic} key={key_str}")
-                continue
+            readiness.set("redis", False, str(e))
+            fallback = "with local-only idempotency" if cfg.local_dedup_max_entries > 0 else "without idempotency"
+            log.warning(f"Redis not reachable at {cfg.redis_url}: {e}. Proceeding {fallback}.")
 
-            MSG_COUNTER.labels(topic=msg.topic).inc()
+        # Any HTTP answer means the sink is reachable; delivery failures are the breaker's concern
+        try:
+            resp = await http_client.request("HEAD", cfg.analytics_url)
+            readiness.set("sink", True, f"status={resp.status_code}")
+        except Exception as e:
+            readiness.set("sink", False, str(e) or type(e).__name__)
 
-            try:
-                payload = json.loads(msg.value.decode("utf-8"))
-            except Exception:
-                payload = None
+        if cfg.worker_index is not None:
+            log.info(f"worker_index={cfg.worker_index} pid={os.getpid()}")
+        log.info(f"metrics_port={cfg.metrics_port} analytics_url={cfg.analytics_url} analytics_mode={cfg.analytics_mode} batch_max={cfg.batch_max_size} flush_interval={cfg.flush_interval_secs} kafka_bootstrap={cfg.kafka_bootstrap_servers}")
+        log.info(f"Consuming topics: {cfg.customer_topic}, {cfg.inventory_topic}")
 
-            merged = None
-            if msg.topic == CUSTOMER_TOPIC and payload:
-                customers[key_str] = payload
+        def merge_message(topic: str, key_str: str, payload: Optional[dict]) -> tuple[Optional[dict], Any]:
+            """Apply the update to the join state; returns the merged event and the key's previous record."""
+            merged, prev = None, None
+            if topic == cfg.customer_topic and payload:
+                prev = state.upsert_customer(key_str, payload)
                 # Lightweight merge: customer + inventory summary
-                inv_total = len(products)
-                low_stock = sum(1 for p in products.values() if isinstance(p.get("qty"), int) and p.get("qty", 0) < 20)
                 merged = {
                     "type": "customer_update",
                     "customer": payload,
-                    "inventory_summary": {"total_products": inv_total, "low_stock_count": low_stock},
+                    "inventory_summary": state.inventory_summary(),
                 }
-            elif msg.topic == INVENTORY_TOPIC and payload:
-                products[key_str] = payload
-                cust_total = len(customers)
+            elif topic == cfg.inventory_topic and payload:
+                prev = state.upsert_product(key_str, payload)
                 merged = {
                     "type": "inventory_update",
                     "product": payload,
-                    "customer_summary": {"total_customers": cust_total},
+                    "customer_summary": state.customer_summary(),
                 }
+            return merged, prev
 
+        # per-batch stage totals for the per-message steps: [merge, handoff]
+        stage_totals = [0.0, 0.0]
+
+        async def reject_malformed(msg, dec) -> None:
+            MALFORMED_COUNTER.labels(topic=msg.topic, reason=dec.error.reason).inc()
+            envelope = {
+                "error": str(dec.error),
+                "source_topic": msg.topic,
+                "partition": msg.partition,
+                "offset": msg.offset,
+                "key": dec.key_str,
+                "value": (msg.value or b"").decode("utf-8", errors="replace"),
+            }
+            try:
+                ack = await _dead_letter(producer, cfg.analytics_dlq_topic, json.dumps(envelope).encode("utf-8"), key=dec.key_bytes or None, dlq=dlq)
+            except Exception as e:
+                # the offset stays uncommitted so the record is read again after a restart
+                log.error(f"dlq_publish_failed key={dec.key_str} offsets_held=true error={e}")
+                return
+            log.warning(f"malformed_payload topic={msg.topic} key={dec.key_str} offset={msg.offset} reason={dec.error.reason} dlq_topic={cfg.analytics_dlq_topic}")
+            when_acked(ack, functools.partial(tracker.done, (msg.topic, msg.partition), msg.offset))
+
+        async def process_message(msg, key_str: str, key_bytes: bytes, payload: Optional[dict]) -> None:
+            MSG_COUNTER.labels(topic=msg.topic).inc()
+            position = ((msg.topic, msg.partition), msg.offset)
+            t0 = time.perf_counter()
+            merged, prev = merge_message(msg.topic, key_str, payload)
+            t1 = time.perf_counter()
+            stage_totals[0] += t1 - t0
             if merged is None:
                 log.warning(f"skip_unmerged topic={msg.topic} key={key_str}")
+                tracker.done(*position)
+                return
+
+            event_ts = msg.timestamp / 1000.0 if msg.timestamp else None
+            if window is not None:
+                # Aggregate instead of delivering; closed windows go out through emit_window
+                if msg.topic == cfg.customer_topic:
+                    status = CustomerRecord.from_payload(payload).status
+                    kept = await window.add_customer(key_str, prev.status if prev else None, status, event_ts, position)
+                else:
+                    rec = ProductRecord.from_payload(payload)
+                    kept = await window.add_product(key_str, rec.sku, prev.qty if prev else None, rec.qty, event_ts, position)
+                if not kept:
+                    # discarded as late under WINDOW_LATE_POLICY=drop
+                    tracker.done(*position)
+            # Deliver either per-event JSON or batched CSV/JSON
+            elif cfg.analytics_mode == "json":
+                # Hand off to the delivery lanes; blocks only when the key's lane is full
+                await delivery.submit(f"{msg.topic}:{key_str}", (msg.topic, key_str, key_bytes, merged, functools.partial(tracker.done, *position)))
+            else:
+                # batching modes: stage into batch; flushes on size here, on deadline in the background
+                await batch.add(merged, event_ts, position=position)
+            stage_totals[1] += time.perf_counter() - t1
+
+        loop = asyncio.get_running_loop()
+        paused = False
+        while True:
+            if breaker.is_open:
+                # Sink is down: stop fetching but keep polling so the group membership stays alive
+                consumer.pause(*consumer.assignment())
+                if not paused:
+                    log.warning("consumption_paused reason=circuit_open")
+                    readiness.set("sink", False, "circuit open")
+                    paused = True
+            elif paused:
+                consumer.resume(*consumer.assignment())
+                paused = False
+                log.info("consumption_resumed")
+            fetched = await consumer.getmany(timeout_ms=cfg.fetch_timeout_ms, max_records=cfg.fetch_max_records)
+            msgs = [m for tp_msgs in fetched.values() for m in tp_msgs]
+            if not msgs:
                 continue
+            for tp, tp_msgs in fetched.items():
+                highwater = consumer.highwater(tp)
+                if highwater is not None:
+                    PARTITION_LAG.labels(tp.topic, str(tp.partition)).set(max(0, highwater - tp_msgs[-1].offset - 1))
+
+            started = time.perf_counter()
+            stage_totals[:] = (0.0, 0.0)
+            if len(msgs) >= cfg.decode_offload_min_records:
+                # Parse/hash large batches off the event loop so deliveries and timers keep running
+                decoded = await loop.run_in_executor(decode_pool, decode_batch, msgs, digest, schemas)
+            else:
+                decoded = decode_batch(msgs, digest, schemas)
+            STAGE_DECODE.observe(time.perf_counter() - started)
 
-            # Deliver either per-event JSON or batched CSV
-            if ANALYTICS_MODE == "json":
-                start = time.perf_counter()
+            keyed = []
+            for msg, dec in zip(msgs, decoded):
+                tp = (msg.topic, msg.partition)
+                tracker.track(tp, msg.offset)
+                until = restore.replay_until.get(tp)
+                if until is not None and msg.offset < until:
+                    # Already delivered before the restart: rebuild state only
+                    REPLAY_COUNTER.labels(topic=msg.topic).inc()
+                    t0 = time.perf_counter()
+                    merge_message(msg.topic, dec.key_str, dec.payload)
+                    stage_totals[0] += time.perf_counter() - t0
+                    positions[tp] = msg.offset + 1
+                    tracker.done(tp, msg.offset)
+                    continue
+                if until is not None:
+                    del restore.replay_until[tp]
+                keyed.append((msg, dec))
+
+            # One Redis round trip for the whole fetch batch; new digests are claimed for their position
+            items = [(msg.topic, dec.key_str, dec.digest, f"{msg.partition}:{msg.offset}") for msg, dec in keyed]
+            with STAGE_DEDUP.time():
                 try:
-                    async with httpx.AsyncClient(timeout=5.0) as client:
-                        resp = await client.post(ANALYTICS_URL, json=merged)
-                        POST_LATENCY.observe(time.perf_counter() - start)
-                        if 200 <= resp.status_code < 300:
-                            ANALYTICS_SUCCESS.inc()
-                            log.info(f"analytics_post_ok key={key_str} topic={msg.topic} status={resp.status_code}")
-                        else:
-                            ANALYTICS_FAIL.inc()
-                            raise RuntimeError(f"analytics_http_{resp.status_code}")
+                    seen = await idem.seen_batch(items)
+                    ok = getattr(idem, "backend_available", True)
+                    readiness.set("redis", ok, "dedup ok" if ok else "dedup from local cache")
                 except Exception as e:
-                    ANALYTICS_FAIL.inc()
-                    envelope = {
-                        "error": str(e),
-                        "source_topic": msg.topic,
-                        "key": key_str,
-                        "payload": merged,
-                    }
-                    try:
-                        await producer.send_and_wait(ANALYTICS_DLQ_TOPIC, json.dumps(envelope).encode("utf-8"), key=key_bytes)
-                        DLQ_COUNTER.inc()
-                        log.error(f"analytics_post_fail key={key_str} dlq_topic={ANALYTICS_DLQ_TOPIC} error={e}")
-                    except Exception as e2:
-                        log.error(f"dlq_publish_failed key={key_str} error={e2}")
-            else:
-                # csv mode: stage into batch and flush if needed
-                batch.append(merged)
-                await flush_batch_if_needed(force=False)
+                    # If Redis is unavailable, fall back to processing without dedup
+                    readiness.set("redis", False, str(e))
+                    seen = [False] * len(keyed)
+
+            for (msg, dec), item, skip in zip(keyed, items, seen):
+                if skip:
+                    # Uncomment for verbose dedup logging
+                    DEDUP_COUNTER.labels(topic=msg.topic).inc()
+                    # log.debug(f"DEDUP skip topic={msg.topic} key={dec.key_str}")
+                    tracker.done((msg.topic, msg.partition), msg.offset)
+                    continue
+                digests.track((msg.topic, msg.partition), msg.offset, item)
+                if dec.error is not None:
+                    await reject_malformed(msg, dec)
+                    continue
+                await process_message(msg, dec.key_str, dec.key_bytes, dec.payload)
+            for msg, _ in keyed:
+                positions[(msg.topic, msg.partition)] = msg.offset + 1
+            STAGE_MERGE.observe(stage_totals[0])
+            STAGE_HANDOFF.observe(stage_totals[1])
+            state.publish_metrics()
+            elapsed = time.perf_counter() - started
+            BATCH_PROCESSING_SECONDS.observe(elapsed)
+            FETCH_BATCH_RECORDS.observe(len(msgs))
+            if elapsed > 0:
+                RECORDS_PER_SECOND.set(len(msgs) / elapsed)
+            log.debug(f"fetch_batch_done records={len(msgs)} seconds={elapsed:.4f} records_per_sec={len(msgs) / max(elapsed, 1e-9):.0f}")
+
+            if cfg.snapshot_path and time.monotonic() - last_snapshot >= cfg.snapshot_interval_secs:
+                # Only this loop mutates state and it waits here, so a worker thread can read it
+                with STAGE_SNAPSHOT.time():
+                    await asyncio.to_thread(write_snapshot, cfg.snapshot_path, state, dict(positions))
+                last_snapshot = time.monotonic()
 
-            # time-based flush
-            await flush_batch_if_needed(force=False)
     finally:
-        await consumer.stop()
+        await loop_lag.stop()
+        if window is not None:
+            # emit open windows into the delivery stage before it drains
+            try:
+                await window.stop()
+            except Exception as e:
+                log.error(f"window_flush_failed error={e}")
+        if cfg.analytics_mode == "json":
+            # deliver what is already queued before the producer/client go away
+            await delivery.stop(timeout=cfg.delivery_drain_timeout_secs)
         try:
-            # flush remaining CSV batch
-            if ANALYTICS_MODE == "csv":
+            # flush remaining batch
+            if batch is not None:
                 # best-effort flush
                 try:
-                    await flush_batch_if_needed(force=True)
+                    await batch.stop()
                 except Exception:
                     pass
         except Exception:
             pass
+        # commit what was delivered while the consumer is still in the group
+        try:
+            await committer.stop()
+        except Exception as e:
+            log.error(f"offset_commit_failed final=true error={e}")
+        await consumer.stop()
         try:
             await producer.stop()
         except Exception:
             pass
         try:
-            await r.close()
+            await http_client.aclose()
+        except Exception:
+            pass
+        try:
+            await idem.close()
         except Exception:
             pass
+        if cfg.snapshot_path:
+            try:
+                write_snapshot(cfg.snapshot_path, state, positions)
+            except Exception as e:
+                log.error(f"snapshot_write_failed path={cfg.snapshot_path} error={e}")
+        try:
+            state.close()
+        except Exception:
+            pass
+        decode_pool.shutdown(wait=False)
 
-async def main():
+async def main(settings: Optional[Settings] = None):
+    cfg = settings or Settings.from_env()
+    cfg.validate()
+    logging.basicConfig(level=cfg.log_level, format="%(asctime)s level=%(levelname)s msg=%(message)s")
     loop = asyncio.get_running_loop()
     stop = asyncio.Event()
 
     for s in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(s, stop.set)
 
-    consumer_task = asyncio.create_task(consume())
+    readiness = Readiness()
+    # Start Prometheus metrics and health HTTP servers (workers are served by the runner)
+    if cfg.worker_index is None:
+        from prometheus_client import start_http_server
+
+        start_http_server(cfg.metrics_port)
+        if cfg.health_port > 0:
+            start_health_server(cfg.health_port, readiness.report)
+            log.info(f"health_server port={cfg.health_port} paths=/live,/ready")
+    if cfg.profile_port > 0:
+        port = cfg.profile_port + int(cfg.worker_index or 0)
+        start_profile_server(port)
+        log.info(f"profile_server port={port} path=/debug/profile")
+
+    consumer_task = asyncio.create_task(consume(settings=cfg, readiness=readiness))
     await stop.wait()
     consumer_task.cancel()
     with contextlib.suppress(asyncio.CancelledError):
         await consumer_task
 
 if __name__ == "__main__":
-    import contextlib
     asyncio.run(main())
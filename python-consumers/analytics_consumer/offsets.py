@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+log = logging.getLogger("analytics_consumer")
+
+COMMIT_LATENCY = Histogram("consumer_offset_commit_seconds", "Latency of manual Kafka offset commits")
+COMMIT_COUNTER = Counter("consumer_offset_commits_total", "Manual offset commits by result", ["result"])
+UNCOMMITTED = Gauge("consumer_uncommitted_messages", "Fetched messages whose offsets are not yet committable")
+
+# (topic, partition) pair, as used for positions and snapshot offsets
+TP = tuple[str, int]
+
+
+class OffsetTracker:
+    """Tracks which fetched offsets have been fully handled, per partition.
+
+    Every fetched message is `track()`ed in offset order and later marked `done()`:
+    immediately when it needs no delivery (dedup skip, replay, unmergeable), or once
+    the batch or JSON delivery carrying it has been posted or dead-lettered. The
+    committable offset of a partition is one past the longest done prefix, so an
+    offset is never committed while an earlier message is still in flight.
+    """
+
+    def __init__(self):
+        self._pending: dict[TP, deque] = {}
+        self._done: dict[TP, set] = {}
+        self._committable: dict[TP, int] = {}
+        self._committed: dict[TP, int] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def track(self, tp: TP, offset: int) -> None:
+        self._pending.setdefault(tp, deque()).append(offset)
+        self._count += 1
+        UNCOMMITTED.inc()
+
+    def done(self, tp: TP, offset: int) -> None:
+        pending = self._pending.get(tp)
+        if not pending or offset < pending[0]:
+            return  # stale: the partition was revoked (and maybe reassigned) meanwhile
+        done = self._done.setdefault(tp, set())
+        done.add(offset)
+        while pending and pending[0] in done:
+            first = pending.popleft()
+            done.discard(first)
+            self._committable[tp] = first + 1
+            self._count -= 1
+            UNCOMMITTED.dec()
+
+    def done_many(self, positions: Iterable[tuple[TP, int]]) -> None:
+        for tp, offset in positions:
+            self.done(tp, offset)
+
+    def committable(self) -> dict[TP, int]:
+        """Offsets that advanced since the last `mark_committed()`."""
+        return {tp: o for tp, o in self._committable.items() if self._committed.get(tp) != o}
+
+    def mark_committed(self, offsets: dict[TP, int]) -> None:
+        self._committed.update(offsets)
+
+    def forget(self, tps: Iterable[TP]) -> None:
+        """Drop revoked partitions; their in-flight offsets are redelivered to the new owner."""
+        for tp in tps:
+            pending = self._pending.pop(tp, None)
+            if pending:
+                self._count -= len(pending)
+                UNCOMMITTED.dec(len(pending))
+            self._done.pop(tp, None)
+            self._committable.pop(tp, None)
+            self._committed.pop(tp, None)
+
+
+class OffsetCommitter:
+    """Coalesces commit requests into at most one in-flight `consumer.commit()`.
+
+    `request()` is cheap and called after every flush; the background task commits
+    whatever is committable at that point, so requests arriving while a commit is in
+    flight are folded into the next one. With `interval` set it also commits
+    periodically, which covers per-event delivery where there are no flushes.
+    `before_commit` is awaited first (e.g. to wait for outstanding DLQ acks) and
+    `after_commit` is given the offsets once they are committed.
+    """
+
+    def __init__(
+        self,
+        consumer,
+        tracker: OffsetTracker,
+        interval: Optional[float] = None,
+        before_commit: Optional[Callable[[], Awaitable[None]]] = None,
+        after_commit: Optional[Callable[[dict[TP, int]], Awaitable[None]]] = None,
+    ):
+        # resolved here rather than per commit: the first import of aiokafka is slow
+        from aiokafka import TopicPartition
+
+        self._topic_partition = TopicPartition
+        self._consumer = consumer
+        self._tracker = tracker
+        self._interval = interval
+        self._before_commit = before_commit
+        self._after_commit = after_commit
+        self._wanted = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def request(self) -> None:
+        self._wanted.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with asyncio.timeout(self._interval):
+                    await self._wanted.wait()
+            except TimeoutError:
+                pass
+            self._wanted.clear()
+            await self.commit()
+
+    async def commit(self) -> bool:
+        """Commit everything committable now; returns False if the commit failed."""
+        async with self._lock:
+            offsets = self._tracker.committable()
+            if not offsets:
+                return True
+            try:
+                if self._before_commit is not None:
+                    await self._before_commit()
+                start = time.perf_counter()
+                await self._consumer.commit({self._topic_partition(t, p): o for (t, p), o in offsets.items()})
+            except Exception as e:
+                # e.g. a rebalance in progress; the offsets stay committable for the next attempt
+                COMMIT_COUNTER.labels(result="error").inc()
+                log.warning(f"offset_commit_failed partitions={len(offsets)} error={e}")
+                return False
+            COMMIT_LATENCY.observe(time.perf_counter() - start)
+            COMMIT_COUNTER.labels(result="ok").inc()
+            self._tracker.mark_committed(offsets)
+            log.debug(f"offset_commit_ok partitions={len(offsets)}")
+            if self._after_commit is not None:
+                try:
+                    await self._after_commit(offsets)
+                except Exception as e:
+                    log.warning(f"after_commit_failed partitions={len(offsets)} error={e}")
+            return True
+
+    async def stop(self) -> None:
+        """Stop the background task and make a final commit."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.commit()
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from prometheus_client import Gauge, Histogram
+
+log = logging.getLogger("analytics_consumer")
+
+LOOP_LAG = Histogram(
+    "consumer_event_loop_lag_seconds",
+    "How late the event loop ran a timer callback (time it was blocked)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_LAG_MAX = Gauge("consumer_event_loop_lag_max_seconds", "Largest event loop lag in the current one-minute window")
+
+PROFILE_MAX_SECONDS = 120.0
+
+
+class LoopLagMonitor:
+    """Measures event loop responsiveness by how late a periodic sleep wakes up.
+
+    Anything that holds the loop (CPU-bound parsing, blocking I/O, a long merge)
+    delays the wake-up by the same amount, which lands in LOOP_LAG.
+    """
+
+    def __init__(self, interval: float = 0.5, window: float = 60.0):
+        self._interval = interval
+        self._window = window
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        window_start = loop.time()
+        worst = 0.0
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            if loop.time() - window_start >= self._window:
+                window_start, worst = loop.time(), 0.0
+            worst = max(worst, lag)
+            LOOP_LAG_MAX.set(worst)
+            if lag >= 1.0:
+                log.warning(f"event_loop_blocked lag_seconds={lag:.3f}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def _stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Sampling profiler for other threads, built on sys._current_frames().
+
+    A background thread snapshots the stacks of the target threads every
+    `interval` seconds and tallies them; the profiled code runs unmodified, so the
+    cost is the sampling thread itself (it takes the GIL briefly per sample).
+    Output is folded stacks (`outer;...;inner count`), which flamegraph.pl and
+    speedscope read directly.
+    """
+
+    def __init__(self, thread_ids: Optional[set] = None, interval: float = 0.005):
+        self._thread_ids = thread_ids  # None: every thread except the sampler
+        self._interval = max(0.001, interval)
+        self.samples = 0
+        self.stacks: Tally = Tally()
+
+    def run(self, seconds: float) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (self._thread_ids is not None and ident not in self._thread_ids):
+                    continue
+                self.stacks[_stack(frame)] += 1
+            self.samples += 1
+            time.sleep(self._interval)
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common(limit))
+
+    def top_functions(self, limit: int = 25) -> list[tuple[str, int]]:
+        """Innermost frames by sample count (self time)."""
+        leaf: Tally = Tally()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        return leaf.most_common(limit)
+
+
+class _ProfileHandler(BaseHTTPRequestHandler):
+    server: "ProfileServer"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/debug/profile":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        try:
+            seconds = min(float(query.get("seconds", ["10"])[0]), PROFILE_MAX_SECONDS)
+            interval = float(query.get("interval_ms", ["5"])[0]) / 1000
+        except ValueError:
+            self.send_error(400, "seconds and interval_ms must be numbers")
+            return
+        threads = query.get("threads", ["loop"])[0]
+        if not self.server.lock.acquire(blocking=False):
+            self.send_error(409, "a profile is already running")
+            return
+        try:
+            sampler = StackSampler(None if threads == "all" else {self.server.loop_thread_id}, interval)
+            log.info(f"profile_started seconds={seconds} interval_ms={interval * 1000:g} threads={threads}")
+            sampler.run(seconds)
+        finally:
+            self.server.lock.release()
+        if query.get("format", ["text"])[0] == "folded":
+            body = sampler.folded()
+        else:
+            top = "".join(f"{count:>8} {100 * count / max(sampler.samples, 1):6.1f}%  {fn}\n" for fn, count in sampler.top_functions())
+            body = f"samples={sampler.samples} seconds={seconds:g} threads={threads}\n\nself samples:\n{top}\nfolded stacks:\n{sampler.folded(50)}"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class ProfileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: tuple[str, int], loop_thread_id: int):
+        super().__init__(addr, _ProfileHandler)
+        self.loop_thread_id = loop_thread_id
+        self.lock = threading.Lock()
+
+
+def start_profile_server(port: int, addr: str = "0.0.0.0", loop_thread_id: Optional[int] = None) -> ProfileServer:
+    """Serve GET /debug/profile?seconds=N in a daemon thread.
+
+    Samples the event loop thread (the caller's, unless `loop_thread_id` is given)
+    for N seconds and returns the hottest functions plus folded stacks;
+    `format=folded` returns only the folded stacks, `threads=all` includes worker
+    threads such as the decode pool.
+    """
+    server = ProfileServer((addr, port), loop_thread_id or threading.get_ident())
+    threading.Thread(target=server.serve_forever, name="profile-server", daemon=True).start()
+    return server
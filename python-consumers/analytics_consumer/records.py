@@ -0,0 +1,114 @@
+import json
+from typing import Annotated, NamedTuple, Optional, Sequence
+
+try:
+    import msgspec
+except ImportError:  # optional typed decoder
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # optional fast decoder
+    orjson = None
+
+
+class MalformedPayload(ValueError):
+    """A Kafka value that is not JSON (`invalid_json`) or does not match its schema (`schema`)."""
+
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+
+
+# int fields hold signed 64-bit values: what orjson parses as int (beyond it gives a float)
+INT_MIN, INT_MAX = -(2**63), 2**63 - 1
+
+
+class FieldSpec(NamedTuple):
+    name: str
+    type: type  # str or int
+    required: bool = False
+
+
+class PayloadSchema:
+    """Typed projection of a topic's JSON payload onto the fields the pipeline uses.
+
+    `decode()` validates the declared fields and returns a dict holding only those
+    that are present (unknown fields are dropped, nulls count as absent). With msgspec
+    installed the bytes are decoded straight into a generated Struct, so unused fields
+    are skipped without being materialised; otherwise the value is parsed with
+    orjson/json and projected in Python. Both paths reject the same inputs, including
+    integers outside the signed 64-bit range.
+    """
+
+    def __init__(self, name: str, fields: Sequence[FieldSpec]):
+        self.name = name
+        self.fields = tuple(fields)
+        self._names = tuple(f.name for f in self.fields)
+        self._decoder = None
+        if msgspec is not None:
+            nonempty = msgspec.Meta(min_length=1)
+            int64 = msgspec.Meta(ge=INT_MIN, le=INT_MAX)
+
+            def annotated(f: FieldSpec):
+                if f.type is int:
+                    return Annotated[int, int64]
+                return Annotated[f.type, nonempty] if f.required and f.type is str else f.type
+
+            struct = msgspec.defstruct(name, [
+                (f.name, annotated(f)) if f.required else (f.name, Optional[annotated(f)], None)
+                for f in self.fields
+            ], kw_only=True)
+            self._decoder = msgspec.json.Decoder(struct)
+
+    def decode(self, value: bytes) -> dict:
+        if self._decoder is not None:
+            try:
+                obj = self._decoder.decode(value)
+            except msgspec.ValidationError as e:
+                raise MalformedPayload("schema", str(e)) from None
+            except msgspec.DecodeError as e:
+                raise MalformedPayload("invalid_json", str(e)) from None
+            return {n: v for n in self._names if (v := getattr(obj, n)) is not None}
+        try:
+            data = orjson.loads(value) if orjson is not None else json.loads(value.decode("utf-8"))
+        except ValueError as e:  # orjson.JSONDecodeError, json.JSONDecodeError and UnicodeDecodeError
+            raise MalformedPayload("invalid_json", str(e)) from None
+        return self.project(data)
+
+    def project(self, data) -> dict:
+        """Validate an already-parsed value and keep the declared fields."""
+        if not isinstance(data, dict):
+            raise MalformedPayload("schema", f"Expected `object`, got `{type(data).__name__}`")
+        out = {}
+        for f in self.fields:
+            v = data.get(f.name)
+            if v is None:
+                if f.required:
+                    raise MalformedPayload("schema", f"Object missing required field `{f.name}`")
+                continue
+            # bool is an int subclass but never a valid quantity
+            if type(v) is not f.type:
+                raise MalformedPayload("schema", f"Expected `{f.type.__name__}`, got `{type(v).__name__}` - at `$.{f.name}`")
+            if f.required and f.type is str and not v:
+                raise MalformedPayload("schema", f"Expected `str` of length >= 1 - at `$.{f.name}`")
+            if f.type is int and not INT_MIN <= v <= INT_MAX:
+                raise MalformedPayload("schema", f"Expected `int` in [{INT_MIN}, {INT_MAX}] - at `$.{f.name}`")
+            out[f.name] = v
+        return out
+
+
+# Field sets follow the producers' Customer/Product models
+CUSTOMER_SCHEMA = PayloadSchema("CustomerPayload", [
+    FieldSpec("id", str, required=True),
+    FieldSpec("email", str),
+    FieldSpec("name", str),
+    FieldSpec("status", str),
+    FieldSpec("updated_at", str),
+])
+PRODUCT_SCHEMA = PayloadSchema("ProductPayload", [
+    FieldSpec("product_id", str, required=True),
+    FieldSpec("sku", str),
+    FieldSpec("qty", int),
+    FieldSpec("updated_at", str),
+])
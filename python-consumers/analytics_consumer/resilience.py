@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger("analytics_consumer")
+
+RETRY_COUNTER = Counter("analytics_post_retries_total", "Analytics POST attempts that were retried", ["mode"])
+CIRCUIT_STATE = Gauge("analytics_circuit_state", "Analytics sink circuit breaker state (0=closed, 1=half_open, 2=open)")
+CIRCUIT_TRANSITIONS = Counter("analytics_circuit_transitions_total", "Circuit breaker state changes", ["state"])
+DLQ_PUBLISH_FAILED = Counter("analytics_dlq_publish_fail_total", "DLQ envelopes Kafka did not acknowledge")
+
+T = TypeVar("T")
+
+
+class SinkHTTPError(RuntimeError):
+    """Non-2xx answer from the analytics sink."""
+
+    def __init__(self, status: int):
+        super().__init__(f"analytics_http_{status}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status >= 500 or self.status in (408, 429)
+
+
+class DeadLettered(RuntimeError):
+    """Delivery failed with `error` and the payload was handed to the DLQ instead.
+
+    `ack` resolves once Kafka has acknowledged the envelope (it fails if it never
+    is); only then may the offsets the payload covers be committed.
+    """
+
+    def __init__(self, error: BaseException, ack: "asyncio.Future"):
+        super().__init__(str(error))
+        self.error = error
+        self.ack = ack
+
+
+class DlqPublishError(RuntimeError):
+    """DLQ envelopes were not acknowledged by Kafka."""
+
+
+def when_acked(ack: "asyncio.Future", callback: Callable[[], None]) -> None:
+    """Call `callback` once `ack` resolves successfully; never if it fails or is cancelled."""
+    def on_done(fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is None:
+            callback()
+
+    ack.add_done_callback(on_done)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Server errors, throttling and transport failures are worth retrying; other 4xx are not."""
+    if isinstance(exc, SinkHTTPError):
+        return exc.retryable
+    import httpx  # already loaded whenever a delivery has been attempted
+
+    return isinstance(exc, httpx.TransportError)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base * 2**n))."""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0, rng: Callable[[], float] = random.random):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng
+
+    def backoff(self, attempt: int) -> float:
+        return self._rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive sink failures.
+
+    While open, `acquire()` holds callers back until `reset_timeout` has passed; then
+    a single probe is let through (half-open). A successful probe closes the circuit,
+    a failed one opens it again. The consume loop watches `is_open` to pause fetching;
+    it turns False once the timeout has passed even without a waiting caller, so a
+    paused consumer resumes and its next delivery becomes the probe.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._changed = asyncio.Event()
+        CIRCUIT_STATE.set(0)
+
+    @property
+    def state(self) -> str:
+        self._expire()
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while callers are being held back (open, or half-open with a probe in flight)."""
+        self._expire()
+        return self._state == self.OPEN or (self._state == self.HALF_OPEN and self._probing)
+
+    def _expire(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set(self.HALF_OPEN)
+
+    def _set(self, state: str) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        CIRCUIT_STATE.set(self._GAUGE[state])
+        CIRCUIT_TRANSITIONS.labels(state=state).inc()
+        log.warning(f"circuit_state state={state} failures={self._failures}")
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self) -> None:
+        """Wait until a call may be made."""
+        while True:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN:
+                wait = self._opened_at + self.reset_timeout - time.monotonic()
+                if wait > 0:
+                    changed = self._changed
+                    try:
+                        async with asyncio.timeout(wait):
+                            await changed.wait()
+                    except TimeoutError:
+                        pass
+                    continue
+                self._set(self.HALF_OPEN)
+            if not self._probing:
+                self._probing = True
+                return
+            await self._changed.wait()
+
+    def record_success(self) -> None:
+        self._probing = False
+        self._failures = 0
+        self._set(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set(self.OPEN)
+
+
+async def call_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    policy: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    mode: str = "json",
+) -> T:
+    """Run `fn` with retries on retryable errors, gated by `breaker` when given.
+
+    Non-retryable errors (e.g. a 400 for a bad payload) are raised at once and do not
+    count against the breaker: the sink answered, it is just refusing this payload.
+    """
+    attempts = policy.attempts if policy is not None else 1
+    for attempt in range(attempts):
+        if breaker is not None:
+            await breaker.acquire()
+        try:
+            result = await fn()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not retryable or attempt + 1 >= attempts:
+                raise
+            RETRY_COUNTER.labels(mode=mode).inc()
+            delay = policy.backoff(attempt)
+            log.warning(f"analytics_post_retry mode={mode} attempt={attempt + 1} delay={delay:.3f} error={e}")
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
+
+
+class DlqPublisher:
+    """Publishes DLQ envelopes with `send()` instead of one `send_and_wait()` each.
+
+    Envelopes go into the producer's accumulator and are batched by its linger; acks
+    are collected in the background. `flush()` waits for every outstanding ack and is
+    called before offsets are committed; it raises DlqPublishError when envelopes were
+    lost since the last flush, so that commit is skipped.
+    """
+
+    def __init__(self, producer, topic: str):
+        self._producer = producer
+        self.topic = topic
+        self._pending: set[asyncio.Future] = set()
+        self._failed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def publish(self, value: bytes, key: Optional[bytes] = None) -> asyncio.Future:
+        """Queue an envelope; returns its ack future."""
+        fut = await self._producer.send(self.topic, value, key=key)
+        self._pending.add(fut)
+        fut.add_done_callback(self._on_done)
+        return fut
+
+    def _on_done(self, fut: asyncio.Future) -> None:
+        self._pending.discard(fut)
+        if fut.cancelled() or fut.exception() is not None:
+            self._failed += 1
+            DLQ_PUBLISH_FAILED.inc()
+            log.error(f"dlq_publish_failed topic={self.topic} error={None if fut.cancelled() else fut.exception()}")
+
+    async def flush(self) -> None:
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+        if self._failed:
+            failed, self._failed = self._failed, 0
+            raise DlqPublishError(f"{failed} DLQ envelopes were not acknowledged")
@@ -0,0 +1,108 @@
+"""Partition-parallel runner: N consumer processes in one group behind one /metrics port.
+
+Each worker is a full `consume()` loop in its own process, so JSON decoding, hashing
+and encoding scale across cores. Workers join the same consumer group with the range
+assignor, so every worker owns whole partitions (the same partition numbers of both
+topics) and keeps its own join state shard for the keys Kafka routed there. The
+parent only supervises the workers and serves their aggregated metrics.
+"""
+import asyncio
+import glob
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from typing import Optional
+
+from .settings import Settings
+
+log = logging.getLogger("analytics_consumer")
+
+
+def _worker(index: int) -> None:
+    os.environ["CONSUMER_WORKER_INDEX"] = str(index)
+    from . import main  # imported after the env is set: metrics go to the multiprocess dir
+    asyncio.run(main.main())
+
+
+def prepare_metrics_dir() -> str:
+    """Point prometheus_client at a clean multiprocess directory (inherited by workers)."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="analytics-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    for f in glob.glob(os.path.join(path, "*.db")):
+        os.remove(f)
+    return path
+
+
+def build_metrics_registry():
+    """Registry that aggregates every worker's metrics files."""
+    from prometheus_client import CollectorRegistry, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def run(workers: Optional[int] = None) -> None:
+    settings = Settings.from_env()
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s level=%(levelname)s msg=%(message)s")
+    if workers is None:
+        workers = settings.consumer_workers
+    if workers <= 1:
+        from . import main
+        asyncio.run(main.main(settings))
+        return
+
+    prepare_metrics_dir()
+    from prometheus_client import multiprocess, start_http_server
+
+    from .health import report_from_registry, start_health_server
+
+    registry = build_metrics_registry()
+    start_http_server(settings.metrics_port, registry=registry)
+    if settings.health_port > 0:
+        # ready once every live worker reports all components ready
+        start_health_server(settings.health_port, lambda: report_from_registry(registry))
+    ctx = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def spawn(index: int):
+        proc = ctx.Process(target=_worker, args=(index,), name=f"analytics-worker-{index}")
+        proc.start()
+        log.info(f"worker_started index={index} pid={proc.pid}")
+        return proc
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()  # SIGTERM: the worker drains, flushes and commits
+
+    procs = [spawn(i) for i in range(workers)]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    log.info(f"runner_started workers={workers} metrics_port={settings.metrics_port} health_port={settings.health_port}")
+
+    while True:
+        for i, proc in enumerate(procs):
+            proc.join(timeout=0.5)
+            if proc.is_alive() or stopping:
+                continue
+            multiprocess.mark_process_dead(proc.pid)
+            log.error(f"worker_exited index={i} pid={proc.pid} exitcode={proc.exitcode} restart_in={settings.worker_restart_delay_secs}")
+            time.sleep(settings.worker_restart_delay_secs)
+            if not stopping:
+                procs[i] = spawn(i)
+        if stopping and not any(p.is_alive() for p in procs):
+            break
+    log.info("runner_stopped")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,152 @@
+import dataclasses
+import os
+from dataclasses import dataclass, field
+from typing import Mapping, Optional
+
+TRUE_VALUES = ("1", "true", "yes")
+
+
+def _env(name: str, **kwargs):
+    """Dataclass field read from environment variable `name` (defaults to the upper-cased field name)."""
+    return field(metadata={"env": name}, **kwargs)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Consumer configuration, parsed from the environment once at start-up.
+
+    Every field is read from the upper-cased environment variable of the same name
+    unless noted. Use `Settings.from_env()` in the process entry point and
+    `dataclasses.replace()` to derive variants (tests, the offline benchmark).
+    """
+
+    kafka_bootstrap_servers: str = "localhost:29092"
+    consumer_group: str = "analytics-consumers"
+    customer_topic: str = "customer_data"
+    inventory_topic: str = "inventory_data"
+    analytics_dlq_topic: str = "analytics_dlq"
+    analytics_url: str = "http://localhost:8000/analytics/data"
+    analytics_mode: str = "json"  # json | csv | json_batch | ndjson
+    batch_max_size: int = 50
+    batch_max_bytes: int = 1024 * 1024  # flush once the encoded body reaches this size
+    batch_gzip: bool = False  # CSV_GZIP is accepted too
+    flush_interval_secs: float = 10.0  # max time an event waits in a batch
+    # Adaptive sizing: grow the row target towards batch_max_size under load, shrink to batch_min_size when idle
+    batch_adaptive: bool = True
+    batch_min_size: int = 10
+    redis_url: str = "redis://localhost:6379/0"
+    # TTL of dedup digests and of the per-position claims taken when a batch is checked
+    idemp_ttl_seconds: int = 86400  # 1 day default
+    # In-process digest cache in front of Redis (0 entries disables it)
+    local_dedup_max_entries: int = 100000
+    local_dedup_max_mb: float = 64.0
+    local_dedup_ttl_seconds: float = 3600.0
+    metrics_port: int = 9108
+    # Readiness (/ready) and liveness (/live) probes; 0 disables
+    health_port: int = 9110
+    # Comma-separated; the first threshold is reported as low_stock_count
+    low_stock_thresholds: tuple = (20,)
+    # Join state bounds (0 = unbounded); evicted records spill to SQLite when a path is set
+    state_max_customers: int = 0
+    state_max_products: int = 0
+    state_spill_path: str = ""
+    state_spill_mmap_mb: int = 256
+    # Periodic join state snapshots for fast restart (empty path disables)
+    snapshot_path: str = ""
+    snapshot_interval_secs: float = 60.0
+    # Set by runner.py for partition-parallel workers; each keeps its own state shard (None = single process)
+    worker_index: Optional[int] = _env("CONSUMER_WORKER_INDEX", default=None)
+    consumer_workers: int = 1
+    worker_restart_delay_secs: float = 5.0  # pause before restarting a worker that exited unexpectedly
+    # Kafka fetch batching (getmany); dedup runs once per fetched batch
+    fetch_max_records: int = 500
+    fetch_timeout_ms: int = 1000
+    # Decode/hash fetched batches of at least this many records in a thread pool
+    decode_offload_min_records: int = 200
+    decode_threads: int = 2
+    dedup_digest: str = "sha256"  # sha256 | blake2b | xxhash
+    # Validate payloads against the typed customer/product schemas and keep only their fields;
+    # malformed values go to the DLQ. false: parse whole payloads and skip what cannot be merged
+    payload_projection: bool = True
+    # Windowed pre-aggregation between merge and delivery: one summary row per key per window (0 disables)
+    window_secs: float = 0.0
+    window_slide_secs: float = 0.0  # 0 = tumbling; smaller than window_secs = sliding
+    window_allowed_lateness_secs: float = 5.0
+    window_late_policy: str = "emit"  # emit | drop (late updates as their own summary rows)
+    window_max_open: int = 64
+    window_max_keys: int = 100000  # per-key aggregates across open windows; the oldest window is emitted early beyond it
+    # Shared delivery client (connection pool / keep-alive)
+    http_timeout_secs: float = 10.0
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry_secs: float = 30.0
+    http2_enabled: bool = False
+    # JSON mode delivery stage: concurrent lanes, bounded queue per lane
+    delivery_concurrency: int = 8
+    delivery_queue_max: int = 100
+    delivery_drain_timeout_secs: float = 30.0
+    # Offsets are committed manually once delivered/DLQ'd: after each batch flush, and at least this often
+    commit_interval_secs: float = 5.0
+    # Sink failures: jittered exponential retries, then a circuit breaker that pauses fetching
+    sink_retry_attempts: int = 3
+    sink_retry_base_secs: float = 0.2
+    sink_retry_max_secs: float = 5.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_secs: float = 30.0
+    # DLQ envelopes are batched by the producer instead of awaited one by one
+    dlq_linger_ms: int = 50
+    # Diagnostics: event loop lag sampling (0 disables) and the on-demand profiler (0 disables; workers add their index)
+    event_loop_lag_interval_secs: float = 0.5
+    profile_port: int = 0
+    log_level: str = "INFO"
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Settings":
+        env = os.environ if environ is None else environ
+        values = {}
+        for f in dataclasses.fields(cls):
+            name = f.metadata.get("env", f.name.upper())
+            raw = env.get(name)
+            if raw is None and name == "BATCH_GZIP":
+                raw = env.get("CSV_GZIP")
+            if raw is not None:
+                values[f.name] = _parse(f, raw)
+        settings = cls(**values)
+        if settings.worker_index is not None:
+            # one state shard per worker
+            settings = dataclasses.replace(
+                settings,
+                state_spill_path=f"{settings.state_spill_path}.w{settings.worker_index}" if settings.state_spill_path else "",
+                snapshot_path=f"{settings.snapshot_path}.w{settings.worker_index}" if settings.snapshot_path else "",
+            )
+        return settings
+
+    def validate(self) -> None:
+        from .encoders import BATCH_MODES
+
+        if self.analytics_mode != "json" and self.analytics_mode not in BATCH_MODES:
+            raise ValueError(f"unknown ANALYTICS_MODE={self.analytics_mode}; expected json, {', '.join(BATCH_MODES)}")
+        if self.window_secs > 0:
+            from .windowing import LATE_POLICIES
+
+            if self.window_late_policy not in LATE_POLICIES:
+                raise ValueError(f"unknown WINDOW_LATE_POLICY={self.window_late_policy}; expected {', '.join(LATE_POLICIES)}")
+            if self.window_slide_secs > self.window_secs:
+                raise ValueError(f"WINDOW_SLIDE_SECS={self.window_slide_secs} exceeds WINDOW_SECS={self.window_secs}")
+
+
+def _parse(f: dataclasses.Field, raw: str):
+    kind = type(f.default)
+    if f.name == "low_stock_thresholds":
+        return tuple(int(t) for t in raw.split(",") if t.strip())
+    if f.name == "worker_index":
+        return int(raw)
+    if kind is bool:
+        return raw.lower() in TRUE_VALUES
+    if kind is int:
+        return int(raw)
+    if kind is float:
+        return float(raw)
+    if f.name in ("analytics_mode", "dedup_digest", "window_late_policy"):
+        return raw.lower()
+    return raw
@@ -26,4 +26,4 @@ wait_for_host "$KAFKA_HOST" "$KAFKA_PORT" "Kafka"
 wait_for_host "$REDIS_HOST" "$REDIS_PORT" "Redis"
 wait_for_host "$APIS_HOST" "$APIS_PORT" "Mock APIs"
 
-exec python /app/main.py
+exec python -m analytics_consumer.runner
@@ -0,0 +1,249 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Iterator, Optional, Sequence, Union
+
+from prometheus_client import Gauge
+
+STATE_ENTRIES = Gauge("consumer_state_entries", "Join state records held", ["table", "tier"])
+STATE_MEMORY = Gauge("consumer_state_memory_bytes", "Approximate memory held by in-memory join state", ["table"])
+
+
+class CustomerRecord:
+    """Compact customer record: only the fields the merge uses."""
+
+    __slots__ = ("status",)
+
+    def __init__(self, status: Optional[str] = None):
+        self.status = status
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "CustomerRecord":
+        status = payload.get("status") if isinstance(payload, dict) else None
+        return cls(status if isinstance(status, str) else None)
+
+    def to_row(self) -> tuple:
+        return (self.status,)
+
+
+class ProductRecord:
+    """Compact product record: only the fields the merge uses."""
+
+    __slots__ = ("sku", "qty")
+
+    def __init__(self, sku: Optional[str] = None, qty: Optional[int] = None):
+        self.sku = sku
+        self.qty = qty
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "ProductRecord":
+        if not isinstance(payload, dict):
+            return cls()
+        sku, qty = payload.get("sku"), payload.get("qty")
+        return cls(sku if isinstance(sku, str) else None, qty if isinstance(qty, int) else None)
+
+    def to_row(self) -> tuple:
+        return (self.sku, self.qty)
+
+
+Record = Union[CustomerRecord, ProductRecord]
+
+# Rough per-entry cost of a resident record: OrderedDict slot and links, the key
+# string header and the __slots__ instance. Field values are mostly shared/small.
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class SqliteSpill:
+    """Disk tier for records evicted from memory, backed by SQLite.
+
+    `mmap_mb` sets SQLite's memory-mapped I/O window so hot pages are read without
+    syscalls. The tier only extends memory for the running process, so existing rows
+    are cleared on open. Use ":memory:" as `path` in tests.
+    """
+
+    TABLES = {"customers": CustomerRecord, "products": ProductRecord}
+
+    def __init__(self, path: str, mmap_mb: int = 0):
+        # Snapshots read the tier from a worker thread while the consume loop waits
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        if mmap_mb > 0:
+            self._db.execute(f"PRAGMA mmap_size={int(mmap_mb) * 1024 * 1024}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS customers (key TEXT PRIMARY KEY, status TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS products (key TEXT PRIMARY KEY, sku TEXT, qty INTEGER)")
+        for table in self.TABLES:
+            self._db.execute(f"DELETE FROM {table}")
+        self._db.commit()
+
+    def put(self, table: str, key: str, record: Record) -> None:
+        row = record.to_row()
+        marks = ",".join("?" * (len(row) + 1))
+        self._db.execute(f"INSERT OR REPLACE INTO {table} VALUES ({marks})", (key, *row))
+
+    def pop(self, table: str, key: str) -> Optional[Record]:
+        row = self._db.execute(f"SELECT * FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        return self.TABLES[table](*row[1:])
+
+    def items(self, table: str) -> Iterator[tuple[str, Record]]:
+        cls = self.TABLES[table]
+        for row in self._db.execute(f"SELECT * FROM {table}"):
+            yield row[0], cls(*row[1:])
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+
+class _Table:
+    """LRU of key -> compact record, bounded by `max_entries` (0 = unbounded)."""
+
+    def __init__(self, name: str, max_entries: int, spill: Optional[SqliteSpill]):
+        self.name = name
+        self.max_entries = max_entries
+        self.spill = spill
+        self.resident: OrderedDict[str, Record] = OrderedDict()
+        self.spilled = 0
+        self.key_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.resident) + self.spilled
+
+    def take(self, key: str) -> Optional[Record]:
+        """Remove and return the current record for `key` from either tier."""
+        rec = self.resident.pop(key, None)
+        if rec is not None:
+            self.key_bytes -= len(key)
+            return rec
+        if self.spill is not None and self.spilled:
+            rec = self.spill.pop(self.name, key)
+            if rec is not None:
+                self.spilled -= 1
+        return rec
+
+    def put(self, key: str, rec: Record) -> list[Record]:
+        """Insert `rec` as most recent; returns records dropped (not spilled) by eviction."""
+        self.resident[key] = rec
+        self.key_bytes += len(key)
+        dropped = []
+        while self.max_entries and len(self.resident) > self.max_entries:
+            old_key, old = self.resident.popitem(last=False)
+            self.key_bytes -= len(old_key)
+            if self.spill is not None:
+                self.spill.put(self.name, old_key, old)
+                self.spilled += 1
+            else:
+                dropped.append(old)
+        return dropped
+
+    def items(self) -> Iterator[tuple[str, Record]]:
+        yield from self.resident.items()
+        if self.spill is not None and self.spilled:
+            yield from self.spill.items(self.name)
+
+    def memory_bytes(self) -> int:
+        return len(self.resident) * ENTRY_OVERHEAD_BYTES + self.key_bytes
+
+
+class JoinState:
+    """Customer/product join state with incrementally maintained aggregates.
+
+    Records are stored compactly (`CustomerRecord`/`ProductRecord`) in LRU tables
+    bounded by `max_customers`/`max_products`. With a `spill` tier, evicted records
+    move to disk and aggregates stay exact; without one they are forgotten and the
+    aggregates describe the resident records only.
+
+    Summaries are O(1): totals and one low-stock count per threshold are adjusted on
+    each upsert from the difference between the previous and the new record. The
+    first threshold is reported as `low_stock_count`; all of them are reported in
+    `low_stock_counts`.
+    """
+
+    def __init__(
+        self,
+        low_stock_thresholds: Sequence[int] = (20,),
+        max_customers: int = 0,
+        max_products: int = 0,
+        spill: Optional[SqliteSpill] = None,
+    ):
+        if not low_stock_thresholds:
+            raise ValueError("at least one low-stock threshold is required")
+        self.thresholds = tuple(low_stock_thresholds)
+        self.spill = spill
+        self.customers = _Table("customers", max_customers, spill)
+        self.products = _Table("products", max_products, spill)
+        self._low_stock = [0] * len(self.thresholds)
+
+    def _adjust_low_stock(self, qty: Optional[int], sign: int) -> None:
+        if qty is None:
+            return
+        for i, t in enumerate(self.thresholds):
+            if qty < t:
+                self._low_stock[i] += sign
+
+    def upsert_customer(self, key: str, payload: dict) -> Optional[CustomerRecord]:
+        """Store the customer; returns the previous record, if any."""
+        return self.put_customer(key, CustomerRecord.from_payload(payload))
+
+    def upsert_product(self, key: str, payload: dict) -> Optional[ProductRecord]:
+        """Store the product and update low-stock counts; returns the previous record, if any."""
+        return self.put_product(key, ProductRecord.from_payload(payload))
+
+    def put_customer(self, key: str, rec: CustomerRecord) -> Optional[CustomerRecord]:
+        prev = self.customers.take(key)
+        self.customers.put(key, rec)
+        return prev
+
+    def put_product(self, key: str, rec: ProductRecord) -> Optional[ProductRecord]:
+        prev = self.products.take(key)
+        if prev is not None:
+            self._adjust_low_stock(prev.qty, -1)
+        self._adjust_low_stock(rec.qty, +1)
+        for dropped in self.products.put(key, rec):
+            self._adjust_low_stock(dropped.qty, -1)
+        return prev
+
+    def load(self, customer_keys, statuses, product_keys, skus, qtys) -> None:
+        """Bulk-load column data (e.g. from a snapshot) into an empty state."""
+        if len(self.customers) or len(self.products):
+            raise ValueError("load() requires an empty state")
+        if self.customers.max_entries or self.products.max_entries:
+            # Bounded tables need the eviction/spill path record by record
+            for key, status in zip(customer_keys, statuses):
+                self.put_customer(key, CustomerRecord(status))
+            for key, sku, qty in zip(product_keys, skus, qtys):
+                self.put_product(key, ProductRecord(sku, qty))
+            return
+        self.customers.resident = OrderedDict(zip(customer_keys, map(CustomerRecord, statuses)))
+        self.customers.key_bytes = sum(map(len, customer_keys))
+        self.products.resident = OrderedDict(zip(product_keys, map(ProductRecord, skus, qtys)))
+        self.products.key_bytes = sum(map(len, product_keys))
+        for i, t in enumerate(self.thresholds):
+            self._low_stock[i] = sum(1 for q in qtys if q is not None and q < t)
+
+    def inventory_summary(self) -> dict:
+        summary = {"total_products": len(self.products), "low_stock_count": self._low_stock[0]}
+        if len(self.thresholds) > 1:
+            summary["low_stock_counts"] = {str(t): n for t, n in zip(self.thresholds, self._low_stock)}
+        return summary
+
+    def customer_summary(self) -> dict:
+        return {"total_customers": len(self.customers)}
+
+    def publish_metrics(self) -> None:
+        """Export entry counts and approximate memory; call once per processed batch."""
+        for table in (self.customers, self.products):
+            STATE_ENTRIES.labels(table=table.name, tier="memory").set(len(table.resident))
+            STATE_ENTRIES.labels(table=table.name, tier="disk").set(table.spilled)
+            STATE_MEMORY.labels(table=table.name).set(table.memory_bytes())
+        if self.spill is not None:
+            self.spill.commit()
+
+    def close(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
@@ -2,8 +2,25 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Add the parent directory of the package to sys.path
 # tests/ -> analytics_consumer/ -> python-consumers/
 ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+class FakeProducer:
+    """Records what send_and_wait() publishes (the DLQ in post_* tests)."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_and_wait(self, topic, value):
+        self.sent.append((topic, value))
+
+
+@pytest.fixture
+def producer():
+    return FakeProducer()
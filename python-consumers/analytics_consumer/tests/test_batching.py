@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+
+from prometheus_client import REGISTRY
+
+from analytics_consumer.batching import BatchFlusher
+from analytics_consumer.encoders import JsonBatchEncoder
+
+def _latency_count():
+    return REGISTRY.get_sample_value("analytics_event_delivery_latency_seconds_count") or 0
+
+class Sink:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+    async def __call__(self, batch):
+        await asyncio.sleep(self.delay)
+        self.batches.append(batch.rows)
+
+@pytest.mark.asyncio
+async def test_deadline_flush_runs_without_new_messages():
+    sink = Sink()
+    flusher = BatchFlusher(JsonBatchEncoder(), sink, max_size=100, max_bytes=1 << 20, interval=0.05)
+    flusher.start()
+    observed_before = _latency_count()
+    await flusher.add({"n": 1})
+    await flusher.add({"n": 2})
+    assert sink.batches == []
+
+    await asyncio.sleep(0.2)
+    assert sink.batches == [2]
+    assert flusher.deadline is None
+    assert _latency_count() - observed_before == 2
+    await flusher.stop()
+
+@pytest.mark.asyncio
+async def test_size_and_bytes_limits_flush_inline():
+    sink = Sink()
+    flusher = BatchFlusher(JsonBatchEncoder(), sink, max_size=3, max_bytes=1 << 20, interval=60)
+    for i in range(7):
+        await flusher.add({"n": i})
+    assert sink.batches == [3, 3]
+
+    small = Sink()
+    by_bytes = BatchFlusher(JsonBatchEncoder(), small, max_size=1000, max_bytes=40, interval=60)
+    for i in range(4):
+        await by_bytes.add({"payload": "x" * 20})
+    assert small.batches == [2, 2]
+
+    await flusher.stop()  # shutdown flushes the remainder
+    assert sink.batches == [3, 3, 1]
+
+@pytest.mark.asyncio
+async def test_adaptive_target_grows_under_load_and_shrinks_when_idle():
+    sink = Sink()
+    flusher = BatchFlusher(JsonBatchEncoder(), sink, max_size=8, max_bytes=1 << 20, interval=0.03, min_size=2, adaptive=True)
+    flusher.start()
+    for i in range(14):
+        await flusher.add({"n": i})
+    assert sink.batches == [2, 4, 8]
+    assert flusher.target_size == 8
+
+    await flusher.add({"n": "quiet"})
+    await asyncio.sleep(0.15)
+    assert sink.batches[-1] == 1
+    assert flusher.target_size == 4
+    await flusher.stop()
+
+@pytest.mark.asyncio
+async def test_appends_during_slow_flush_go_to_the_next_batch():
+    sink = Sink(delay=0.05)
+    flusher = BatchFlusher(JsonBatchEncoder(), sink, max_size=2, max_bytes=1 << 20, interval=60)
+    await flusher.add({"n": 0})
+    flushing = asyncio.create_task(flusher.add({"n": 1}))  # hits the limit, posts slowly
+    await asyncio.sleep(0.01)
+    await flusher.add({"n": 2})  # appended while the previous batch is in flight
+    await flushing
+    assert sink.batches == [2]
+    assert len(flusher) == 1
+    await flusher.stop()
+    assert sink.batches == [2, 1]
+
+@pytest.mark.asyncio
+async def test_failed_send_is_logged_not_raised():
+    async def boom(batch):
+        raise RuntimeError("sink down")
+    flusher = BatchFlusher(JsonBatchEncoder(), boom, max_size=1, max_bytes=1 << 20, interval=60)
+    await flusher.add({"n": 1})
+    assert len(flusher) == 0
@@ -0,0 +1,148 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# The offline benchmark harness doubles as an end-to-end check of consume()
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "benchmarks"))
+import bench_consumer  # noqa: E402
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", bench_consumer.MODES)
+async def test_consume_delivers_each_unique_message_once_and_commits_everything(mode):
+    messages = bench_consumer.synthetic_messages(300, dup_ratio=0.2, customer_ratio=0.5, seed=1)
+    unique = len(set(messages))
+
+    result = await bench_consumer.run_once(mode, messages, batch_max_size=50)
+
+    assert result["delivered"] == unique < len(messages)
+    assert result["dlq"] == 0
+    assert result["fully_committed"]
+    if mode != "json":
+        assert result["posts"] < unique
+
+@pytest.mark.asyncio
+async def test_consume_records_stage_timings_and_partition_lag():
+    from prometheus_client import REGISTRY
+
+    def count(stage):
+        return REGISTRY.get_sample_value("consumer_stage_seconds_count", {"stage": stage}) or 0.0
+
+    stages = ("decode", "dedup", "merge", "handoff")
+    before = {stage: count(stage) for stage in stages}
+    messages = bench_consumer.synthetic_messages(200, dup_ratio=0.0, customer_ratio=0.5, seed=2)
+
+    await bench_consumer.run_once("json_batch", messages, batch_max_size=50)
+
+    assert all(count(stage) > before[stage] for stage in stages)
+    lags = [s for s in REGISTRY.collect() if s.name == "consumer_partition_lag"][0].samples
+    assert lags and all(sample.value == 0 for sample in lags)  # drained to the high watermark
+
+@pytest.mark.asyncio
+async def test_consume_dead_letters_malformed_payloads_and_commits_past_them():
+    from prometheus_client import REGISTRY
+
+    def rejected(reason):
+        return REGISTRY.get_sample_value("consumer_malformed_total", {"topic": "customer_data", "reason": reason}) or 0.0
+
+    before = {reason: rejected(reason) for reason in ("invalid_json", "schema")}
+    messages = bench_consumer.synthetic_messages(100, dup_ratio=0.0, customer_ratio=1.0, seed=3)
+    messages += [
+        ("customer_data", b"bad-1", b"{not json"),
+        ("customer_data", b"bad-2", b'{"id": "bad-2", "status": 5}'),
+        ("customer_data", b"bad-3", b'{"email": "no-id@example.com"}'),
+    ]
+
+    result = await bench_consumer.run_once("json_batch", messages, batch_max_size=50)
+
+    assert result["delivered"] == 100
+    assert result["dlq"] == 3
+    assert result["fully_committed"]
+    assert rejected("invalid_json") - before["invalid_json"] == 1
+    assert rejected("schema") - before["schema"] == 2
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["json", "csv"])
+async def test_consume_windowed_sends_one_summary_row_per_key_and_commits_everything(mode):
+    messages = bench_consumer.synthetic_messages(200, dup_ratio=0.2, customer_ratio=0.5, seed=4)
+    unique = len(set(messages))
+
+    result = await bench_consumer.run_once(mode, messages, batch_max_size=50, window_secs=60.0)
+
+    assert result["delivered"] == unique  # every synthetic key has one distinct update
+    assert result["dlq"] == 0
+    assert result["fully_committed"]
+
+@pytest.mark.asyncio
+async def test_consume_resumes_after_the_breaker_opens_and_the_sink_recovers():
+    from prometheus_client import REGISTRY
+
+    def transitions(state):
+        return REGISTRY.get_sample_value("analytics_circuit_transitions_total", {"state": state}) or 0.0
+
+    opened, closed = transitions("open"), transitions("closed")
+    messages = bench_consumer.synthetic_messages(300, dup_ratio=0.0, customer_ratio=0.5, seed=5)
+
+    async with asyncio.timeout(20):  # a breaker that never leaves "open" stalls the paused consumer
+        result = await bench_consumer.run_once(
+            "csv", messages, batch_max_size=20, sink_failures=3, fetch_max_records=20,
+            sink_retry_attempts=3, sink_retry_base_secs=0.001, sink_retry_max_secs=0.001,
+            breaker_failure_threshold=3, breaker_reset_secs=0.05,
+        )
+
+    assert transitions("open") > opened and transitions("closed") > closed
+    assert result["delivered"] > 0
+    assert result["delivered"] + 20 * result["dlq"] >= 300
+    assert result["fully_committed"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["json", "csv"])
+async def test_consume_does_not_commit_what_was_neither_delivered_nor_dead_lettered(mode):
+    messages = bench_consumer.synthetic_messages(50, dup_ratio=0.0, customer_ratio=0.5, seed=6)
+
+    result = await bench_consumer.run_once(
+        mode, messages, batch_max_size=10, sink_failures=10**9, dlq_down=True,
+        sink_retry_attempts=1, breaker_failure_threshold=1000,
+    )
+
+    assert result["delivered"] == 0
+    assert result["dlq"] == 0
+    assert not result["fully_committed"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["json", "csv"])
+async def test_consume_redelivers_uncommitted_records_after_a_restart(mode):
+    from fakeredis import aioredis as fakeredis
+
+    messages = bench_consumer.synthetic_messages(50, dup_ratio=0.0, customer_ratio=0.5, seed=7)
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+
+    # nothing delivered or dead-lettered, so nothing committed: the restart replays everything
+    first = await bench_consumer.run_once(
+        mode, messages, batch_max_size=10, sink_failures=10**9, dlq_down=True,
+        sink_retry_attempts=1, breaker_failure_threshold=1000, redis_client=redis_client,
+    )
+    second = await bench_consumer.run_once(mode, messages, batch_max_size=10, redis_client=redis_client)
+
+    assert not first["fully_committed"]
+    assert second["delivered"] == len(set(messages))
+    assert second["fully_committed"]
+    # committed digests are recorded: a third pass drops everything as duplicates
+    third = await bench_consumer.run_once(mode, messages, batch_max_size=10, redis_client=redis_client)
+    assert third["delivered"] == 0
+    assert third["fully_committed"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["json", "csv"])
+async def test_consume_marks_the_sink_ready_after_a_successful_post(mode):
+    from analytics_consumer.health import Readiness
+
+    readiness = Readiness()
+    messages = bench_consumer.synthetic_messages(20, dup_ratio=0.0, customer_ratio=0.5, seed=8)
+
+    # the start-up probe fails, every post succeeds
+    result = await bench_consumer.run_once(mode, messages, batch_max_size=10, sink_probe_down=True, readiness=readiness)
+
+    assert result["delivered"] == len(messages)
+    assert readiness.report()["sink"] == (True, "post ok")
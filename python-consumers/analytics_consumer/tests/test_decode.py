@@ -0,0 +1,43 @@
+import hashlib
+import pytest
+from aiokafka.structs import ConsumerRecord
+
+from analytics_consumer.decode import decode_batch, make_digest
+
+def _record(key, value, offset=0):
+    return ConsumerRecord("customer_data", 0, offset, 0, 0, key, value, None, 0, 0, [])
+
+def test_decode_batch_parses_keys_payloads_and_digests():
+    msgs = [
+        _record(b"c1", b'{"id": "c1", "status": "active"}'),
+        _record(None, b"not json", 1),
+        _record(b"c2", b"[1, 2]", 2),
+        _record(b"c3", None, 3),
+    ]
+    decoded = decode_batch(msgs, make_digest("sha256"))
+    assert decoded[0].key_str == "c1" and decoded[0].payload == {"id": "c1", "status": "active"}
+    # Same digest as the per-message sha256 used before, so stored Redis digests stay valid
+    assert decoded[0].digest == hashlib.sha256(msgs[0].value).hexdigest()
+    assert (decoded[1].key_str, decoded[1].key_bytes, decoded[1].payload) == ("", b"", None)
+    assert decoded[2].payload is None  # only JSON objects can be merged
+    assert decoded[3].digest == hashlib.sha256(b"").hexdigest()
+
+def test_fast_digests_are_stable_and_unknown_names_rejected():
+    for algo in ("blake2b", "xxhash"):
+        digest = make_digest(algo)
+        assert digest(b"payload") == digest(b"payload") != digest(b"other")
+        assert len(digest(b"payload")) == 32  # 128-bit
+    with pytest.raises(ValueError):
+        make_digest("md5")
+
+def test_decode_batch_validates_topics_with_a_schema():
+    from analytics_consumer.records import CUSTOMER_SCHEMA
+
+    msgs = [
+        _record(b"c1", b'{"id": "c1", "status": "active", "notes": "x"}'),
+        _record(b"c2", b'{"id": 2}', 1),
+    ]
+    ok, bad = decode_batch(msgs, make_digest("sha256"), {"customer_data": CUSTOMER_SCHEMA})
+    assert ok.payload == {"id": "c1", "status": "active"} and ok.error is None
+    assert bad.payload is None and bad.error.reason == "schema"
+    assert bad.digest == hashlib.sha256(msgs[1].value).hexdigest()  # still deduplicated
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+
+from analytics_consumer.delivery import DeliveryPool, DELIVERY_IN_FLIGHT, DELIVERY_QUEUE_DEPTH
+
+@pytest.mark.asyncio
+async def test_delivery_pool_runs_concurrently_and_keeps_per_key_order():
+    delivered = []
+    active = 0
+    peak = 0
+
+    async def deliver(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        delivered.append(item)
+        active -= 1
+
+    pool = DeliveryPool(deliver, workers=4, queue_size=10)
+    pool.start()
+    keys = ["a", "b", "c", "d", "e", "f"]
+    for seq in range(5):
+        for k in keys:
+            await pool.submit(k, (k, seq))
+    await pool.stop(timeout=5)
+
+    # Assert: all delivered, lanes ran in parallel, order preserved per key
+    assert len(delivered) == len(keys) * 5
+    assert peak > 1
+    for k in keys:
+        assert [seq for key, seq in delivered if key == k] == list(range(5))
+
+@pytest.mark.asyncio
+async def test_delivery_pool_applies_backpressure_and_survives_errors():
+    release = asyncio.Event()
+    seen = []
+
+    async def deliver(item):
+        await release.wait()
+        seen.append(item)
+        if item == 0:
+            raise RuntimeError("boom")
+
+    pool = DeliveryPool(deliver, workers=1, queue_size=2)
+    pool.start()
+    # one in flight + two queued fills the single lane
+    for i in range(3):
+        await pool.submit("k", i)
+    await asyncio.sleep(0)
+    assert DELIVERY_IN_FLIGHT._value.get() == 1
+    assert DELIVERY_QUEUE_DEPTH._value.get() == 2
+
+    blocked = asyncio.create_task(pool.submit("k", 3))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    release.set()
+    await blocked
+    await pool.stop(timeout=5)
+
+    # Assert: the failing item did not stop the lane
+    assert seen == [0, 1, 2, 3]
+    assert DELIVERY_IN_FLIGHT._value.get() == 0
+    assert DELIVERY_QUEUE_DEPTH._value.get() == 0
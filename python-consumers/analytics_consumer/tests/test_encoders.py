@@ -0,0 +1,106 @@
+import gzip
+import pytest
+
+from analytics_consumer.encoders import CsvBatchEncoder, EncodedBatch, build_csv_from_events
+from analytics_consumer.main import post_csv_batch
+
+def _customer(i):
+    return {
+        "type": "customer_update",
+        "customer": {"id": f"c{i}", "status": "active, pending"},
+        "inventory_summary": {"total_products": 2, "low_stock_count": 1},
+    }
+
+async def _collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+def test_encoder_tracks_rows_and_bytes_incrementally():
+    enc = CsvBatchEncoder()
+    header_bytes = enc.nbytes
+    enc.add(_customer(1))
+    enc.add({"type": "unknown"})  # not encoded
+    enc.add(_customer(2))
+    assert len(enc) == 2
+    batch = enc.take()
+    assert batch.rows == 2
+    assert batch.nbytes == len(batch.body()) > header_bytes
+    assert batch.text() == build_csv_from_events([_customer(1), _customer(2)])
+
+    # take() starts a fresh batch with only the header
+    assert len(enc) == 0
+    assert enc.nbytes == header_bytes
+
+@pytest.mark.asyncio
+async def test_encoded_batch_streams_plain_and_gzip(monkeypatch):
+    import analytics_consumer.encoders as encoders
+    monkeypatch.setattr(encoders, "STREAM_CHUNK_BYTES", 100)
+    enc = CsvBatchEncoder()
+    for i in range(50):
+        enc.add(_customer(i))
+    batch = enc.take()
+    assert await _collect(batch.stream()) == batch.body()
+    assert gzip.decompress(await _collect(batch.stream(gzip=True))) == batch.body()
+
+def test_encoded_batch_from_text_counts_rows_once():
+    batch = EncodedBatch.from_text("type,customer_id\ncustomer_update,c1\ncustomer_update,c2\n")
+    assert batch.rows == 2
+
+@pytest.mark.asyncio
+async def test_post_csv_batch_sends_gzip_encoded_body(producer):
+    import httpx
+    received = {}
+    async def handler(req):
+        received["encoding"] = req.headers.get("content-encoding")
+        received["body"] = gzip.decompress(await req.aread())
+        return httpx.Response(200, request=req)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    enc = CsvBatchEncoder()
+    enc.add(_customer(1))
+    batch = enc.take()
+    await post_csv_batch(batch, "http://example/analytics/upload", producer, "analytics_dlq", client=client, gzip=True)
+
+    assert received["encoding"] == "gzip"
+    assert received["body"] == batch.body()
+    assert producer.sent == []
+    await client.aclose()
+
+@pytest.mark.parametrize("mode", ["json_batch", "ndjson"])
+def test_json_batch_encoders_keep_nested_fields(mode):
+    import json
+    from analytics_consumer.encoders import make_batch_encoder
+    enc = make_batch_encoder(mode)
+    events = [_customer(1), {"type": "inventory_update", "product": {"product_id": "p1", "attrs": {"color": "red"}}}]
+    for ev in events:
+        enc.add(ev)
+    batch = enc.take()
+    assert batch.rows == 2
+    assert batch.nbytes == len(batch.body())
+    body = batch.body().decode("utf-8")
+    if mode == "ndjson":
+        assert batch.content_type == "application/x-ndjson"
+        assert [json.loads(line) for line in body.splitlines()] == events
+    else:
+        assert batch.content_type == "application/json"
+        assert json.loads(body) == events
+    assert len(enc) == 0
+
+@pytest.mark.asyncio
+async def test_post_batch_failure_dead_letters_individual_events(producer):
+    import httpx
+    import json
+    from analytics_consumer.encoders import JsonBatchEncoder
+    from analytics_consumer.main import post_batch
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda req: httpx.Response(503, request=req)))
+    enc = JsonBatchEncoder()
+    enc.add(_customer(1))
+    enc.add(_customer(2))
+
+    with pytest.raises(RuntimeError):
+        await post_batch(enc.take(), "http://example/analytics/data", producer, "analytics_dlq", client=client, mode="json_batch")
+
+    envelope = json.loads(producer.sent[0][1])
+    assert envelope["source_mode"] == "json_batch"
+    assert envelope["payload_rows"] == 2
+    assert envelope["events"] == [_customer(1), _customer(2)]
+    await client.aclose()
@@ -0,0 +1,57 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+from prometheus_client import REGISTRY
+
+from analytics_consumer.health import Readiness, report_from_registry, start_health_server
+
+def test_readiness_tracks_components_and_gauge():
+    readiness = Readiness()
+    assert not readiness.ready
+    assert REGISTRY.get_sample_value("consumer_ready", {"component": "kafka"}) == 0
+
+    for component in ("kafka", "redis", "sink"):
+        readiness.set(component, True, "ok")
+    assert readiness.ready
+    readiness.set("sink", False, "circuit open")
+
+    assert not readiness.ready
+    assert readiness.report()["sink"] == (False, "circuit open")
+    assert REGISTRY.get_sample_value("consumer_ready", {"component": "sink"}) == 0
+    assert REGISTRY.get_sample_value("consumer_ready", {"component": "redis"}) == 1
+
+def test_report_from_registry_reads_the_ready_gauge():
+    readiness = Readiness()
+    readiness.set("kafka", True)
+    readiness.set("redis", True)
+
+    report = report_from_registry(REGISTRY)
+
+    assert report["kafka"][0] and report["redis"][0]
+    assert not report["sink"][0]
+
+def test_health_server_answers_live_and_ready():
+    readiness = Readiness()
+    server = start_health_server(0, readiness.report, addr="127.0.0.1")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/live") as resp:
+            assert resp.status == 200
+
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(f"{base}/ready")
+        assert err.value.code == 503
+        body = json.loads(err.value.read())
+        assert body["ready"] is False
+        assert body["components"]["kafka"] == {"ready": False, "detail": "starting"}
+
+        for component in ("kafka", "redis", "sink"):
+            readiness.set(component, True)
+        with urllib.request.urlopen(f"{base}/ready") as resp:
+            assert resp.status == 200
+            assert json.loads(resp.read())["ready"] is True
+    finally:
+        server.shutdown()
+        server.server_close()
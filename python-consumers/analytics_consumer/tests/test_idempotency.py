@@ -0,0 +1,161 @@
+import pytest
+import fakeredis
+import pytest_asyncio
+
+from analytics_consumer.idempotency import (
+    CachedIdempotencyStore,
+    IdempotencyStore,
+    LocalDigestCache,
+    PendingDigests,
+    RedisIdempotencyStore,
+)
+
+@pytest_asyncio.fixture
+async def store():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    s = RedisIdempotencyStore(r, ttl_seconds=60)
+    await s.start()
+    yield s
+    await r.flushall()
+    await s.close()
+
+@pytest.mark.asyncio
+async def test_seen_batch_marks_repeats_within_and_across_batches(store):
+    first = [
+        ("customer_data", "c1", "d1", "0:1"),
+        ("customer_data", "c1", "d1", "0:2"),  # same digest again in the batch -> duplicate
+        ("customer_data", "c1", "d2", "0:3"),  # changed payload -> new
+        ("inventory_data", "c1", "d1", "0:1"),  # same key on another topic -> new
+    ]
+    assert await store.seen_batch(first) == [False, True, False, False]
+
+    # claimed but not yet committed: a copy at another position is still a duplicate
+    second = await store.seen_batch([
+        ("customer_data", "c1", "d2", "0:7"),
+        ("inventory_data", "c1", "d1", "0:8"),
+        ("customer_data", "c2", "d1", "0:9"),
+    ])
+    assert second == [True, True, False]
+
+@pytest.mark.asyncio
+async def test_redelivered_record_matches_its_own_claim_until_confirmed(store):
+    item = ("customer_data", "c1", "d1", "0:5")
+    assert await store.seen_batch([item]) == [False]
+    # the offset was never committed: the same record comes back after a restart
+    assert await store.seen_batch([item]) == [False]
+
+    await store.record_batch([item])
+    assert await store._r.get("processed:customer_data:c1") == "d1"
+    assert await store.seen_batch([item]) == [True]
+
+@pytest.mark.asyncio
+async def test_confirm_does_not_overwrite_a_later_claim(store):
+    older, newer = ("customer_data", "c1", "d1", "0:1"), ("customer_data", "c1", "d2", "0:2")
+    assert await store.seen_batch([older, newer]) == [False, False]
+
+    await store.record_batch([older])
+    assert await store.seen_batch([("customer_data", "c1", "d2", "0:9")]) == [True]
+    await store.record_batch([newer])
+    assert await store._r.get("processed:customer_data:c1") == "d2"
+
+@pytest.mark.asyncio
+async def test_claims_set_ttl_and_recover_from_script_flush(store):
+    assert await store.seen_batch([("customer_data", "c1", "d1", "0:1")]) == [False]
+    ttl = await store._r.ttl("processed:customer_data:c1")
+    assert 0 < ttl <= 60
+
+    # Simulate a Redis restart dropping the script cache
+    await store._r.script_flush()
+    assert await store.seen_batch([("customer_data", "c1", "d1", "0:2")]) == [True]
+    await store._r.script_flush()
+    await store.record_batch([("customer_data", "c1", "d1", "0:1")])
+    assert 0 < await store._r.ttl("processed:customer_data:c1") <= 60
+
+@pytest.mark.asyncio
+async def test_seen_batch_empty_is_noop(store):
+    assert await store.seen_batch([]) == []
+    await store.record_batch([])
+
+def test_store_without_seen_and_record_batch_cannot_be_constructed():
+    class Incomplete(IdempotencyStore):
+        async def seen_batch(self, items):
+            return [False] * len(items)
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+class FailingStore(IdempotencyStore):
+    async def seen_batch(self, items):
+        raise ConnectionError("redis down")
+
+    async def record_batch(self, items):
+        raise ConnectionError("redis down")
+
+@pytest.mark.asyncio
+async def test_cached_store_answers_repeats_locally(store):
+    cached = CachedIdempotencyStore(store, LocalDigestCache(max_entries=10))
+    assert await cached.seen_batch([("customer_data", "c1", "d1", "0:0")]) == [False]
+    await cached.record_batch([("customer_data", "c1", "d1", "0:0")])
+
+    # Drop Redis state: only the local cache can still recognise the repeat
+    await store._r.flushall()
+    assert await cached.seen_batch([
+        ("customer_data", "c1", "d1", "0:1"),
+        ("customer_data", "c1", "d2", "0:2"),
+        ("customer_data", "c1", "d1", "0:3"),  # changed back after d2 -> new
+    ]) == [True, False, False]
+
+@pytest.mark.asyncio
+async def test_cached_store_falls_back_to_local_dedup_when_backend_fails():
+    cached = CachedIdempotencyStore(FailingStore(), LocalDigestCache(max_entries=10))
+    assert await cached.seen_batch([("customer_data", "c1", "d1", "0:0"), ("customer_data", "c1", "d1", "0:1")]) == [False, True]
+    await cached.record_batch([("customer_data", "c1", "d1", "0:0")])  # cached; the backend error is logged, not raised
+    assert cached.backend_available is False
+    assert await cached.seen_batch([("customer_data", "c1", "d1", "0:2")]) == [True]
+
+@pytest.mark.asyncio
+async def test_cached_store_learns_digests_only_once_committed(store):
+    cache = LocalDigestCache(max_entries=10)
+    cached = CachedIdempotencyStore(store, cache)
+    held = ("customer_data", "c1", "d1", "0:4")
+    assert await cached.seen_batch([held]) == [False]
+    assert len(cache) == 0
+
+    # delivery and DLQ failed, the offset is held: the redelivered record is processed again
+    assert await cached.seen_batch([held]) == [False]
+
+    await cached.record_batch([held])
+    assert cache.get("customer_data", "c1") == "d1"
+    cache.clear()
+    assert len(cache) == 0 and cache.approx_bytes == 0
+
+def test_local_cache_bounds_entries_memory_and_ttl(monkeypatch):
+    cache = LocalDigestCache(max_entries=2, ttl_seconds=10)
+    cache.put("t", "a", "d")
+    cache.put("t", "b", "d")
+    assert cache.get("t", "a") == "d"  # touch a so b is least recently used
+    cache.put("t", "c", "d")
+    assert cache.get("t", "b") is None
+    assert len(cache) == 2
+
+    small = LocalDigestCache(max_entries=100, max_bytes=2 * (LocalDigestCache.ENTRY_OVERHEAD_BYTES + 3))
+    for k in "abc":
+        small.put("t", k, "d")
+    assert len(small) == 2
+    assert small.approx_bytes <= 2 * (LocalDigestCache.ENTRY_OVERHEAD_BYTES + 3)
+
+    import analytics_consumer.idempotency as idem_mod
+    now = idem_mod.time.monotonic()
+    monkeypatch.setattr(idem_mod.time, "monotonic", lambda: now + 11)
+    assert cache.get("t", "a") is None
+
+def test_pending_digests_are_released_by_commit_and_dropped_on_revoke():
+    pending = PendingDigests()
+    pending.track(("customer_data", 0), 5, ("customer_data", "c1", "d1", "0:5"))
+    pending.track(("customer_data", 0), 6, ("customer_data", "c2", "d1", "0:6"))
+    pending.track(("customer_data", 1), 3, ("customer_data", "c3", "d1", "1:3"))
+
+    assert pending.committed({("customer_data", 0): 6}) == [("customer_data", "c1", "d1", "0:5")]
+    pending.forget([("customer_data", 1)])
+    assert pending.committed({("customer_data", 1): 4}) == []
+    assert len(pending) == 1
@@ -0,0 +1,172 @@
+import asyncio
+import pytest
+
+from analytics_consumer.batching import BatchFlusher
+from analytics_consumer.encoders import JsonBatchEncoder
+from analytics_consumer.offsets import OffsetCommitter, OffsetTracker
+from analytics_consumer.resilience import DeadLettered, DlqPublishError
+
+A = ("customer_data", 0)
+B = ("inventory_data", 0)
+
+class FakeConsumer:
+    def __init__(self, delay=0.0, fail=False):
+        self.commits = []
+        self.delay = delay
+        self.fail = fail
+    async def commit(self, offsets):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("rebalance in progress")
+        self.commits.append({(tp.topic, tp.partition): o for tp, o in offsets.items()})
+
+def test_tracker_only_advances_past_contiguous_done_offsets():
+    tracker = OffsetTracker()
+    for offset in range(10, 15):
+        tracker.track(A, offset)
+    tracker.track(B, 3)
+
+    tracker.done(A, 12)
+    tracker.done(A, 11)
+    assert tracker.committable() == {}  # 10 is still in flight
+
+    tracker.done(A, 10)
+    tracker.done(B, 3)
+    assert tracker.committable() == {A: 13, B: 4}
+    assert len(tracker) == 2
+
+    tracker.mark_committed({A: 13, B: 4})
+    assert tracker.committable() == {}
+    tracker.done_many([(A, 13), (A, 14)])
+    assert tracker.committable() == {A: 15}
+
+    # Revoked partitions are dropped and late completions for them ignored
+    tracker.track(B, 4)
+    tracker.forget([B])
+    tracker.done(B, 4)
+    assert tracker.committable() == {A: 15}
+    assert len(tracker) == 0
+
+@pytest.mark.asyncio
+async def test_committer_coalesces_requests_and_keeps_offsets_after_failure():
+    tracker = OffsetTracker()
+    consumer = FakeConsumer(delay=0.02)
+    committer = OffsetCommitter(consumer, tracker)
+    committer.start()
+    for offset in range(5):
+        tracker.track(A, offset)
+        tracker.done(A, offset)
+        committer.request()
+    await asyncio.sleep(0.05)
+    assert consumer.commits == [{A: 5}]
+
+    # Nothing new: no commit round trip
+    committer.request()
+    await asyncio.sleep(0.05)
+    assert len(consumer.commits) == 1
+
+    consumer.fail = True
+    tracker.track(A, 5)
+    tracker.done(A, 5)
+    assert await committer.commit() is False
+    consumer.fail = False
+    await committer.stop()  # final commit retries what failed
+    assert consumer.commits[-1] == {A: 6}
+
+@pytest.mark.asyncio
+async def test_committer_skips_the_commit_when_before_commit_fails():
+    tracker = OffsetTracker()
+    consumer = FakeConsumer()
+    async def flush_dlq():
+        raise DlqPublishError("1 DLQ envelopes were not acknowledged")
+    committer = OffsetCommitter(consumer, tracker, before_commit=flush_dlq)
+    tracker.track(A, 0)
+    tracker.done(A, 0)
+
+    assert await committer.commit() is False
+    assert consumer.commits == []
+
+@pytest.mark.asyncio
+async def test_committer_waits_for_before_commit_hook():
+    tracker = OffsetTracker()
+    consumer = FakeConsumer()
+    order = []
+    async def flush_dlq():
+        order.append(("dlq_flushed", len(consumer.commits)))
+    committer = OffsetCommitter(consumer, tracker, before_commit=flush_dlq)
+    tracker.track(A, 0)
+    tracker.done(A, 0)
+    assert await committer.commit() is True
+    assert order == [("dlq_flushed", 0)]
+    assert consumer.commits == [{A: 1}]
+
+@pytest.mark.asyncio
+async def test_committer_hands_committed_offsets_to_after_commit_only_on_success():
+    tracker = OffsetTracker()
+    consumer = FakeConsumer()
+    recorded = []
+    async def record_digests(offsets):
+        recorded.append(offsets)
+    committer = OffsetCommitter(consumer, tracker, after_commit=record_digests)
+    tracker.track(A, 0)
+    tracker.done(A, 0)
+    consumer.fail = True
+
+    assert await committer.commit() is False
+    assert recorded == []
+    consumer.fail = False
+    assert await committer.commit() is True
+    assert recorded == [{A: 1}]
+
+@pytest.mark.asyncio
+async def test_batch_offsets_are_committed_only_after_the_flush():
+    tracker = OffsetTracker()
+    consumer = FakeConsumer()
+    committer = OffsetCommitter(consumer, tracker)
+    release = asyncio.Event()
+
+    async def send(batch):
+        await release.wait()
+        ack = asyncio.get_running_loop().create_future()
+        ack.set_result(None)
+        raise DeadLettered(RuntimeError("sink down"), ack)  # acknowledged by the DLQ: handled
+
+    def flushed(done):
+        tracker.done_many(done)
+        committer.request()
+
+    flusher = BatchFlusher(JsonBatchEncoder(), send, max_size=2, max_bytes=1 << 20, interval=60, on_flushed=flushed)
+    committer.start()
+    for offset in range(2):
+        tracker.track(A, offset)
+    await flusher.add({"n": 0}, position=(A, 0))
+    flushing = asyncio.create_task(flusher.add({"n": 1}, position=(A, 1)))
+    await asyncio.sleep(0.01)
+    assert tracker.committable() == {}
+
+    release.set()
+    await flushing
+    await asyncio.sleep(0.01)
+    assert consumer.commits == [{A: 2}]
+    await committer.stop()
+
+@pytest.mark.asyncio
+async def test_batch_offsets_stay_pending_until_delivered_or_acknowledged_by_the_dlq():
+    tracker = OffsetTracker()
+    ack = asyncio.get_running_loop().create_future()
+    outcomes = [DeadLettered(RuntimeError("sink down"), ack), RuntimeError("sink and DLQ down")]
+
+    async def send(batch):
+        raise outcomes.pop(0)
+
+    flusher = BatchFlusher(JsonBatchEncoder(), send, max_size=1, max_bytes=1 << 20, interval=60, on_flushed=tracker.done_many)
+    for offset in range(2):
+        tracker.track(A, offset)
+    await flusher.add({"n": 0}, position=(A, 0))
+    await flusher.add({"n": 1}, position=(A, 1))
+    assert tracker.committable() == {}
+
+    ack.set_result(None)
+    await asyncio.sleep(0)
+
+    assert tracker.committable() == {A: 1}  # offset 1 was neither delivered nor dead-lettered
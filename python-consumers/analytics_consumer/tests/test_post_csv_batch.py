@@ -4,12 +4,6 @@ import pytest
 
 from analytics_consumer.main import post_csv_batch
 
-class FakeProducer:
-    def __init__(self):
-        self.sent = []
-    async def send_and_wait(self, topic, value):
-        self.sent.append((topic, value))
-
 class OkTransport:
     def __init__(self, status=200):
         self.status = status
@@ -18,14 +12,13 @@ class OkTransport:
         return httpx.Response(self.status, request=request)
 
 @pytest.mark.asyncio
-async def test_post_csv_batch_success(monkeypatch):
+async def test_post_csv_batch_success(monkeypatch, producer):
     # Arrange a transport that returns 200 OK
     import httpx
     transport = httpx.MockTransport(lambda req: httpx.Response(200, request=req))
     orig_client = httpx.AsyncClient
     monkeypatch.setattr(httpx, 'AsyncClient', lambda **kwargs: orig_client(transport=transport))
 
-    producer = FakeProducer()
     payload_csv = "type,customer_id\ncustomer_update,c1\n"
 
     # Act
@@ -35,14 +28,13 @@ async def test_post_csv_batch_success(monkeypatch):
     assert producer.sent == []
 
 @pytest.mark.asyncio
-async def test_post_csv_batch_failure_goes_to_dlq(monkeypatch):
+async def test_post_csv_batch_failure_goes_to_dlq(monkeypatch, producer):
     # Arrange a transport that returns 500
     import httpx
     transport = httpx.MockTransport(lambda req: httpx.Response(500, request=req))
     orig_client = httpx.AsyncClient
     monkeypatch.setattr(httpx, 'AsyncClient', lambda **kwargs: orig_client(transport=transport))
 
-    producer = FakeProducer()
     payload_csv = "type,customer_id\ncustomer_update,c1\n"
 
     # Act: should raise and publish to DLQ
@@ -55,3 +47,26 @@ async def test_post_csv_batch_failure_goes_to_dlq(monkeypatch):
     assert topic == "analytics_dlq"
     envelope = json.loads(value.decode("utf-8"))
     assert envelope["error"].startswith("analytics_http_")
+
+@pytest.mark.asyncio
+async def test_post_csv_batch_reuses_shared_client(producer):
+    # Arrange a pooled client built by the consumer with an injected transport
+    import httpx
+    from analytics_consumer.main import build_http_client
+    seen = []
+    def handler(req):
+        seen.append(req.headers["content-type"])
+        return httpx.Response(200, request=req)
+    client = build_http_client(transport=httpx.MockTransport(handler))
+
+    payload_csv = "type,customer_id\ncustomer_update,c1\n"
+
+    # Act: two posts over the same client
+    await post_csv_batch(payload_csv, "http://example/analytics/upload", producer, "analytics_dlq", client=client)
+    await post_csv_batch(payload_csv, "http://example/analytics/upload", producer, "analytics_dlq", client=client)
+
+    # Assert: the shared client stays open for the consumer lifecycle
+    assert seen == ["text/csv", "text/csv"]
+    assert producer.sent == []
+    assert not client.is_closed
+    await client.aclose()
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from prometheus_client import REGISTRY
+
+from analytics_consumer.profiling import LoopLagMonitor, StackSampler, start_profile_server
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_records_blocked_loop():
+    before = REGISTRY.get_sample_value("consumer_event_loop_lag_seconds_bucket", {"le": "0.1"}) or 0.0
+    total_before = REGISTRY.get_sample_value("consumer_event_loop_lag_seconds_count") or 0.0
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    busy_wait(0.2)  # holds the loop: the pending wake-up is ~0.2s late
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    total = REGISTRY.get_sample_value("consumer_event_loop_lag_seconds_count") - total_before
+    fast = REGISTRY.get_sample_value("consumer_event_loop_lag_seconds_bucket", {"le": "0.1"}) - before
+    assert total >= 2
+    assert fast < total  # at least one observation above 100ms
+    assert REGISTRY.get_sample_value("consumer_event_loop_lag_max_seconds") >= 0.15
+
+def test_stack_sampler_finds_hot_function_in_other_thread():
+    worker = threading.Thread(target=busy_wait, args=(0.3,))
+    worker.start()
+    sampler = StackSampler({worker.ident}, interval=0.002)
+    sampler.run(0.2)
+    worker.join()
+
+    assert sampler.samples > 10
+    top_fn, count = sampler.top_functions(1)[0]
+    assert top_fn.startswith("busy_wait (test_profiling.py")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in sampler.folded().splitlines())
+
+def test_profile_endpoint_samples_target_thread():
+    worker = threading.Thread(target=busy_wait, args=(0.5,))
+    worker.start()
+    server = start_profile_server(0, addr="127.0.0.1", loop_thread_id=worker.ident)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/debug/profile?seconds=0.2&interval_ms=2") as resp:
+            body = resp.read().decode()
+        assert body.startswith("samples=")
+        assert "busy_wait (test_profiling.py" in body.split("self samples:")[1]
+
+        with urllib.request.urlopen(f"{base}/debug/profile?seconds=0.1&format=folded") as resp:
+            assert "busy_wait" in resp.read().decode()
+
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(f"{base}/debug/profile?seconds=abc")
+        assert err.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        worker.join()
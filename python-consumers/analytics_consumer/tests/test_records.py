@@ -0,0 +1,49 @@
+import pytest
+
+from analytics_consumer import records
+from analytics_consumer.records import MalformedPayload, PayloadSchema
+
+@pytest.fixture(params=["msgspec", "stdlib"])
+def schemas(request, monkeypatch):
+    if request.param == "msgspec":
+        pytest.importorskip("msgspec")
+    else:
+        monkeypatch.setattr(records, "msgspec", None)
+    # rebuilt so the decoder choice follows the patched module state
+    return (
+        PayloadSchema("Customer", records.CUSTOMER_SCHEMA.fields),
+        PayloadSchema("Product", records.PRODUCT_SCHEMA.fields),
+    )
+
+def test_projects_declared_fields_only(schemas):
+    customer, product = schemas
+    value = b'{"id": "c1", "status": "active", "email": null, "address": {"city": "X"}, "tags": [1, 2]}'
+    assert customer.decode(value) == {"id": "c1", "status": "active"}
+    assert product.decode(b'{"product_id": "p1", "sku": "S", "qty": 0, "name": "n"}') == {"product_id": "p1", "sku": "S", "qty": 0}
+
+@pytest.mark.parametrize("value, reason", [
+    (b"not json", "invalid_json"),
+    (b"\xff\xfe", "invalid_json"),
+    (b"[1, 2]", "schema"),
+    (b'{"status": "active"}', "schema"),  # missing id
+    (b'{"id": ""}', "schema"),
+    (b'{"id": 7}', "schema"),
+    (b'{"id": "c1", "status": 1}', "schema"),
+])
+def test_rejects_malformed_customers(schemas, value, reason):
+    customer, _ = schemas
+    with pytest.raises(MalformedPayload) as err:
+        customer.decode(value)
+    assert err.value.reason == reason
+
+@pytest.mark.parametrize("qty", [b'"3"', b"3.5", b"true", str(2**70).encode(), str(-(2**63) - 1).encode()])
+def test_product_qty_must_be_an_integer(schemas, qty):
+    _, product = schemas
+    with pytest.raises(MalformedPayload) as err:
+        product.decode(b'{"product_id": "p1", "qty": ' + qty + b"}")
+    assert err.value.reason == "schema"
+
+@pytest.mark.parametrize("qty", [2**63 - 1, -(2**63)])
+def test_product_qty_accepts_the_full_64_bit_range(schemas, qty):
+    _, product = schemas
+    assert product.decode(b'{"product_id": "p1", "qty": %d}' % qty)["qty"] == qty
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+
+from analytics_consumer.encoders import EncodedBatch
+from analytics_consumer.main import post_batch, post_json_event
+from analytics_consumer.resilience import (
+    CircuitBreaker,
+    DeadLettered,
+    DlqPublisher,
+    DlqPublishError,
+    RetryPolicy,
+    SinkHTTPError,
+    call_with_retry,
+)
+
+NO_WAIT = RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.01, rng=lambda: 0.0)
+
+class FakeProducer:
+    """send() queues and returns an ack future, like AIOKafkaProducer."""
+    def __init__(self):
+        self.sent = []
+        self.acks = []
+    async def send(self, topic, value, key=None):
+        fut = asyncio.get_running_loop().create_future()
+        self.sent.append((topic, value, key))
+        self.acks.append(fut)
+        return fut
+    async def send_and_wait(self, topic, value, key=None):
+        raise AssertionError("DLQ must not await each envelope")
+
+def _client(statuses):
+    calls = []
+    def handler(req):
+        calls.append(req)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1], request=req)
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+def test_backoff_is_jittered_exponential_and_capped():
+    policy = RetryPolicy(attempts=5, base_delay=0.5, max_delay=3.0, rng=lambda: 1.0)
+    assert [policy.backoff(n) for n in range(4)] == [0.5, 1.0, 2.0, 3.0]
+    assert RetryPolicy(rng=lambda: 0.25).backoff(0) == pytest.approx(0.05)
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_before_dead_lettering():
+    client, calls = _client([503, 502, 200])
+    producer = FakeProducer()
+    batch = EncodedBatch.from_text("type,customer_id\ncustomer_update,c1\n")
+    await post_batch(batch, "http://sink/analytics/upload", producer, "dlq", client=client, retry=NO_WAIT, dlq=DlqPublisher(producer, "dlq"))
+    assert len(calls) == 3
+    assert producer.sent == []
+
+    # A rejected payload is not retried
+    client, calls = _client([400])
+    with pytest.raises(DeadLettered) as err:
+        await post_batch(batch, "http://sink/analytics/upload", producer, "dlq", client=client, retry=NO_WAIT, dlq=DlqPublisher(producer, "dlq"))
+    assert isinstance(err.value.error, SinkHTTPError)
+    assert err.value.ack is producer.acks[0]
+    assert len(calls) == 1
+    assert json.loads(producer.sent[0][1])["error"] == "analytics_http_400"
+
+@pytest.mark.asyncio
+async def test_dlq_envelopes_are_sent_without_waiting_for_acks():
+    client, _ = _client([500])
+    producer = FakeProducer()
+    dlq = DlqPublisher(producer, "dlq")
+    for i in range(3):
+        await post_json_event(client, "http://sink/analytics/data", producer, "dlq", "customer_data", f"c{i}", f"c{i}".encode(), {"n": i}, dlq=dlq)
+    assert [key for _, _, key in producer.sent] == [b"c0", b"c1", b"c2"]
+    assert len(dlq) == 3
+
+    flushed = asyncio.create_task(dlq.flush())
+    await asyncio.sleep(0)
+    assert not flushed.done()
+    for fut in producer.acks:
+        fut.set_result(None)
+    await flushed
+    assert len(dlq) == 0
+
+@pytest.mark.asyncio
+async def test_dlq_flush_raises_for_unacknowledged_envelopes():
+    producer = FakeProducer()
+    dlq = DlqPublisher(producer, "dlq")
+    ok = await dlq.publish(b"a")
+    lost = await dlq.publish(b"b")
+    ok.set_result(None)
+    lost.set_exception(ConnectionError("broker down"))
+
+    with pytest.raises(DlqPublishError, match="1 DLQ envelopes"):
+        await dlq.flush()
+    await dlq.flush()  # reported once
+
+@pytest.mark.asyncio
+async def test_post_batch_raises_the_delivery_error_when_the_dlq_fails_too():
+    class DownProducer:
+        async def send_and_wait(self, topic, value, key=None):
+            raise ConnectionError("broker down")
+
+    client, _ = _client([400])
+    batch = EncodedBatch.from_text("type,customer_id\ncustomer_update,c1\n")
+    with pytest.raises(SinkHTTPError):
+        await post_batch(batch, "http://sink/analytics/upload", DownProducer(), "dlq", client=client)
+
+@pytest.mark.asyncio
+async def test_breaker_opens_holds_callers_and_closes_after_a_good_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    async def failing():
+        raise SinkHTTPError(503)
+    for _ in range(2):
+        with pytest.raises(SinkHTTPError):
+            await call_with_retry(failing, breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.is_open
+
+    probes = 0
+    async def ok():
+        nonlocal probes
+        probes += 1
+        await asyncio.sleep(0.01)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(*(call_with_retry(ok, breaker=breaker) for _ in range(3)))
+    assert loop.time() - started >= 0.04
+    assert probes == 3
+    assert breaker.state == CircuitBreaker.CLOSED and not breaker.is_open
+
+    # A failed probe re-opens at once
+    breaker.record_failure()
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+    with pytest.raises(SinkHTTPError):
+        await call_with_retry(failing, breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_breaker_turns_half_open_after_timeout_without_a_caller():
+    # The paused consume loop only polls is_open; nothing calls acquire() meanwhile
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.is_open
+
+    time.sleep(0.06)
+
+    assert not breaker.is_open
+    assert breaker.state == CircuitBreaker.HALF_OPEN
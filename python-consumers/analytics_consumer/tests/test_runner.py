@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+from analytics_consumer.runner import build_metrics_registry, prepare_metrics_dir
+
+def _count_in_worker(n):
+    # Runs in a spawned process, like a consumer worker
+    from prometheus_client import Counter, Gauge
+    Counter("runner_test_messages_total", "test").inc(n)
+    Gauge("runner_test_in_flight", "test").set(n)
+
+def test_worker_metrics_are_aggregated_on_one_registry(tmp_path, monkeypatch):
+    metrics_dir = tmp_path / "metrics"
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(metrics_dir))
+    metrics_dir.mkdir()
+    (metrics_dir / "counter_stale.db").write_bytes(b"")  # left over from a previous run
+    assert prepare_metrics_dir() == str(metrics_dir)
+    assert os.listdir(metrics_dir) == []
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_count_in_worker, args=(n,)) for n in (2, 3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+
+    registry = build_metrics_registry()
+    assert registry.get_sample_value("runner_test_messages_total") == 5
+    per_pid = {s.labels["pid"]: s.value for m in registry.collect() if m.name == "runner_test_in_flight" for s in m.samples}
+    assert sorted(per_pid.values()) == [2, 3]
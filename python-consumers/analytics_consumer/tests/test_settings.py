@@ -0,0 +1,48 @@
+import dataclasses
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from analytics_consumer.settings import Settings
+
+def test_from_env_parses_types_and_falls_back_to_defaults():
+    settings = Settings.from_env({
+        "ANALYTICS_MODE": "NDJSON",
+        "BATCH_MAX_SIZE": "200",
+        "CSV_GZIP": "yes",
+        "FLUSH_INTERVAL_SECS": "2.5",
+        "LOW_STOCK_THRESHOLDS": "5, 20,",
+        "BATCH_ADAPTIVE": "false",
+    })
+
+    assert settings.analytics_mode == "ndjson"
+    assert settings.batch_max_size == 200
+    assert settings.batch_gzip is True
+    assert settings.flush_interval_secs == 2.5
+    assert settings.low_stock_thresholds == (5, 20)
+    assert settings.batch_adaptive is False
+    assert settings.customer_topic == "customer_data"
+    assert settings.worker_index is None
+    assert Settings.from_env({"BATCH_GZIP": "false", "CSV_GZIP": "true"}).batch_gzip is False
+
+def test_worker_index_gives_each_worker_its_own_state_files():
+    settings = Settings.from_env({"CONSUMER_WORKER_INDEX": "2", "SNAPSHOT_PATH": "/data/snap", "STATE_SPILL_PATH": ""})
+
+    assert settings.worker_index == 2
+    assert settings.snapshot_path == "/data/snap.w2"
+    assert settings.state_spill_path == ""
+
+def test_validate_rejects_unknown_mode():
+    Settings().validate()
+    with pytest.raises(ValueError, match="ANALYTICS_MODE=xml"):
+        dataclasses.replace(Settings(), analytics_mode="xml").validate()
+    with pytest.raises(ValueError, match="WINDOW_LATE_POLICY=keep"):
+        Settings.from_env({"WINDOW_SECS": "60", "WINDOW_LATE_POLICY": "KEEP"}).validate()
+
+def test_importing_main_leaves_client_libraries_unloaded():
+    # A fresh interpreter: the test session has already imported everything
+    code = "import sys, analytics_consumer.main; print(','.join(m for m in ('aiokafka', 'redis', 'httpx') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[2], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
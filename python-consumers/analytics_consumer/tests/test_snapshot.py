@@ -0,0 +1,92 @@
+import pytest
+from aiokafka import TopicPartition
+
+from analytics_consumer.snapshot import RestoreRebalanceListener, load_snapshot, write_snapshot
+from analytics_consumer.state import JoinState, SqliteSpill
+
+def _populated_state(**kwargs):
+    state = JoinState([20, 5], **kwargs)
+    for i in range(50):
+        state.upsert_customer(f"c{i}", {"id": f"c{i}", "status": "active" if i % 2 else "inactive"})
+        state.upsert_product(f"p{i}", {"product_id": f"p{i}", "sku": f"SKU-{i}", "qty": i})
+    state.upsert_product("p-none", {"product_id": "p-none", "qty": "unknown"})
+    return state
+
+def test_snapshot_round_trip_restores_records_aggregates_and_offsets(tmp_path):
+    path = str(tmp_path / "state.snap")
+    # Spilled records must be included in the snapshot too
+    original = _populated_state(max_products=10, spill=SqliteSpill(":memory:"))
+    offsets = {("customer_data", 0): 120, ("inventory_data", 1): 7}
+    assert write_snapshot(path, original, offsets) > 0
+
+    restored = JoinState([20, 5])
+    assert load_snapshot(path, restored) == offsets
+    assert restored.inventory_summary() == original.inventory_summary()
+    assert restored.customer_summary() == {"total_customers": 50}
+    prev = restored.upsert_product("p3", {"sku": "SKU-3", "qty": 40})
+    assert (prev.sku, prev.qty) == ("SKU-3", 3)
+    assert restored.upsert_product("p-none", {"qty": 1}).qty is None
+    assert restored.upsert_customer("c1", {"status": "gone"}).status == "active"
+
+    # Bounded targets go through the eviction/spill path
+    bounded = JoinState([20, 5], max_customers=5, max_products=5, spill=SqliteSpill(":memory:"))
+    assert load_snapshot(path, bounded) == offsets
+    assert bounded.inventory_summary() == original.inventory_summary()
+    assert len(bounded.products.resident) == 5
+
+def test_load_snapshot_missing_or_corrupt_leaves_state_empty(tmp_path):
+    state = JoinState()
+    assert load_snapshot(str(tmp_path / "missing.snap"), state) is None
+
+    path = tmp_path / "state.snap"
+    write_snapshot(str(path), _populated_state(), {})
+    path.write_bytes(path.read_bytes()[:-20])
+    assert load_snapshot(str(path), state) is None
+    assert state.inventory_summary() == {"total_products": 0, "low_stock_count": 0}
+
+class FakeConsumer:
+    def __init__(self, committed):
+        self._committed = committed
+        self.seeks = {}
+    async def committed(self, tp):
+        return self._committed.get(tp)
+    def seek(self, tp, offset):
+        self.seeks[tp] = offset
+
+@pytest.mark.asyncio
+async def test_restore_listener_seeks_back_once_and_marks_replay_window():
+    behind = TopicPartition("customer_data", 0)
+    fresh = TopicPartition("customer_data", 1)
+    caught_up = TopicPartition("inventory_data", 0)
+    unknown = TopicPartition("inventory_data", 1)
+    consumer = FakeConsumer({behind: 150, fresh: None, caught_up: 40, unknown: 3})
+    listener = RestoreRebalanceListener(consumer, {
+        ("customer_data", 0): 100,
+        ("customer_data", 1): 10,
+        ("inventory_data", 0): 40,
+    })
+
+    await listener.on_partitions_assigned({behind, fresh, caught_up, unknown})
+    # nothing committed on `fresh`: its snapshot offset says nothing about delivery
+    assert consumer.seeks == {behind: 100}
+    assert listener.replay_until == {("customer_data", 0): 150}
+
+    # A later rebalance resumes from committed offsets
+    consumer.seeks.clear()
+    await listener.on_partitions_assigned({behind})
+    assert consumer.seeks == {}
+
+@pytest.mark.asyncio
+async def test_restore_listener_runs_revoke_hook_and_closes_replay_window():
+    revoked_seen = []
+    async def on_revoke(revoked):
+        revoked_seen.append(set(revoked))
+    tp = TopicPartition("customer_data", 0)
+    consumer = FakeConsumer({tp: 150})
+    listener = RestoreRebalanceListener(consumer, {("customer_data", 0): 100}, on_revoke=on_revoke)
+    await listener.on_partitions_assigned({tp})
+    assert listener.replay_until == {("customer_data", 0): 150}
+
+    await listener.on_partitions_revoked({tp})
+    assert revoked_seen == [{tp}]
+    assert listener.replay_until == {}
@@ -0,0 +1,72 @@
+import pytest
+
+from analytics_consumer.state import JoinState, ProductRecord, SqliteSpill
+
+def test_join_state_aggregates_track_upserts():
+    state = JoinState([20, 5])
+    state.upsert_product("p1", {"product_id": "p1", "qty": 3})
+    state.upsert_product("p2", {"product_id": "p2", "qty": 10})
+    state.upsert_product("p3", {"product_id": "p3", "qty": 50})
+    state.upsert_product("p4", {"product_id": "p4", "qty": "n/a"})
+
+    assert state.inventory_summary() == {
+        "total_products": 4,
+        "low_stock_count": 2,
+        "low_stock_counts": {"20": 2, "5": 1},
+    }
+
+    # Restock p1 and drain p3: counts move, totals do not
+    state.upsert_product("p1", {"product_id": "p1", "qty": 30})
+    state.upsert_product("p3", {"product_id": "p3", "qty": 0})
+    assert state.inventory_summary()["low_stock_counts"] == {"20": 2, "5": 1}
+    assert state.inventory_summary()["low_stock_count"] == 2
+
+    state.upsert_customer("c1", {"id": "c1"})
+    state.upsert_customer("c1", {"id": "c1", "status": "inactive"})
+    state.upsert_customer("c2", {"id": "c2"})
+    assert state.customer_summary() == {"total_customers": 2}
+
+def test_join_state_single_threshold_keeps_legacy_summary_shape():
+    state = JoinState()
+    state.upsert_product("p1", {"qty": 19})
+    assert state.inventory_summary() == {"total_products": 1, "low_stock_count": 1}
+
+def test_join_state_requires_threshold():
+    with pytest.raises(ValueError):
+        JoinState([])
+
+def test_join_state_stores_compact_records():
+    state = JoinState()
+    state.upsert_product("p1", {"product_id": "p1", "sku": "SKU-1", "qty": 4, "extra": "x" * 1000})
+    prev = state.upsert_product("p1", {"product_id": "p1", "sku": "SKU-1", "qty": 7})
+    assert isinstance(prev, ProductRecord)
+    assert (prev.sku, prev.qty) == ("SKU-1", 4)
+    assert not hasattr(prev, "__dict__")
+
+def test_join_state_eviction_without_spill_forgets_records():
+    state = JoinState([20], max_products=2)
+    state.upsert_product("p1", {"qty": 1})
+    state.upsert_product("p2", {"qty": 50})
+    state.upsert_product("p3", {"qty": 2})  # evicts p1
+    assert state.inventory_summary() == {"total_products": 2, "low_stock_count": 1}
+    assert state.upsert_product("p1", {"qty": 1}) is None
+
+def test_join_state_spill_keeps_aggregates_exact():
+    spill = SqliteSpill(":memory:")
+    state = JoinState([20], max_customers=1, max_products=1, spill=spill)
+    for i in range(5):
+        state.upsert_product(f"p{i}", {"sku": f"SKU-{i}", "qty": i * 10})
+        state.upsert_customer(f"c{i}", {"id": f"c{i}", "status": "active"})
+    assert state.inventory_summary() == {"total_products": 5, "low_stock_count": 2}
+    assert state.customer_summary() == {"total_customers": 5}
+    assert len(state.products.resident) == 1
+
+    # p0 comes back from disk; its old qty is subtracted from the low-stock count
+    prev = state.upsert_product("p0", {"sku": "SKU-0", "qty": 99})
+    assert (prev.sku, prev.qty) == ("SKU-0", 0)
+    assert state.inventory_summary() == {"total_products": 5, "low_stock_count": 1}
+    assert state.upsert_customer("c0", {"id": "c0", "status": "inactive"}).status == "active"
+    assert state.customer_summary() == {"total_customers": 5}
+
+    state.publish_metrics()
+    state.close()
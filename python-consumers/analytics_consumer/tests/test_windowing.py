@@ -0,0 +1,164 @@
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from analytics_consumer.windowing import WindowAggregator
+
+class Emitted:
+    def __init__(self):
+        self.windows = []  # (rows, positions, window_end)
+
+    async def __call__(self, rows, positions, window_end):
+        self.windows.append((rows, positions, window_end))
+
+    @property
+    def rows(self):
+        return [row for rows, _, _ in self.windows for row in rows]
+
+    @property
+    def positions(self):
+        return [p for _, positions, _ in self.windows for p in positions]
+
+def pos(offset):
+    return (("t", 0), offset)
+
+@pytest.mark.asyncio
+async def test_tumbling_window_summarises_each_key_once_and_closes_on_watermark():
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, allowed_lateness=0, low_stock_threshold=20)
+
+    await window.add_customer("c-1", None, "active", 100.0, pos(0))
+    await window.add_customer("c-1", "active", "inactive", 101.0, pos(1))
+    await window.add_customer("c-1", "inactive", "inactive", 102.0, pos(2))
+    await window.add_product("p-1", "SKU-1", 50, 10, 103.0, pos(3))
+    await window.add_product("p-2", "SKU-1", None, 30, 104.0, pos(4))
+    await window.add_product("p-3", None, 15, 25, 105.0, pos(5))
+    assert emitted.windows == []
+    assert len(window) == 1 and window.keys == 3
+
+    await window.add_customer("c-2", None, "active", 110.0, pos(6))  # watermark reaches 110: [100, 110) is final
+
+    rows, positions, end = emitted.windows[0]
+    assert end == 110.0
+    assert positions == [pos(i) for i in range(6)]
+    by_key = {row.get("customer_id") or row["sku"]: row for row in rows}
+    assert by_key["c-1"] == {
+        "type": "customer_window",
+        "window_start": "1970-01-01T00:01:40Z",
+        "window_end": "1970-01-01T00:01:50Z",
+        "customer_id": "c-1",
+        "events": 3,
+        "status_from": None,
+        "status_to": "inactive",
+        "status_changes": 2,
+    }
+    assert by_key["SKU-1"]["net_qty_change"] == -40 + 30
+    assert by_key["SKU-1"]["low_stock_entered"] == 1
+    assert by_key["p-3"]["low_stock_left"] == 1
+    assert len(window) == 1 and window.keys == 1
+
+@pytest.mark.asyncio
+async def test_sliding_windows_release_positions_with_the_last_covering_window():
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, slide=5, allowed_lateness=0)
+
+    assert window.window_starts(12.0) == [5.0, 10.0]
+    await window.add_customer("c-1", None, "active", 12.0, pos(0))
+    await window.add_customer("c-1", "active", "inactive", 16.0, pos(1))
+    await window.flush("shutdown")
+
+    assert [(end, positions) for _, positions, end in emitted.windows] == [(15.0, []), (20.0, [pos(0)]), (25.0, [pos(1)])]
+    assert [rows[0]["events"] for rows, _, _ in emitted.windows] == [1, 2, 1]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["drop", "emit"])
+async def test_late_updates_are_dropped_or_emitted_on_their_own(policy):
+    def late(action):
+        return REGISTRY.get_sample_value("analytics_window_late_events_total", {"action": action}) or 0.0
+
+    before = late(policy)
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, allowed_lateness=2, late_policy=policy)
+    await window.add_customer("c-1", None, "active", 100.0, pos(0))
+    await window.add_customer("c-2", None, "active", 111.0, pos(1))  # within lateness: [100, 110) still open
+    await window.add_customer("c-3", None, "active", 108.0, pos(2))
+    await window.add_customer("c-4", None, "active", 113.0, pos(3))  # watermark 111 closes it
+
+    assert [row["customer_id"] for row in emitted.rows] == ["c-1", "c-3"]
+    kept = await window.add_customer("c-5", None, "active", 105.0, pos(4))
+
+    assert late(policy) - before == 1
+    if policy == "drop":
+        assert kept is False
+        assert len(emitted.windows) == 1
+    else:
+        assert kept is True
+        rows, positions, end = emitted.windows[-1]
+        assert rows[0]["customer_id"] == "c-5" and rows[0]["late"] is True
+        assert positions == [pos(4)] and end == 110.0
+    assert window.keys == 2
+
+@pytest.mark.asyncio
+async def test_watermark_is_the_minimum_across_partitions():
+    def at(partition, offset):
+        return (("t", partition), offset)
+
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, allowed_lateness=0)
+    await window.add_customer("c-1", None, "active", 100.0, at(0, 0))
+    await window.add_customer("c-2", None, "active", 200.0, at(1, 0))  # partition 1 is far ahead
+    assert emitted.windows == []
+
+    # partition 0 is still behind: its update is not late
+    assert await window.add_customer("c-3", None, "active", 105.0, at(0, 1))
+    assert window.keys == 3
+    await window.add_customer("c-4", None, "active", 110.0, at(0, 2))
+
+    rows, positions, end = emitted.windows[0]
+    assert end == 110.0
+    assert [row["customer_id"] for row in rows] == ["c-1", "c-3"]
+    assert positions == [at(0, 0), at(0, 1)]
+
+    # once partition 0 is revoked, partition 1 alone drives the watermark
+    window.forget([("t", 0)])
+    await window.close_due()
+    assert [end for _, _, end in emitted.windows] == [110.0, 120.0]
+
+@pytest.mark.asyncio
+async def test_state_bound_emits_oldest_window_early_and_later_updates_reopen_it():
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, allowed_lateness=100, max_keys=2)
+
+    await window.add_customer("c-1", None, "active", 100.0, pos(0))
+    await window.add_customer("c-2", None, "active", 101.0, pos(1))
+    assert emitted.windows == []
+    await window.add_customer("c-3", None, "active", 112.0, pos(2))  # 3 keys: [100, 110) goes early
+
+    assert [row["customer_id"] for row in emitted.rows] == ["c-1", "c-2"]
+    assert window.keys == 1
+    assert await window.add_customer("c-1", "active", "inactive", 103.0, pos(3))  # not late: reopens
+
+    assert len(window) == 2
+
+@pytest.mark.asyncio
+async def test_watermark_advances_with_wall_time_when_idle():
+    emitted = Emitted()
+    window = WindowAggregator(emitted, size=10, allowed_lateness=1)
+    await window.add_customer("c-1", None, "active", 100.0, pos(0))
+
+    await window.close_due(now=time.monotonic() + 5)
+    assert emitted.windows == []
+    await window.close_due(now=time.monotonic() + 12)
+
+    assert emitted.positions == [pos(0)]
+    assert len(window) == 0
+
+def test_rejects_invalid_configuration():
+    async def emit(rows, positions, end):
+        pass
+
+    with pytest.raises(ValueError, match="slide"):
+        WindowAggregator(emit, size=10, slide=20)
+    with pytest.raises(ValueError, match="late policy"):
+        WindowAggregator(emit, size=10, late_policy="keep")
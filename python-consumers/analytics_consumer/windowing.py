@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger("analytics_consumer")
+
+WINDOW_OPEN = Gauge("analytics_window_open", "Aggregation windows currently open")
+WINDOW_KEYS = Gauge("analytics_window_keys", "Per-key aggregates held across open windows")
+WINDOW_CLOSES = Counter("analytics_window_closes_total", "Aggregation windows emitted by trigger", ["reason"])
+WINDOW_ROWS = Counter("analytics_window_rows_total", "Summary rows emitted by aggregation windows", ["type"])
+WINDOW_LATE = Counter("analytics_window_late_events_total", "Events that arrived after their window was emitted", ["action"])
+
+LATE_POLICIES = ("drop", "emit")
+
+# emit(rows, positions, window_end): deliver a closed window's summary rows; the positions
+# of the events it covers may be committed once the rows are delivered or dead-lettered
+EmitFn = Callable[[list, list, float], Awaitable[None]]
+
+
+class _CustomerAgg:
+    __slots__ = ("events", "status_from", "status_to", "changes")
+
+    def __init__(self, status_from: Optional[str]):
+        self.events = 0
+        self.status_from = status_from
+        self.status_to = status_from
+        self.changes = 0
+
+    def add(self, prev: Optional[str], status: Optional[str]) -> None:
+        self.events += 1
+        if status != prev:
+            self.changes += 1
+        self.status_to = status
+
+
+class _SkuAgg:
+    __slots__ = ("events", "net_qty", "low_entered", "low_left")
+
+    def __init__(self):
+        self.events = 0
+        self.net_qty = 0
+        self.low_entered = 0
+        self.low_left = 0
+
+    def add(self, prev: Optional[int], qty: Optional[int], threshold: int) -> None:
+        self.events += 1
+        if qty is None:
+            return
+        # a product seen for the first time brings its whole quantity
+        self.net_qty += qty - (prev or 0)
+        was_low = prev is not None and prev < threshold
+        if qty < threshold and not was_low:
+            self.low_entered += 1
+        elif qty >= threshold and was_low:
+            self.low_left += 1
+
+
+class _Window:
+    __slots__ = ("start", "end", "customers", "skus", "positions")
+
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.customers: dict[str, _CustomerAgg] = {}
+        self.skus: dict[str, _SkuAgg] = {}
+        self.positions: list = []
+
+    def __len__(self) -> int:
+        return len(self.customers) + len(self.skus)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class WindowAggregator:
+    """Event-time windows that pre-aggregate merged updates into one summary row per key.
+
+    Windows are `size` seconds long and start every `slide` seconds (tumbling when
+    `slide == size`, sliding/hopping when smaller), aligned to the epoch. Per window
+    it keeps, for each customer, the status before its first update and after its
+    last one plus the number of changes, and for each SKU (product id when an update
+    has none) the net quantity change and how often it entered or left low stock.
+
+    Each partition (taken from the event's position) has its own watermark trailing
+    its newest event timestamp by `allowed_lateness`; while a partition gets no
+    events its watermark advances with wall time, so a quiet partition does not hold
+    windows open. The aggregator's watermark is the minimum across partitions, so a
+    partition that is behind (e.g. catching up on lag) does not see its updates
+    turned late by a faster one. A window is emitted once the watermark passes its
+    end. An update for a window that was already emitted is late: `emit` sends it at
+    once as a single-update summary row marked `late`, `drop` counts and discards it.
+
+    State is bounded: when more than `max_windows` windows are open or they hold
+    more than `max_keys` per-key aggregates, the oldest window is emitted early.
+    Early emission (capacity, rebalance) does not make the window final: later
+    updates reopen it and produce another partial row, so the counts in summary rows
+    are additive. Each event's position is released with the last window covering it.
+    """
+
+    def __init__(
+        self,
+        emit: EmitFn,
+        size: float,
+        slide: Optional[float] = None,
+        allowed_lateness: float = 5.0,
+        late_policy: str = "emit",
+        max_windows: int = 64,
+        max_keys: int = 100000,
+        low_stock_threshold: int = 20,
+    ):
+        if size <= 0:
+            raise ValueError("window size must be positive")
+        slide = slide or size
+        if not 0 < slide <= size:
+            raise ValueError(f"window slide must be in (0, {size}], got {slide}")
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"unknown late policy {late_policy}; expected {', '.join(LATE_POLICIES)}")
+        self._emit = emit
+        self.size = size
+        self.slide = slide
+        self.allowed_lateness = max(0.0, allowed_lateness)
+        self.late_policy = late_policy
+        self.max_windows = max(1, max_windows)
+        self.max_keys = max(1, max_keys)
+        self.low_stock_threshold = low_stock_threshold
+        self._windows: dict[float, _Window] = {}  # start -> window, opened in any order
+        self._keys = 0
+        self._frontier = -math.inf  # highest watermark applied: windows ending at or before it are final
+        # partition -> (newest event timestamp, monotonic time it arrived)
+        self._partitions: dict[Any, tuple[float, float]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    @property
+    def keys(self) -> int:
+        return self._keys
+
+    def watermark(self, now: Optional[float] = None) -> float:
+        if not self._partitions:
+            return -math.inf
+        now = time.monotonic() if now is None else now
+        return min(ts + max(0.0, now - seen_at) for ts, seen_at in self._partitions.values()) - self.allowed_lateness
+
+    def forget(self, partitions: Iterable[Any]) -> None:
+        """Stop holding the watermark back for revoked partitions."""
+        for partition in partitions:
+            self._partitions.pop(partition, None)
+
+    def window_starts(self, ts: float) -> list[float]:
+        """Starts of the windows covering `ts`, oldest first."""
+        last = math.floor(ts / self.slide)
+        first = math.floor((ts - self.size) / self.slide) + 1
+        return [k * self.slide for k in range(first, last + 1)]
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def add_customer(self, key: str, prev_status: Optional[str], status: Optional[str], ts: Optional[float], position: Any = None) -> bool:
+        """Aggregate a customer update; False when it was dropped as late (its position is not kept)."""
+        return await self._add(ts, position, lambda w: self._customer(w, key, prev_status).add(prev_status, status))
+
+    async def add_product(self, key: str, sku: Optional[str], prev_qty: Optional[int], qty: Optional[int], ts: Optional[float], position: Any = None) -> bool:
+        """Aggregate a product update under its SKU; False when it was dropped as late."""
+        return await self._add(ts, position, lambda w: self._sku(w, sku or key).add(prev_qty, qty, self.low_stock_threshold))
+
+    def _customer(self, window: _Window, key: str, prev_status: Optional[str]) -> _CustomerAgg:
+        agg = window.customers.get(key)
+        if agg is None:
+            agg = window.customers[key] = _CustomerAgg(prev_status)
+            self._keys += 1
+        return agg
+
+    def _sku(self, window: _Window, sku: str) -> _SkuAgg:
+        agg = window.skus.get(sku)
+        if agg is None:
+            agg = window.skus[sku] = _SkuAgg()
+            self._keys += 1
+        return agg
+
+    async def _add(self, ts: Optional[float], position: Any, update: Callable[[_Window], None]) -> bool:
+        if ts is None:
+            ts = time.time()
+        partition = position[0] if position is not None else None
+        newest = self._partitions.get(partition)
+        if newest is None or ts > newest[0]:
+            self._partitions[partition] = (ts, time.monotonic())
+        late: list[_Window] = []
+        last: Optional[_Window] = None
+        for start in self.window_starts(ts):
+            if start + self.size <= self._frontier:
+                late.append(_Window(start, start + self.size))
+                continue
+            window = self._windows.get(start)
+            if window is None:
+                window = self._windows[start] = _Window(start, start + self.size)
+            update(window)
+            last = window
+        if last is not None and position is not None:
+            last.positions.append(position)
+        if late:
+            WINDOW_LATE.labels(action=self.late_policy).inc()
+            if self.late_policy == "emit":
+                for window in late:
+                    update(window)
+                self._keys -= sum(len(w) for w in late)
+                async with self._lock:
+                    for i, window in enumerate(late):
+                        # covered by no open window: the last correction carries the position
+                        positions = [position] if last is None and i == len(late) - 1 and position is not None else []
+                        await self._emit(self._rows(window, late=True), positions, window.end)
+        await self.close_due()
+        return last is not None or (bool(late) and self.late_policy == "emit")
+
+    async def close_due(self, now: Optional[float] = None) -> None:
+        """Emit windows the watermark has passed, then the oldest ones while over the state bounds."""
+        async with self._lock:
+            watermark = self.watermark(now)
+            while self._windows:
+                oldest = min(self._windows.values(), key=lambda w: w.end)
+                if oldest.end <= watermark:
+                    reason = "watermark"
+                elif len(self._windows) > self.max_windows or self._keys > self.max_keys:
+                    reason = "capacity"
+                else:
+                    break
+                await self._close(oldest, reason)
+            self._frontier = max(self._frontier, watermark)
+            self._publish()
+
+    async def flush(self, reason: str = "force") -> None:
+        """Emit every open window now (rebalance, shutdown)."""
+        async with self._lock:
+            for window in sorted(self._windows.values(), key=lambda w: w.end):
+                await self._close(window, reason)
+            self._publish()
+
+    async def _close(self, window: _Window, reason: str) -> None:
+        del self._windows[window.start]
+        self._keys -= len(window)
+        WINDOW_CLOSES.labels(reason=reason).inc()
+        rows = self._rows(window)
+        log.debug(f"window_closed start={_iso(window.start)} end={_iso(window.end)} reason={reason} rows={len(rows)} events={len(window.positions)}")
+        await self._emit(rows, window.positions, window.end)
+
+    def _rows(self, window: _Window, late: bool = False) -> list[dict]:
+        start, end = _iso(window.start), _iso(window.end)
+        rows = []
+        for key, c in window.customers.items():
+            rows.append({
+                "type": "customer_window",
+                "window_start": start,
+                "window_end": end,
+                "customer_id": key,
+                "events": c.events,
+                "status_from": c.status_from,
+                "status_to": c.status_to,
+                "status_changes": c.changes,
+            })
+        for sku, s in window.skus.items():
+            rows.append({
+                "type": "inventory_window",
+                "window_start": start,
+                "window_end": end,
+                "sku": sku,
+                "events": s.events,
+                "net_qty_change": s.net_qty,
+                "low_stock_entered": s.low_entered,
+                "low_stock_left": s.low_left,
+            })
+        if late:
+            for row in rows:
+                row["late"] = True
+        WINDOW_ROWS.labels(type="customer_window").inc(len(window.customers))
+        WINDOW_ROWS.labels(type="inventory_window").inc(len(window.skus))
+        return rows
+
+    def _publish(self) -> None:
+        WINDOW_OPEN.set(len(self._windows))
+        WINDOW_KEYS.set(self._keys)
+
+    async def _run(self) -> None:
+        tick = min(1.0, self.slide)
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await self.close_due()
+            except Exception as e:
+                log.error(f"window_close_failed error={e}")
+
+    async def stop(self) -> None:
+        """Stop the timer and emit every open window."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush("shutdown")
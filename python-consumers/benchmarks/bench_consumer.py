@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the analytics consumer.
+
+Drives the real `consume()` loop with in-memory stand-ins: a fake Kafka consumer and
+producer, fakeredis for idempotency and an httpx MockTransport sink. A synthetic mix
+of customer/inventory messages (with a share of exact duplicates) is replayed once
+per delivery mode, and the run reports:
+  - msgs/sec    fetched messages per second, including the final flush
+  - p50/p99     per-event latency from fetch to arrival at the sink
+  - peak_mb     peak Python heap during a second, traced run (tracemalloc)
+
+No docker-compose stack is needed, so it runs in CI; `--min-rate` makes the run fail
+when any mode falls below the given msgs/sec.
+
+Usage:
+  python python-consumers/benchmarks/bench_consumer.py --messages 20000 --dup-ratio 0.1
+  python python-consumers/benchmarks/bench_consumer.py --modes csv,ndjson --messages 5000 --min-rate 500
+"""
+import argparse
+import asyncio
+import csv
+import dataclasses
+import io
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+import httpx
+from aiokafka import TopicPartition
+from aiokafka.structs import ConsumerRecord
+from fakeredis import aioredis as fakeredis
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from analytics_consumer import main as consumer_main  # noqa: E402
+from analytics_consumer.settings import Settings  # noqa: E402
+
+MODES = ("json", "csv", "json_batch", "ndjson")
+PARTITIONS = 3
+
+
+def synthetic_messages(count: int, dup_ratio: float, customer_ratio: float, seed: int) -> list[tuple[str, bytes, bytes]]:
+    """(topic, key, value) triples; duplicates repeat the previous message of that topic verbatim."""
+    rng = random.Random(seed)
+    out = []
+    last = {}
+    for i in range(count):
+        if last and rng.random() < dup_ratio:
+            out.append(last[rng.choice(list(last))])
+            continue
+        if rng.random() < customer_ratio:
+            key = f"c-{i}"
+            value = {"id": key, "email": f"{key}@example.com", "name": f"User {i}", "status": rng.choice(["active", "inactive"])}
+            topic = Settings.customer_topic
+        else:
+            key = f"p-{i}"
+            value = {"product_id": key, "sku": f"SKU-{i}", "name": f"Product {i}", "qty": rng.randint(0, 100)}
+            topic = Settings.inventory_topic
+        msg = (topic, key.encode(), json.dumps(value).encode())
+        last[topic] = msg
+        out.append(msg)
+    return out
+
+
+class FakeKafkaConsumer:
+    """Serves pre-built messages through getmany() and records commits."""
+
+    def __init__(self, messages, fetched_at: dict):
+        self._queues: dict[TopicPartition, list] = {}
+        for topic, key, value in messages:
+            tp = TopicPartition(topic, zlib.crc32(key) % PARTITIONS)
+            self._queues.setdefault(tp, []).append((key, value))
+        self._next = {tp: 0 for tp in self._queues}
+        self._paused = set()
+        self._listener = None
+        self._fetched_at = fetched_at
+        self.drained = asyncio.Event()
+        self.commits = {}
+
+    def subscribe(self, topics, listener=None):
+        self._listener = listener
+
+    async def start(self):
+        if self._listener is not None:
+            await self._listener.on_partitions_assigned(set(self._queues))
+
+    async def stop(self):
+        pass
+
+    def assignment(self):
+        return set(self._queues)
+
+    def highwater(self, tp):
+        return len(self._queues[tp])
+
+    def pause(self, *tps):
+        self._paused.update(tps)
+
+    def resume(self, *tps):
+        self._paused.difference_update(tps)
+
+    async def committed(self, tp):
+        return None
+
+    def seek(self, tp, offset):
+        self._next[tp] = offset
+
+    async def commit(self, offsets):
+        self.commits.update(offsets)
+
+    def fully_committed(self) -> bool:
+        return self.commits == {tp: len(q) for tp, q in self._queues.items()}
+
+    async def getmany(self, timeout_ms=0, max_records=None):
+        out = {}
+        budget = max_records or 500
+        now = time.time()
+        for tp, queue in self._queues.items():
+            if tp in self._paused or budget <= 0:
+                continue
+            start = self._next[tp]
+            take = queue[start:start + budget]
+            if not take:
+                continue
+            self._next[tp] = start + len(take)
+            budget -= len(take)
+            records = []
+            for i, (key, value) in enumerate(take):
+                records.append(ConsumerRecord(tp.topic, tp.partition, start + i, int(now * 1000), 0, key, value, None, len(key), len(value), []))
+                self._fetched_at.setdefault(key, now)
+            out[tp] = records
+        if not out:
+            if all(self._next[tp] >= len(q) for tp, q in self._queues.items()):
+                self.drained.set()
+            await asyncio.sleep(min(timeout_ms, 10) / 1000)
+        return out
+
+
+class FakeKafkaProducer:
+    """send() acks immediately; counts what reached the DLQ.
+
+    With `down=True` every send fails (the ack future carries the error).
+    """
+
+    def __init__(self, down: bool = False):
+        self.sent = 0
+        self.down = down
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, topic, value, key=None):
+        fut = asyncio.get_running_loop().create_future()
+        if self.down:
+            fut.set_exception(ConnectionError("broker down"))
+            return fut
+        self.sent += 1
+        fut.set_result(None)
+        return fut
+
+    async def send_and_wait(self, topic, value, key=None):
+        if self.down:
+            raise ConnectionError("broker down")
+        self.sent += 1
+
+
+class Sink:
+    """MockTransport handler: parses every body and records per-event arrival.
+
+    The first `fail_first` POSTs are answered with 503, as by a sink that is down;
+    with `probe_down` the start-up probe fails to connect.
+    """
+
+    def __init__(self, fail_first: int = 0, probe_down: bool = False):
+        self.arrivals: dict[bytes, float] = {}
+        self.posts = 0
+        self.failed = 0
+        self._fail_first = fail_first
+        self._probe_down = probe_down
+
+    def _keys(self, request: httpx.Request):
+        body = request.content
+        ctype = request.headers.get("content-type", "")
+        if ctype.startswith("text/csv"):
+            for row in csv.DictReader(io.StringIO(body.decode("utf-8"))):
+                # window summary rows (WINDOW_SECS) carry customer_id or sku
+                yield row["customer_id"] or row.get("product_id") or row["sku"]
+            return
+        if ctype.startswith("application/x-ndjson"):
+            events = [json.loads(line) for line in body.splitlines() if line]
+        else:
+            data = json.loads(body)
+            events = data if isinstance(data, list) else [data]
+        for ev in events:
+            yield ev.get("customer", {}).get("id") or ev.get("product", {}).get("product_id") or ev.get("customer_id") or ev.get("sku")
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":  # the consumer's start-up reachability probe
+            if self._probe_down:
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(405, request=request)
+        if self.failed < self._fail_first:
+            self.failed += 1
+            return httpx.Response(503, request=request)
+        now = time.time()
+        self.posts += 1
+        for key in self._keys(request):
+            self.arrivals.setdefault(key.encode(), now)
+        return httpx.Response(200, request=request)
+
+
+def configure(mode: str, batch_max_size: int, **overrides) -> Settings:
+    """This run's settings: the environment's, with the benchmark's delivery knobs and `overrides` applied."""
+    settings = dataclasses.replace(
+        Settings.from_env(),
+        analytics_mode=mode,
+        batch_max_size=batch_max_size,
+        batch_adaptive=False,
+        flush_interval_secs=0.2,
+        snapshot_path="",
+        state_spill_path="",
+        commit_interval_secs=1.0,
+    )
+    return dataclasses.replace(settings, **overrides)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_once(mode: str, messages: list, batch_max_size: int = 500, sink_failures: int = 0, dlq_down: bool = False, redis_client=None,
+                   sink_probe_down: bool = False, readiness=None, **overrides) -> dict:
+    settings = configure(mode, batch_max_size, **overrides)
+    fetched_at: dict[bytes, float] = {}
+    consumer = FakeKafkaConsumer(messages, fetched_at)
+    producer = FakeKafkaProducer(down=dlq_down)
+    sink = Sink(fail_first=sink_failures, probe_down=sink_probe_down)
+    http_client = consumer_main.build_http_client(transport=httpx.MockTransport(sink), settings=settings)
+    if redis_client is None:
+        redis_client = fakeredis.FakeRedis(decode_responses=True)
+
+    start = time.perf_counter()
+    task = asyncio.create_task(consumer_main.consume(consumer, producer, redis_client, http_client, settings=settings, readiness=readiness))
+    drained = asyncio.create_task(consumer.drained.wait())
+    await asyncio.wait({task, drained}, return_when=asyncio.FIRST_COMPLETED)
+    if task.done():
+        drained.cancel()
+        task.result()  # surface the error
+    task.cancel()  # the consumer's shutdown path flushes and drains what is pending
+    await asyncio.gather(task, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    latencies = [sink.arrivals[k] - fetched_at[k] for k in sink.arrivals if k in fetched_at]
+    return {
+        "mode": mode,
+        "messages": len(messages),
+        "delivered": len(sink.arrivals),
+        "posts": sink.posts,
+        "dlq": producer.sent,
+        "fully_committed": consumer.fully_committed(),
+        "seconds": elapsed,
+        "msgs_per_sec": len(messages) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_mode(mode: str, messages: list, batch_max_size: int = 500, memory: bool = True, **overrides) -> dict:
+    result = asyncio.run(run_once(mode, messages, batch_max_size, **overrides))
+    if memory:
+        tracemalloc.start()
+        asyncio.run(run_once(mode, messages, batch_max_size, **overrides))
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated ANALYTICS_MODE values")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="share of messages that are exact duplicates")
+    parser.add_argument("--customer-ratio", type=float, default=0.5)
+    parser.add_argument("--batch-max-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--window-secs", type=float, default=0.0, help="pre-aggregate into windows of this size (one row per key)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run for peak memory")
+    parser.add_argument("--min-rate", type=float, default=0.0, help="fail if any mode is slower (msgs/sec)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args()
+
+    for name in ("analytics_consumer", "httpx"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    messages = synthetic_messages(args.messages, args.dup_ratio, args.customer_ratio, args.seed)
+    unique = len({(t, k, v) for t, k, v in messages})
+
+    if not args.json:
+        print(f"{'mode':>10} {'msgs/sec':>10} {'p50_ms':>8} {'p99_ms':>8} {'peak_mb':>8} {'delivered':>10} {'posts':>7}")
+    failed = False
+    for mode in args.modes.split(","):
+        res = run_mode(mode, messages, args.batch_max_size, memory=not args.no_memory, window_secs=args.window_secs)
+        res["expected"] = unique
+        if args.json:
+            print(json.dumps(res))
+        else:
+            peak = f"{res['peak_mb']:.1f}" if "peak_mb" in res else "-"
+            print(f"{mode:>10} {res['msgs_per_sec']:>10.0f} {res['p50_ms']:>8.1f} {res['p99_ms']:>8.1f} {peak:>8} {res['delivered']:>10} {res['posts']:>7}")
+        if res["delivered"] != unique:
+            print(f"{mode}: delivered {res['delivered']} of {unique} unique messages", file=sys.stderr)
+            failed = True
+        if res["msgs_per_sec"] < args.min_rate:
+            print(f"{mode}: {res['msgs_per_sec']:.0f} msgs/sec is below --min-rate {args.min_rate:.0f}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
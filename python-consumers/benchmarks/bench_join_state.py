@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-event cost of the consumer's join summaries vs catalog size.
+
+Compares the incremental JoinState aggregates against the previous full scan of
+all products on every customer event. The incremental cost should stay flat as
+the catalog grows; the scan grows linearly.
+
+Usage:
+  python python-consumers/benchmarks/bench_join_state.py --sizes 1000,100000,1000000 --events 2000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from analytics_consumer.state import JoinState  # noqa: E402
+
+
+def per_event_us(fn, events: int) -> float:
+    start = time.perf_counter()
+    for i in range(events):
+        fn(i)
+    return (time.perf_counter() - start) / events * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma-separated product counts")
+    parser.add_argument("--events", type=int, default=2000, help="events timed per size")
+    parser.add_argument("--scan-events", type=int, default=20, help="events timed for the full-scan baseline")
+    args = parser.parse_args()
+
+    print(f"{'products':>10} {'incremental_us/event':>22} {'full_scan_us/event':>20}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        state = JoinState([20])
+        catalog = {}  # full payloads, as the consumer used to keep them
+        for i in range(size):
+            payload = {"product_id": f"p{i}", "sku": f"SKU-{i}", "qty": random.randint(0, 100)}
+            state.upsert_product(f"p{i}", payload)
+            catalog[f"p{i}"] = payload
+
+        def incremental(i):
+            if i % 2:
+                state.upsert_product(f"p{i % size}", {"product_id": f"p{i % size}", "qty": random.randint(0, 100)})
+            else:
+                state.upsert_customer(f"c{i}", {"id": f"c{i}"})
+                state.inventory_summary()
+
+        def full_scan(i):
+            sum(1 for p in catalog.values() if isinstance(p.get("qty"), int) and p.get("qty", 0) < 20)
+
+        inc = per_event_us(incremental, args.events)
+        scan = per_event_us(full_scan, args.scan_events)
+        print(f"{size:>10} {inc:>22.2f} {scan:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 """
-Simple load generator to validate ~10,000 records/hour.
+Load generator for the integration pipeline.
 
 Approach:
-- Continuously POST new customers to Mock APIs (/customers). Producers will fetch more
-  customers on the next poll cycle, increasing messages flowing through Kafka and into
-  the Python consumer.
-- Tune rate (customers per second) and duration.
+- Open-loop, constant-rate scheduling: request n is due at start + n/rate whether or
+  not earlier requests have finished, and its latency is measured from that due time.
+  A slow target therefore shows up as queueing latency instead of silently lowering
+  the offered rate (no coordinated omission).
+- Up to --concurrency requests are in flight at once.
+- Mixes customers and products (--product-ratio) and re-sends exact duplicates
+  (--dup-ratio) to exercise consumer idempotency.
+- Targets:
+  - api    POST to Mock APIs (/customers, /products); producers pick records up on their
+           next poll cycle. With --bulk N records are posted N at a time to /customers/bulk
+           and /products/bulk (a partial batch goes out after --bulk-linger-ms); each
+           record's latency then runs until its batch is acknowledged.
+  - kafka  publish straight to customer_data / inventory_data (keyed by id), bypassing the
+           APIs and producers to stress the consumer.
+- Prints a throughput/latency summary at the end.
 - Observe Prometheus/Grafana metrics:
   - consumer_messages_total
   - analytics_post_success_total / _fail_total
@@ -14,12 +25,13 @@ Approach:
 
 Usage:
   python tools/load_gen.py --base-url http://localhost:8000 --rate 5 --duration 120
-
-This will POST ~600 customers in 2 minutes. Combine with producer poll interval to estimate
-throughput. To reach ~10k/hour, run multiple instances or increase rate.
+  python tools/load_gen.py --target kafka --bootstrap localhost:29092 --rate 2000 --duration 60 \\
+      --concurrency 200 --product-ratio 0.5 --dup-ratio 0.05
+  python tools/load_gen.py --rate 5000 --duration 60 --bulk 500
 """
 import argparse
 import asyncio
+import json
 import random
 import string
 import time
@@ -33,35 +45,199 @@ def rand_customer():
         "id": f"c-{int(time.time())}-{cid}",
         "email": f"{cid}@example.com",
         "name": f"User {cid}",
-        "status": "active",
+        "status": random.choice(["active", "active", "active", "inactive"]),
+    }
+
+
+def rand_product():
+    pid = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+    return {
+        "product_id": f"p-{int(time.time())}-{pid}",
+        "sku": f"SKU-{pid.upper()}",
+        "qty": random.randint(0, 200),
     }
 
 
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.ok = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.late = 0  # requests that had to wait for a free concurrency slot
+
+    def summary(self, elapsed: float) -> str:
+        lat = sorted(self.latencies)
+
+        def pct(q):
+            return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+
+        total = self.ok + self.errors
+        return (
+            f"Done. sent={total} ok={self.ok} errors={self.errors} duplicates={self.duplicates} "
+            f"late_starts={self.late} elapsed={elapsed:.1f}s throughput={self.ok / elapsed if elapsed else 0:.1f}/s "
+            f"(~{self.ok * 3600 / elapsed if elapsed else 0:.0f}/hour)\n"
+            f"Latency from scheduled time (ms): p50={pct(0.50):.1f} p90={pct(0.90):.1f} "
+            f"p99={pct(0.99):.1f} max={(lat[-1] * 1000 if lat else 0):.1f}"
+        )
+
+
+class ApiTarget:
+    def __init__(self, base_url: str, concurrency: int, bulk: int = 0, linger: float = 0.05):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=5.0, limits=limits)
+        self.bulk = bulk
+        self.linger = linger
+        self._pending = {"customer": [], "product": []}  # (record, future) waiting for a bulk post
+        self._timers = {}
+        self._posts = set()
+
+    async def start(self):
+        pass
+
+    async def send(self, kind: str, record: dict):
+        if self.bulk <= 1:
+            r = await self.client.post("/customers" if kind == "customer" else "/products", json=record)
+            if not 200 <= r.status_code < 300:
+                raise RuntimeError(f"POST /{kind}s {r.status_code}")
+            return
+        done = asyncio.get_running_loop().create_future()
+        pending = self._pending[kind]
+        pending.append((record, done))
+        if len(pending) >= self.bulk:
+            self._flush(kind)
+        elif kind not in self._timers:
+            self._timers[kind] = asyncio.get_running_loop().call_later(self.linger, self._flush, kind)
+        await done
+
+    def _flush(self, kind: str):
+        timer = self._timers.pop(kind, None)
+        if timer is not None:
+            timer.cancel()
+        items, self._pending[kind] = self._pending[kind], []
+        if items:
+            task = asyncio.create_task(self._post_bulk(kind, items))
+            self._posts.add(task)
+            task.add_done_callback(self._posts.discard)
+
+    async def _post_bulk(self, kind: str, items: list):
+        path = "/customers/bulk" if kind == "customer" else "/products/bulk"
+        try:
+            r = await self.client.post(path, json=[record for record, _ in items])
+            error = None if 200 <= r.status_code < 300 else RuntimeError(f"POST {path} {r.status_code}")
+        except Exception as e:
+            error = e
+        for _, done in items:
+            if error is None:
+                done.set_result(None)
+            else:
+                done.set_exception(error)
+
+    async def close(self):
+        for kind in list(self._pending):
+            self._flush(kind)
+        if self._posts:
+            await asyncio.gather(*self._posts, return_exceptions=True)
+        await self.client.aclose()
+
+
+class KafkaTarget:
+    def __init__(self, bootstrap: str, customer_topic: str, inventory_topic: str):
+        from aiokafka import AIOKafkaProducer  # only needed for this target
+
+        self.producer = AIOKafkaProducer(bootstrap_servers=bootstrap, linger_ms=5)
+        self.topics = {"customer": customer_topic, "product": inventory_topic}
+
+    async def start(self):
+        await self.producer.start()
+
+    async def send(self, kind: str, record: dict):
+        key = record["id"] if kind == "customer" else record["product_id"]
+        await self.producer.send_and_wait(self.topics[kind], json.dumps(record).encode("utf-8"), key=key.encode("utf-8"))
+
+    async def close(self):
+        await self.producer.stop()
+
+
+async def run(target, rate: float, duration: float, concurrency: int, product_ratio: float, dup_ratio: float) -> Stats:
+    stats = Stats()
+    slots = asyncio.Semaphore(concurrency)
+    recent = []  # last records sent, to draw exact duplicates from
+    tasks = set()
+
+    async def fire(due: float, kind: str, record: dict):
+        if slots.locked():
+            stats.late += 1
+        async with slots:
+            try:
+                await target.send(kind, record)
+                stats.ok += 1
+            except Exception as e:
+                stats.errors += 1
+                if stats.errors <= 10:
+                    print(f"ERROR: {e}")
+            finally:
+                stats.latencies.append(time.perf_counter() - due)
+
+    interval = 1.0 / max(rate, 0.1)
+    start = time.perf_counter()
+    n = 0
+    while True:
+        due = start + n * interval
+        if due - start >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if recent and random.random() < dup_ratio:
+            kind, record = random.choice(recent)
+            stats.duplicates += 1
+        else:
+            kind = "product" if random.random() < product_ratio else "customer"
+            record = rand_product() if kind == "product" else rand_customer()
+            recent.append((kind, record))
+            if len(recent) > 1000:
+                recent.pop(0)
+        task = asyncio.create_task(fire(due, kind, record))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        n += 1
+    if tasks:
+        await asyncio.gather(*tasks)
+    return stats
+
+
 async def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=["api", "kafka"], default="api")
     parser.add_argument("--base-url", default="http://localhost:8000")
-    parser.add_argument("--rate", type=float, default=5.0, help="customers per second")
+    parser.add_argument("--bootstrap", default="localhost:29092", help="Kafka bootstrap servers (--target kafka)")
+    parser.add_argument("--customer-topic", default="customer_data")
+    parser.add_argument("--inventory-topic", default="inventory_data")
+    parser.add_argument("--rate", type=float, default=5.0, help="records per second (open loop)")
     parser.add_argument("--duration", type=int, default=120, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=50, help="max requests in flight")
+    parser.add_argument("--product-ratio", type=float, default=0.0, help="share of records that are products")
+    parser.add_argument("--dup-ratio", type=float, default=0.0, help="share of records re-sent as exact duplicates")
+    parser.add_argument("--bulk", type=int, default=0, help="records per POST to the bulk endpoints (--target api; 0 = one per request)")
+    parser.add_argument("--bulk-linger-ms", type=float, default=50.0, help="max wait to fill a bulk batch")
     args = parser.parse_args()
+    if args.bulk > 1 and args.target != "api":
+        parser.error("--bulk applies to --target api only")
 
-    interval = 1.0 / max(args.rate, 0.1)
-    end = time.time() + args.duration
-    total = 0
-
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        while time.time() < end:
-            payload = rand_customer()
-            try:
-                r = await client.post(f"{args.base_url}/customers", json=payload)
-                if r.status_code >= 200 and r.status_code < 300:
-                    total += 1
-                else:
-                    print(f"WARN: POST /customers {r.status_code}")
-            except Exception as e:
-                print(f"ERROR: {e}")
-            await asyncio.sleep(interval)
-
-    print(f"Done. Posted {total} customers in {args.duration}s (~{total*3600/args.duration:.0f}/hour potential).")
+    if args.target == "kafka":
+        target = KafkaTarget(args.bootstrap, args.customer_topic, args.inventory_topic)
+    else:
+        target = ApiTarget(args.base_url, args.concurrency, bulk=args.bulk, linger=args.bulk_linger_ms / 1000)
+    await target.start()
+    # --concurrency bounds requests in flight; in bulk mode each request carries up to --bulk records
+    in_flight = max(1, args.concurrency) * max(1, args.bulk)
+    start = time.perf_counter()
+    try:
+        stats = await run(target, args.rate, args.duration, in_flight, args.product_ratio, args.dup_ratio)
+    finally:
+        await target.close()
+    print(stats.summary(time.perf_counter() - start))
 
 
 if __name__ == "__main__":